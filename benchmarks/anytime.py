@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+"""
+Measure the quality of engines against the time they are given (quality-per-second instead of just final quality).
+
+Engines that can stop early (NativeMLN, DiscreteWeightedSolver, NonCollectiveProbLog) are run once per time budget,
+with the budget as their time limit (on reasoning, grounding is a fixed cost).
+Engines that cannot be stopped early (PySATMLN, PSL) are only run once, and give a single point on the curve.
+
+Every run records the wall time of the full solve (after the JVM has been started),
+a common objective (the weighted number of unsatisfied MLN ground rules when the results are rounded),
+and all the model's evaluation metrics.
+Engines that report progress also give a within-run trace of their loss against time.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+import benchmarks.models
+import srli.engine
+import srli.engine.mln.native
+import srli.engine.psl.engine
+import srli.evaluation
+import srli.progress
+import srli.rule
+
+DEFAULT_MODEL = 'Smokers'
+DEFAULT_SIZE = 50
+DEFAULT_BUDGETS = [0.1, 0.5, 1.0, 5.0]
+DEFAULT_ENGINES = [
+    srli.engine.Engine.MLN_Native,
+    srli.engine.Engine.Logic_Weighted_Discrete,
+    srli.engine.Engine.MLN_PySAT,
+    srli.engine.Engine.ProbLog_NonCollective,
+    srli.engine.Engine.PSL,
+]
+
+# Extra time (on top of a budget) given to a run for starting up, grounding, and evaluating before it is killed.
+DEFAULT_TIMEOUT_SLACK_SECS = 300
+# Engines that cannot be stopped early get this long.
+DEFAULT_TIMEOUT_SECS = 600
+
+# How to pass a time limit to each engine that supports one:
+# {engine: (where ('init' or 'solve'), option name), ...}
+TIME_LIMIT_OPTIONS = {
+    srli.engine.Engine.MLN_Native: ('solve', 'max_time'),
+    srli.engine.Engine.Logic_Weighted_Discrete: ('init', 'max_time'),
+    srli.engine.Engine.ProbLog_NonCollective: ('init', 'max_time'),
+}
+
+# Engines with very cheap steps only report progress every so often.
+PROGRESS_INTERVALS = {
+    srli.engine.Engine.MLN_Native: 10,
+}
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+
+def run_anytime(model_name, size, density, seed, engine_name, budget):
+    """
+    Run a single engine on a model (in the current process) with a time budget (None for no limit).
+    Returns: a result record ({key: value, ...}).
+    """
+
+    engine_type = srli.engine.Engine(engine_name)
+    model = benchmarks.models.MODELS[model_name](size, density = density, seed = seed)
+    relations, rules, evaluations = model.build()
+
+    progress = srli.progress.ListProgressSink(interval = PROGRESS_INTERVALS.get(engine_type, srli.progress.DEFAULT_INTERVAL))
+
+    init_options = {}
+    solve_options = {}
+    if ((budget is not None) and (engine_type in TIME_LIMIT_OPTIONS)):
+        where, name = TIME_LIMIT_OPTIONS[engine_type]
+        if (where == 'init'):
+            init_options[name] = budget
+        else:
+            solve_options[name] = budget
+
+    # Ground (for the objective) before timing, which also gets the JVM started.
+    ground_program = _ground(relations, rules)
+
+    engine = srli.engine.load(engine_type)(relations, rules, evaluations = evaluations, progress = progress, **init_options)
+
+    try:
+        start_time = time.perf_counter()
+        results = engine.solve(**solve_options)
+        solve_time = time.perf_counter() - start_time
+    finally:
+        engine.close()
+
+    context = srli.evaluation.EvaluationContext(results)
+
+    # {'metric(relation)': value, ...}
+    metrics = {}
+    for evaluation in evaluations:
+        key = "%s(%s)" % (evaluation.metric_name(), evaluation.relation().name())
+
+        try:
+            metrics[key] = float(evaluation.evaluate(results, context = context))
+        except ValueError:
+            metrics[key] = None
+
+    trace = []
+    for event in progress.events:
+        if ('loss' in event):
+            trace.append({key : event.get(key) for key in ['event', 'elapsed', 'loss', 'best_loss']})
+
+    return {
+        'solve_time': solve_time,
+        'objective': compute_objective(relations, rules, results, ground_program),
+        'metrics': metrics,
+        'trace': trace,
+    }
+
+def _ground(relations, rules):
+    # Ground the same way BaseMLN does.
+    grounding_rules = [srli.rule.Rule(rule.text()) for rule in rules]
+    return srli.engine.psl.engine.PSL(relations, grounding_rules).ground(ignore_priors = True, ignore_sum_constraint = True)
+
+def compute_objective(relations, rules, results, ground_program = None):
+    """
+    A common objective for all engines:
+    the total weight of unsatisfied (MLN) ground rules when all the results are rounded to 0/1.
+    """
+
+    if (ground_program is None):
+        ground_program = _ground(relations, rules)
+
+    ground_rules, atoms = srli.engine.mln.native.NativeMLN(relations, rules)._process_ground_program(ground_program)
+
+    # {(predicate, (arg, ...)): value, ...}
+    values = {}
+    for (relation, rows) in results.items():
+        for row in rows:
+            values[(relation.name().upper(), tuple(map(str, row[0:-1])))] = int(float(row[-1]) >= 0.5)
+
+    atom_values = {atom_id : values.get((atom['predicate'], tuple(atom['arguments'])), 0) for (atom_id, atom) in atoms.items()}
+
+    return sum([ground_rule.loss(atom_values) for ground_rule in ground_rules])
+
+def _run_anytime_safe(*args):
+    try:
+        record = run_anytime(*args)
+        record['status'] = STATUS_OK
+    except Exception as ex:
+        record = {
+            'status': STATUS_ERROR,
+            'error': "%s: %s" % (type(ex).__name__, ex),
+        }
+        traceback.print_exc()
+
+    return record
+
+def run_all(model_name, size, density, seed, engine_types, budgets,
+        timeout = DEFAULT_TIMEOUT_SECS, timeout_slack = DEFAULT_TIMEOUT_SLACK_SECS):
+    """
+    Run every engine under every budget (each in its own process).
+    Returns: [record, ...]
+    """
+
+    context = multiprocessing.get_context('spawn')
+    records = []
+
+    for engine_type in engine_types:
+        if (engine_type in TIME_LIMIT_OPTIONS):
+            engine_budgets = list(sorted(budgets))
+        else:
+            engine_budgets = [None]
+
+        for budget in engine_budgets:
+            record = {
+                'model': model_name,
+                'size': size,
+                'density': density,
+                'seed': seed,
+                'engine': engine_type.name,
+                'budget': budget,
+            }
+
+            run_timeout = timeout
+            if (budget is not None):
+                run_timeout = budget + timeout_slack
+
+            print("Running -- Engine: %s, Budget: %s." % (engine_type.name, budget))
+
+            with context.Pool(1) as pool:
+                async_result = pool.apply_async(_run_anytime_safe, (model_name, size, density, seed, engine_type.name, budget))
+
+                try:
+                    record.update(async_result.get(run_timeout))
+                except multiprocessing.TimeoutError:
+                    record['status'] = STATUS_TIMEOUT
+
+            records.append(record)
+
+    return records
+
+def write_curves(records, out_dir):
+    """
+    Write out:
+        anytime.json: all the records,
+        anytime.csv: a quality/objective vs time point for each run,
+        anytime_traces.csv: the loss vs time traces from within each run.
+    """
+
+    os.makedirs(out_dir, exist_ok = True)
+
+    with open(os.path.join(out_dir, 'anytime.json'), 'w') as file:
+        json.dump(records, file, indent = 4)
+
+    metric_names = []
+    for record in records:
+        for metric_name in record.get('metrics', {}):
+            if (metric_name not in metric_names):
+                metric_names.append(metric_name)
+
+    with open(os.path.join(out_dir, 'anytime.csv'), 'w', newline = '') as file:
+        writer = csv.writer(file)
+        writer.writerow(['engine', 'budget', 'status', 'solve_time', 'objective'] + metric_names)
+
+        for record in records:
+            metrics = record.get('metrics', {})
+            writer.writerow([record['engine'], record['budget'], record['status'], record.get('solve_time'), record.get('objective')]
+                    + [metrics.get(metric_name) for metric_name in metric_names])
+
+    with open(os.path.join(out_dir, 'anytime_traces.csv'), 'w', newline = '') as file:
+        writer = csv.writer(file)
+        writer.writerow(['engine', 'budget', 'event', 'elapsed', 'loss', 'best_loss'])
+
+        for record in records:
+            for point in record.get('trace', []):
+                writer.writerow([record['engine'], record['budget'], point['event'], point['elapsed'], point['loss'], point['best_loss']])
+
+def main(arguments):
+    engine_types = DEFAULT_ENGINES
+    if (arguments.engines is not None):
+        engine_types = [srli.engine.Engine(name) for name in arguments.engines]
+
+    budgets = arguments.budgets
+    if (budgets is None):
+        budgets = DEFAULT_BUDGETS
+
+    records = run_all(arguments.model, arguments.size, arguments.density, arguments.seed, engine_types, budgets,
+            timeout = arguments.timeout)
+
+    write_curves(records, arguments.out_dir)
+
+    for record in records:
+        if (record['status'] != STATUS_OK):
+            print("%s (budget: %s) -- %s %s" % (record['engine'], record['budget'], record['status'], record.get('error', '')))
+            continue
+
+        metrics = ', '.join(["%s: %s" % (key, 'None' if (value is None) else "%0.3f" % (value)) for (key, value) in record['metrics'].items()])
+        print("%s (budget: %s) -- Time: %0.3fs, Objective: %f, %s" % (record['engine'], record['budget'], record['solve_time'], record['objective'], metrics))
+
+def _load_args():
+    parser = argparse.ArgumentParser(description = 'Measure the quality of SRLi engines against the time they are given.')
+
+    parser.add_argument('--model', dest = 'model',
+        action = 'store', type = str, default = DEFAULT_MODEL,
+        choices = list(benchmarks.models.MODELS.keys()),
+        help = 'the model to run (default: %(default)s)')
+
+    parser.add_argument('--size', dest = 'size',
+        action = 'store', type = int, default = DEFAULT_SIZE,
+        help = 'the model size (default: %(default)s)')
+
+    parser.add_argument('--density', dest = 'density',
+        action = 'store', type = float, default = benchmarks.models.DEFAULT_DENSITY,
+        help = 'the density of links between entities (default: %(default)s)')
+
+    parser.add_argument('--seed', dest = 'seed',
+        action = 'store', type = int, default = benchmarks.models.DEFAULT_SEED,
+        help = 'the seed for generating data (default: %(default)s)')
+
+    parser.add_argument('--engine', dest = 'engines',
+        action = 'append', type = str, default = None,
+        choices = [engine_type.name for engine_type in srli.engine.Engine],
+        help = 'an engine to run (may be repeated) (default: %s)' % ([engine_type.name for engine_type in DEFAULT_ENGINES]))
+
+    parser.add_argument('--budget', dest = 'budgets',
+        action = 'append', type = float, default = None,
+        help = 'a time budget in seconds (may be repeated) (default: %s)' % (DEFAULT_BUDGETS))
+
+    parser.add_argument('--timeout', dest = 'timeout',
+        action = 'store', type = float, default = DEFAULT_TIMEOUT_SECS,
+        help = 'the maximum number of seconds for a run of an engine that cannot be stopped early (default: %(default)s)')
+
+    parser.add_argument('--out-dir', dest = 'out_dir',
+        action = 'store', type = str, default = '.',
+        help = 'where to write the curves (default: %(default)s)')
+
+    return parser.parse_args()
+
+if (__name__ == '__main__'):
+    main(_load_args())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmarks for the hot paths of SRLi (loss computations, processing ground programs, data loading, parsing, etc).
+Each benchmark builds generated inputs (of a configurable size) once, and then times only the hot path.
+Results can be saved as a baseline, and later runs can be checked against that baseline for regressions.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import benchmarks.models
+import srli.engine.logic.dws
+import srli.engine.mln.base
+import srli.engine.mln.native
+import srli.engine.problog.engine
+import srli.engine.psl.engine
+import srli.parser
+import srli.relation
+import srli.rule
+import srli.util
+
+DEFAULT_WARMUP = 2
+DEFAULT_REPETITIONS = 10
+DEFAULT_SCALE = 1.0
+
+# A benchmark has regressed if its median time is more than (1 + threshold) x the baseline median.
+DEFAULT_THRESHOLD = 0.20
+# Medians below this are too noisy to compare.
+MIN_COMPARE_TIME_SECS = 0.0005
+
+def measure(function, warmup = DEFAULT_WARMUP, repetitions = DEFAULT_REPETITIONS):
+    """
+    Time a function (with no arguments) after some untimed warmup calls.
+    Returns: {'min': seconds, 'median': seconds, 'mean': seconds, 'stdev': seconds, 'max': seconds, 'repetitions': count}
+    """
+
+    if (repetitions < 1):
+        raise ValueError("Need at least one repetition, found: %d." % (repetitions))
+
+    for i in range(warmup):
+        function()
+
+    times = []
+    for i in range(repetitions):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if (len(times) > 1) else 0.0,
+        'max': max(times),
+        'repetitions': repetitions,
+    }
+
+# Setup functions take in a size, and return the function to time.
+
+def _setup_ground_rule_loss(size):
+    rng = random.Random(benchmarks.models.DEFAULT_SEED)
+    atom_values = {atom : rng.randint(0, 1) for atom in range(size)}
+
+    ground_rules = []
+    for i in range(size):
+        atoms = rng.sample(range(size), 3)
+
+        if (rng.random() < 0.8):
+            coefficients = [rng.choice([-1, 1]) for atom in atoms]
+            ground_rules.append(srli.engine.mln.base.GroundRule(0, 1.0, atoms, coefficients, 0, '|'))
+        else:
+            ground_rules.append(srli.engine.mln.base.GroundRule(0, 1.0, atoms[0:2], [1, -1], 0, '='))
+
+    def run():
+        for ground_rule in ground_rules:
+            ground_rule.loss(atom_values)
+
+    return run
+
+def _build_model(size):
+    return benchmarks.models.Acquaintances(size).build()
+
+def _setup_mln_process_ground_program(size):
+    relations, rules, _ = _build_model(size)
+
+    # Ground the same way BaseMLN does.
+    grounding_rules = [srli.rule.Rule(rule.text()) for rule in rules]
+    ground_program = srli.engine.psl.engine.PSL(relations, grounding_rules).ground(ignore_priors = True, ignore_sum_constraint = True)
+
+    engine = srli.engine.mln.native.NativeMLN(relations, rules)
+
+    return lambda: engine._process_ground_program(ground_program)
+
+def _setup_dws_iteration(size):
+    relations, rules, _ = _build_model(size)
+
+    engine = srli.engine.logic.dws.DiscreteWeightedSolver(relations, rules)
+    atoms, ground_rules, atom_uses, sum_constraints = engine._prep()
+
+    return lambda: engine._iteration(atoms, ground_rules, atom_uses, sum_constraints)
+
+def _setup_problog_prep(size):
+    relations, rules, _ = _build_model(size)
+    engine = srli.engine.problog.engine.ProbLog(relations, rules)
+
+    return engine._prep
+
+def _setup_get_eval_values(size):
+    rng = random.Random(benchmarks.models.DEFAULT_SEED)
+
+    relation = srli.relation.Relation('Values', arity = 2)
+    relation.add_truth_data([[str(i), str(i % 7), float(rng.randint(0, 1))] for i in range(size)])
+
+    results = [row[0:-1] + [rng.random()] for row in relation.get_truth_data()]
+    rng.shuffle(results)
+
+    return lambda: srli.util.get_eval_values(relation, results, discretize = True)
+
+def _setup_add_data_file(size):
+    rng = random.Random(benchmarks.models.DEFAULT_SEED)
+
+    temp_dir = tempfile.mkdtemp(prefix = 'srli.micro.')
+    atexit.register(shutil.rmtree, temp_dir, ignore_errors = True)
+    path = os.path.join(temp_dir, 'data.txt')
+
+    with open(path, 'w') as file:
+        for i in range(size):
+            file.write("%d\t%d\t%f\n" % (i, rng.randint(0, size), rng.random()))
+
+    def run():
+        relation = srli.relation.Relation('Data', arity = 2)
+        relation.add_data_file(path)
+
+    return run
+
+def _setup_parse(size):
+    rule_texts = []
+    for model_class in benchmarks.models.MODELS.values():
+        _, rules, _ = model_class(10).build()
+        rule_texts += [rule.text() for rule in rules]
+
+    rule_texts = [rule_texts[i % len(rule_texts)] for i in range(size)]
+
+    def run():
+        for rule_text in rule_texts:
+            srli.parser.parse(rule_text)
+
+    return run
+
+# {name: (setup function, default size), ...}
+BENCHMARKS = {
+    'GroundRule.loss': (_setup_ground_rule_loss, 100000),
+    'BaseMLN._process_ground_program': (_setup_mln_process_ground_program, 40),
+    'DiscreteWeightedSolver._iteration': (_setup_dws_iteration, 40),
+    'BaseGroundProbLog._prep': (_setup_problog_prep, 40),
+    'srli.util.get_eval_values': (_setup_get_eval_values, 100000),
+    'Relation.add_data_file': (_setup_add_data_file, 100000),
+    'srli.parser.parse': (_setup_parse, 50),
+}
+
+def run_all(names = None, scale = DEFAULT_SCALE, warmup = DEFAULT_WARMUP, repetitions = DEFAULT_REPETITIONS):
+    """
+    Returns: {name: {'size': size, stat: value, ...}, ...}
+    """
+
+    if (names is None):
+        names = list(BENCHMARKS.keys())
+
+    results = {}
+    for name in names:
+        setup, default_size = BENCHMARKS[name]
+        size = max(1, int(default_size * scale))
+
+        function = setup(size)
+        results[name] = measure(function, warmup = warmup, repetitions = repetitions)
+        results[name]['size'] = size
+
+        print("Microbenchmark -- %s (size: %d), Median: %0.6fs, Min: %0.6fs, Stdev: %0.6fs." % (
+                name, size, results[name]['median'], results[name]['min'], results[name]['stdev']))
+
+    return results
+
+def compare(results, baseline, threshold = DEFAULT_THRESHOLD):
+    """
+    Compare the median times against a baseline (only for benchmarks run at the same size).
+    Returns: [(name, baseline median, median), ...] for each regression.
+    """
+
+    regressions = []
+
+    for (name, stats) in results.items():
+        if ((name not in baseline) or (baseline[name]['size'] != stats['size'])):
+            continue
+
+        old_median = baseline[name]['median']
+        if (old_median < MIN_COMPARE_TIME_SECS):
+            continue
+
+        if (stats['median'] > (1.0 + threshold) * old_median):
+            regressions.append((name, old_median, stats['median']))
+
+    return regressions
+
+def main(names = None, scale = DEFAULT_SCALE, warmup = DEFAULT_WARMUP, repetitions = DEFAULT_REPETITIONS,
+        out_path = None, baseline_path = None, threshold = DEFAULT_THRESHOLD):
+    """
+    Run the microbenchmarks, and optionally save them and/or compare them against a baseline.
+    Returns True if no regressions were found.
+    """
+
+    results = run_all(names, scale = scale, warmup = warmup, repetitions = repetitions)
+
+    if (out_path is not None):
+        with open(out_path, 'w') as file:
+            json.dump(results, file, indent = 4)
+
+    if (baseline_path is None):
+        return True
+
+    with open(baseline_path, 'r') as file:
+        baseline = json.load(file)
+
+    regressions = compare(results, baseline, threshold = threshold)
+    for (name, old_median, median) in regressions:
+        print("Regression -- %s, Median went from %0.6fs to %0.6fs (%0.1f%% slower)." % (name, old_median, median, 100.0 * (median / old_median - 1.0)))
+
+    print("Found %d regression(s) against the baseline (%s)." % (len(regressions), baseline_path))
+
+    return len(regressions) == 0
+
+def _load_args():
+    parser = argparse.ArgumentParser(description = 'Time the hot paths of SRLi.')
+
+    parser.add_argument('--benchmark', dest = 'names',
+        action = 'append', type = str, default = None,
+        choices = list(BENCHMARKS.keys()),
+        help = 'a benchmark to run (may be repeated) (default: all benchmarks)')
+
+    parser.add_argument('--scale', dest = 'scale',
+        action = 'store', type = float, default = DEFAULT_SCALE,
+        help = 'multiply the default size of every benchmark by this (default: %(default)s)')
+
+    parser.add_argument('--warmup', dest = 'warmup',
+        action = 'store', type = int, default = DEFAULT_WARMUP,
+        help = 'the number of untimed runs before timing (default: %(default)s)')
+
+    parser.add_argument('--repetitions', dest = 'repetitions',
+        action = 'store', type = int, default = DEFAULT_REPETITIONS,
+        help = 'the number of timed runs (default: %(default)s)')
+
+    parser.add_argument('--out', dest = 'out_path',
+        action = 'store', type = str, default = None,
+        help = 'where to save the results (as JSON), e.g. to use as a baseline (default: %(default)s)')
+
+    parser.add_argument('--baseline', dest = 'baseline_path',
+        action = 'store', type = str, default = None,
+        help = 'previously saved results to check for regressions against (default: %(default)s)')
+
+    parser.add_argument('--threshold', dest = 'threshold',
+        action = 'store', type = float, default = DEFAULT_THRESHOLD,
+        help = 'the allowed relative increase in median time over the baseline (default: %(default)s)')
+
+    return parser.parse_args()
+
+if (__name__ == '__main__'):
+    arguments = _load_args()
+    success = main(arguments.names, scale = arguments.scale, warmup = arguments.warmup, repetitions = arguments.repetitions,
+            out_path = arguments.out_path, baseline_path = arguments.baseline_path, threshold = arguments.threshold)
+
+    sys.exit(0 if success else 1)
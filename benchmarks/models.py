@@ -0,0 +1,258 @@
+"""
+Synthetic models that can be scaled to any number of entities (with a controllable density of links between them).
+All data is generated in memory from a seed, so the same (size, density, seed) always gives the same model.
+"""
+
+import abc
+import random
+
+import srli.evaluation
+import srli.relation
+import srli.rule
+
+DEFAULT_DENSITY = 0.1
+DEFAULT_SEED = 4
+
+# The fraction of target atoms that are instead observed.
+OBSERVED_FRACTION = 0.5
+
+class BenchmarkModel(abc.ABC):
+    """
+    A model with |size| entities (people, papers, etc) and a link |density| in [0, 1].
+    """
+
+    def __init__(self, size, density = DEFAULT_DENSITY, seed = DEFAULT_SEED):
+        if (size < 2):
+            raise ValueError("Benchmark size must be at least 2, found: %d." % (size))
+
+        if ((density < 0.0) or (density > 1.0)):
+            raise ValueError("Benchmark density must be in [0, 1], found: %f." % (density))
+
+        self._size = size
+        self._density = density
+        self._seed = seed
+
+    @abc.abstractmethod
+    def build(self):
+        """
+        Generate all the data.
+        Returns: (relations, rules, evaluations)
+        """
+
+        pass
+
+    def _split_targets(self, rng, relation, rows):
+        """
+        Each (fully-valued) row is either observed or a target (with the row as truth).
+        """
+
+        for row in rows:
+            if (rng.random() < OBSERVED_FRACTION):
+                relation.add_observed_data([row])
+            else:
+                relation.add_unobserved_data([row[0:-1]])
+                relation.add_truth_data([row])
+
+class Smokers(BenchmarkModel):
+    """
+    The classic smokers model.
+    Smoking spreads (once) through friends, and smokers are much more likely to have cancer.
+    """
+
+    SEED_SMOKER_PROBABILITY = 0.3
+    INFLUENCE_PROBABILITY = 0.4
+    SMOKER_CANCER_PROBABILITY = 0.7
+    NON_SMOKER_CANCER_PROBABILITY = 0.05
+
+    def build(self):
+        rng = random.Random(self._seed)
+        people = list(range(self._size))
+
+        friends = srli.relation.Relation('Friends', variable_types = ['Person', 'Person'])
+        smokes = srli.relation.Relation('Smokes', variable_types = ['Person'], negative_prior_weight = 0.01)
+        cancer = srli.relation.Relation('Cancer', variable_types = ['Person'], negative_prior_weight = 0.01)
+
+        # {person: [friend, ...], ...}
+        friendships = {person : [] for person in people}
+        for person in people:
+            for other in people[person + 1:]:
+                if (rng.random() < self._density):
+                    friendships[person].append(other)
+                    friendships[other].append(person)
+
+        friends.add_observed_data([[str(person), str(other), 1.0] for person in people for other in friendships[person]])
+
+        seed_smokers = {person for person in people if (rng.random() < self.SEED_SMOKER_PROBABILITY)}
+        smokers = set(seed_smokers)
+        for person in people:
+            if (person in seed_smokers):
+                continue
+
+            for friend in friendships[person]:
+                if ((friend in seed_smokers) and (rng.random() < self.INFLUENCE_PROBABILITY)):
+                    smokers.add(person)
+                    break
+
+        self._split_targets(rng, smokes, [[str(person), float(person in smokers)] for person in people])
+
+        for person in people:
+            probability = self.SMOKER_CANCER_PROBABILITY if (person in smokers) else self.NON_SMOKER_CANCER_PROBABILITY
+
+            cancer.add_unobserved_data([[str(person)]])
+            cancer.add_truth_data([[str(person), float(rng.random() < probability)]])
+
+        rules = [
+            srli.rule.Rule('Smokes(X) -> Cancer(X)', weight = 0.50, squared = True),
+            srli.rule.Rule('Friends(A1, A2) & Smokes(A1) -> Smokes(A2)', weight = 0.40, squared = True),
+            srli.rule.Rule('Friends(A1, A2) & Smokes(A2) -> Smokes(A1)', weight = 0.40, squared = True),
+        ]
+
+        evaluations = [
+            srli.evaluation.F1(smokes, primary = True),
+            srli.evaluation.AuROC(smokes),
+            srli.evaluation.F1(cancer),
+        ]
+
+        return [friends, smokes, cancer], rules, evaluations
+
+class Acquaintances(BenchmarkModel):
+    """
+    The simple acquaintances model.
+    People who lived in the same place or like the same thing are more likely to know each other.
+    Density controls how many things each person likes.
+    Knows is symmetric, and the transitive rule makes grounding cubic in the number of people.
+    """
+
+    PEOPLE_PER_LOCATION = 5
+    PEOPLE_PER_THING = 3
+    SHARED_LOCATION_PROBABILITY = 0.6
+    SHARED_THING_PROBABILITY = 0.3
+    BASE_PROBABILITY = 0.02
+
+    def build(self):
+        rng = random.Random(self._seed)
+        people = list(range(self._size))
+        locations = list(range(max(2, self._size // self.PEOPLE_PER_LOCATION)))
+        things = list(range(max(2, self._size // self.PEOPLE_PER_THING)))
+
+        lived = srli.relation.Relation('Lived', variable_types = ['Person', 'Location'])
+        likes = srli.relation.Relation('Likes', variable_types = ['Person', 'Thing'])
+        knows = srli.relation.Relation('Knows', variable_types = ['Person', 'Person'], negative_prior_weight = 0.05)
+
+        # {person: {location/thing, ...}, ...}
+        person_locations = {person : set(rng.sample(locations, rng.randint(1, 2))) for person in people}
+        person_things = {person : {thing for thing in things if (rng.random() < self._density)} for person in people}
+
+        lived.add_observed_data([[str(person), str(location), 1.0] for person in people for location in sorted(person_locations[person])])
+        likes.add_observed_data([[str(person), str(thing), 1.0] for person in people for thing in sorted(person_things[person])])
+
+        rows = []
+        for person in people:
+            for other in people[person + 1:]:
+                if (len(person_locations[person] & person_locations[other]) > 0):
+                    probability = self.SHARED_LOCATION_PROBABILITY
+                elif (len(person_things[person] & person_things[other]) > 0):
+                    probability = self.SHARED_THING_PROBABILITY
+                else:
+                    probability = self.BASE_PROBABILITY
+
+                value = float(rng.random() < probability)
+                rows.append([str(person), str(other), value])
+                rows.append([str(other), str(person), value])
+
+        self._split_targets(rng, knows, rows)
+
+        rules = [
+            srli.rule.Rule('Lived(P1, L) & Lived(P2, L) & (P1 != P2) -> Knows(P1, P2)', weight = 0.20, squared = True),
+            srli.rule.Rule('Lived(P1, L1) & Lived(P2, L2) & (P1 != P2) & (L1 != L2) -> !Knows(P1, P2)', weight = 0.05, squared = True),
+            srli.rule.Rule('Likes(P1, L) & Likes(P2, L) & (P1 != P2) -> Knows(P1, P2)', weight = 0.10, squared = True),
+            srli.rule.Rule('Knows(P1, P2) & Knows(P2, P3) & (P1 != P3) -> Knows(P1, P3)', weight = 0.05, squared = True),
+            srli.rule.Rule('Knows(P1, P2) = Knows(P2, P1)'),
+        ]
+
+        evaluations = [
+            srli.evaluation.F1(knows, primary = True),
+            srli.evaluation.AuROC(knows),
+        ]
+
+        return [lived, likes, knows], rules, evaluations
+
+class CollectiveClassification(BenchmarkModel):
+    """
+    Papers each have exactly one label (a hard functional sum constraint on HasLabel).
+    Papers contain words that are indicative of a label, and link to other papers (more often with the same label).
+    Some papers have known labels, and the rest must be inferred.
+    """
+
+    NUM_LABELS = 3
+    WORDS_PER_LABEL = 10
+    WORDS_PER_PAPER = 5
+    INDICATIVE_WORD_PROBABILITY = 0.7
+    # How much more likely papers with the same label are to link.
+    HOMOPHILY = 4.0
+    OBSERVED_PAPER_FRACTION = 0.3
+
+    def build(self):
+        rng = random.Random(self._seed)
+        papers = list(range(self._size))
+        labels = list(range(self.NUM_LABELS))
+        words = list(range(self.NUM_LABELS * self.WORDS_PER_LABEL))
+
+        link = srli.relation.Relation('Link', variable_types = ['Paper', 'Paper'])
+        has_word = srli.relation.Relation('HasWord', variable_types = ['Paper', 'Word'])
+        word_label = srli.relation.Relation('WordLabel', variable_types = ['Word', 'Label'])
+        has_label = srli.relation.Relation('HasLabel', variable_types = ['Paper', 'Label'],
+                sum_constraint = srli.relation.Relation.SumConstraint(label_indexes = [1]))
+
+        paper_labels = {paper : rng.choice(labels) for paper in papers}
+
+        word_label.add_observed_data([[str(word), str(word // self.WORDS_PER_LABEL), 1.0] for word in words])
+
+        for paper in papers:
+            label_words = words[paper_labels[paper] * self.WORDS_PER_LABEL : (paper_labels[paper] + 1) * self.WORDS_PER_LABEL]
+
+            paper_words = set()
+            for i in range(self.WORDS_PER_PAPER):
+                if (rng.random() < self.INDICATIVE_WORD_PROBABILITY):
+                    paper_words.add(rng.choice(label_words))
+                else:
+                    paper_words.add(rng.choice(words))
+
+            has_word.add_observed_data([[str(paper), str(word), 1.0] for word in sorted(paper_words)])
+
+        # Keep the average density, but skew links towards papers with the same label.
+        same_probability = min(1.0, self._density * self.HOMOPHILY * self.NUM_LABELS / (self.HOMOPHILY + self.NUM_LABELS - 1))
+        different_probability = same_probability / self.HOMOPHILY
+
+        for paper in papers:
+            for other in papers[paper + 1:]:
+                probability = same_probability if (paper_labels[paper] == paper_labels[other]) else different_probability
+                if (rng.random() < probability):
+                    link.add_observed_data([[str(paper), str(other), 1.0], [str(other), str(paper), 1.0]])
+
+        for paper in papers:
+            rows = [[str(paper), str(label), float(label == paper_labels[paper])] for label in labels]
+
+            if (rng.random() < self.OBSERVED_PAPER_FRACTION):
+                has_label.add_observed_data(rows)
+            else:
+                has_label.add_unobserved_data([row[0:-1] for row in rows])
+                has_label.add_truth_data(rows)
+
+        rules = [
+            srli.rule.Rule('HasWord(P, W) & WordLabel(W, L) -> HasLabel(P, L)', weight = 1.0, squared = True),
+            srli.rule.Rule('Link(P1, P2) & HasLabel(P1, L) -> HasLabel(P2, L)', weight = 0.5, squared = True),
+        ]
+
+        evaluations = [
+            srli.evaluation.CategoricalAccuracy(has_label, primary = True),
+        ]
+
+        return [link, has_word, word_label, has_label], rules, evaluations
+
+# {name: model class, ...}
+MODELS = {
+    'Smokers': Smokers,
+    'Acquaintances': Acquaintances,
+    'CollectiveClassification': CollectiveClassification,
+}
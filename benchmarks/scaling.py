@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+"""
+Run engines on synthetic models of increasing size, and record how the cost (and quality) scales.
+Each run happens in a fresh process (so memory peaks are per run and hung engines can be killed).
+The JSON report can be compared against a previous (baseline) report.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import traceback
+
+import benchmarks.models
+import srli.engine
+import srli.evaluation
+import srli.instrumentation
+
+DEFAULT_SIZES = [10, 25, 50]
+DEFAULT_TIMEOUT_SECS = 600
+
+# A run is a regression if it takes more than (1 + tolerance) x the baseline time/memory.
+DEFAULT_TOLERANCE = 0.25
+# Quality regressions are absolute drops in a metric.
+DEFAULT_QUALITY_TOLERANCE = 0.05
+# Times below this are too noisy to compare.
+MIN_COMPARE_TIME_SECS = 0.1
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+
+# Keys that identify a run (when comparing to a baseline).
+RUN_KEYS = ['model', 'engine', 'size', 'density', 'seed']
+
+def run_benchmark(model_name, engine_name, size, density, seed):
+    """
+    Build and solve a single model with a single engine (in the current process).
+    Returns: a result record ({key: value, ...}).
+    """
+
+    model = benchmarks.models.MODELS[model_name](size, density = density, seed = seed)
+    relations, rules, evaluations = model.build()
+
+    engine_type = srli.engine.load(srli.engine.Engine(engine_name))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'instrumentation.jsonl')
+        instrumentation = srli.instrumentation.Instrumentation(path)
+
+        engine = engine_type(relations, rules, evaluations = evaluations, instrumentation = instrumentation)
+
+        # Some solvers write scratch files (e.g. 'resulttable') into the current directory.
+        original_dir = os.getcwd()
+        os.chdir(temp_dir)
+
+        try:
+            with instrumentation.phase('solve'):
+                results = engine.solve()
+        finally:
+            os.chdir(original_dir)
+            engine.close()
+            instrumentation.close()
+
+        with open(path, 'r') as file:
+            records = [json.loads(line) for line in file]
+
+    phases = [record for record in records if (record['type'] == 'phase')]
+    solve_record = [record for record in phases if (record['path'] == 'solve')][0]
+
+    # Not every engine grounds in Python (e.g. PSL and Tuffy ground internally).
+    ground_time = None
+    ground_records = [record for record in phases if (record['phase'] == 'ground')]
+    if (len(ground_records) > 0):
+        ground_time = sum([record['wall_time'] for record in ground_records])
+
+    counters = {}
+    for record in records:
+        if (record['type'] == 'counters'):
+            counters.update(record['counters'])
+
+    context = srli.evaluation.EvaluationContext(results)
+
+    # {'metric(relation)': value, ...}
+    metrics = {}
+    for evaluation in evaluations:
+        key = "%s(%s)" % (evaluation.metric_name(), evaluation.relation().name())
+
+        try:
+            metrics[key] = float(evaluation.evaluate(results, context = context))
+        except ValueError:
+            # E.g., AuROC when the truth only has a single class.
+            metrics[key] = None
+
+    return {
+        'ground_time': ground_time,
+        'solve_time': solve_record['wall_time'],
+        'cpu_time': solve_record['cpu_time'],
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'peak_rss_children_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        'atoms': {relation.name() : len(relation.get_unobserved_data()) for relation in relations if (relation.has_unobserved_data())},
+        'counters': counters,
+        'metrics': metrics,
+    }
+
+def _run_benchmark_safe(*args):
+    """
+    Exceptions from some engines cannot be pickled, so errors are passed back as part of the record instead.
+    """
+
+    try:
+        record = run_benchmark(*args)
+        record['status'] = STATUS_OK
+    except Exception as ex:
+        record = {
+            'status': STATUS_ERROR,
+            'error': "%s: %s" % (type(ex).__name__, ex),
+        }
+        traceback.print_exc()
+
+    return record
+
+def run_all(model_names, engine_names, sizes, density, seed, timeout = DEFAULT_TIMEOUT_SECS):
+    """
+    Run every (model, engine, size) combination in its own process.
+    Returns: [record, ...]
+    """
+
+    context = multiprocessing.get_context('spawn')
+    records = []
+
+    for model_name in model_names:
+        for engine_name in engine_names:
+            for size in sizes:
+                record = {
+                    'model': model_name,
+                    'engine': engine_name,
+                    'size': size,
+                    'density': density,
+                    'seed': seed,
+                }
+
+                print("Running benchmark -- Model: %s, Engine: %s, Size: %d." % (model_name, engine_name, size))
+                start_time = time.perf_counter()
+
+                with context.Pool(1) as pool:
+                    async_result = pool.apply_async(_run_benchmark_safe, (model_name, engine_name, size, density, seed))
+
+                    try:
+                        record.update(async_result.get(timeout))
+                    except multiprocessing.TimeoutError:
+                        record['status'] = STATUS_TIMEOUT
+
+                record['total_time'] = time.perf_counter() - start_time
+                records.append(record)
+
+                print("Benchmark complete -- Model: %s, Engine: %s, Size: %d, Status: %s, Total Time: %0.2fs." % (
+                        model_name, engine_name, size, record['status'], record['total_time']))
+
+    return records
+
+def compare(records, baseline_records, tolerance = DEFAULT_TOLERANCE, quality_tolerance = DEFAULT_QUALITY_TOLERANCE):
+    """
+    Compare runs against the matching runs in a baseline.
+    Returns: [(record, message), ...] for every regression found.
+    """
+
+    baseline = {tuple([record[key] for key in RUN_KEYS]) : record for record in baseline_records}
+    regressions = []
+
+    for record in records:
+        old_record = baseline.get(tuple([record[key] for key in RUN_KEYS]))
+        if (old_record is None):
+            continue
+
+        if (old_record['status'] != record['status']):
+            if (old_record['status'] == STATUS_OK):
+                regressions.append((record, "status went from '%s' to '%s'" % (old_record['status'], record['status'])))
+            continue
+
+        if (record['status'] != STATUS_OK):
+            continue
+
+        for key in ['ground_time', 'solve_time']:
+            if ((record[key] is None) or (old_record[key] is None) or (old_record[key] < MIN_COMPARE_TIME_SECS)):
+                continue
+
+            if (record[key] > (1.0 + tolerance) * old_record[key]):
+                regressions.append((record, "%s went from %0.3fs to %0.3fs" % (key, old_record[key], record[key])))
+
+        old_memory = max(old_record['peak_rss_kb'], old_record['peak_rss_children_kb'])
+        memory = max(record['peak_rss_kb'], record['peak_rss_children_kb'])
+        if (memory > (1.0 + tolerance) * old_memory):
+            regressions.append((record, "peak memory went from %d KB to %d KB" % (old_memory, memory)))
+
+        for (metric, old_value) in old_record['metrics'].items():
+            value = record['metrics'].get(metric)
+            if ((value is None) or (old_value is None)):
+                continue
+
+            if (value < (old_value - quality_tolerance)):
+                regressions.append((record, "%s went from %f to %f" % (metric, old_value, value)))
+
+    return regressions
+
+def print_summary(records):
+    columns = ['model', 'engine', 'size', 'status', 'ground_time', 'solve_time', 'peak_rss_kb', 'metrics']
+
+    print("\t".join(columns))
+    for record in records:
+        row = []
+        for column in columns:
+            value = record.get(column)
+
+            if (isinstance(value, float)):
+                value = "%0.3f" % (value)
+            elif (isinstance(value, dict)):
+                value = ', '.join(["%s: %s" % (key, 'None' if (metric is None) else "%0.3f" % (metric)) for (key, metric) in value.items()])
+
+            row.append(str(value))
+
+        print("\t".join(row))
+
+def main(arguments):
+    model_names = arguments.models
+    if (model_names is None):
+        model_names = list(benchmarks.models.MODELS.keys())
+
+    engine_names = arguments.engines
+    if (engine_names is None):
+        engine_names = [engine_type.name for engine_type in srli.engine.Engine]
+
+    sizes = arguments.sizes
+    if (sizes is None):
+        sizes = DEFAULT_SIZES
+
+    records = run_all(model_names, engine_names, sizes, arguments.density, arguments.seed, timeout = arguments.timeout)
+
+    report = {
+        'created': time.time(),
+        'python': sys.version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': records,
+    }
+
+    if (arguments.out_path is not None):
+        with open(arguments.out_path, 'w') as file:
+            json.dump(report, file, indent = 4)
+
+    print_summary(records)
+
+    for record in records:
+        if (record['status'] == STATUS_ERROR):
+            print("Error -- Model: %s, Engine: %s, Size: %d: %s" % (record['model'], record['engine'], record['size'], record['error']))
+
+    if (arguments.baseline_path is None):
+        return 0
+
+    with open(arguments.baseline_path, 'r') as file:
+        baseline = json.load(file)
+
+    regressions = compare(records, baseline['results'], tolerance = arguments.tolerance, quality_tolerance = arguments.quality_tolerance)
+    for (record, message) in regressions:
+        print("Regression -- Model: %s, Engine: %s, Size: %d: %s." % (record['model'], record['engine'], record['size'], message))
+
+    print("Found %d regression(s) against the baseline (%s)." % (len(regressions), arguments.baseline_path))
+
+    return int(len(regressions) > 0)
+
+def _load_args():
+    parser = argparse.ArgumentParser(description = 'Measure how SRLi engines scale on synthetic models.')
+
+    parser.add_argument('--model', dest = 'models',
+        action = 'append', type = str, default = None,
+        choices = list(benchmarks.models.MODELS.keys()),
+        help = 'a model to run (may be repeated) (default: all models)')
+
+    parser.add_argument('--engine', dest = 'engines',
+        action = 'append', type = str, default = None,
+        choices = [engine_type.name for engine_type in srli.engine.Engine],
+        help = 'an engine to run (may be repeated) (default: all engines)')
+
+    parser.add_argument('--size', dest = 'sizes',
+        action = 'append', type = int, default = None,
+        help = 'a model size (number of people/papers) to run (may be repeated) (default: %s)' % (DEFAULT_SIZES))
+
+    parser.add_argument('--density', dest = 'density',
+        action = 'store', type = float, default = benchmarks.models.DEFAULT_DENSITY,
+        help = 'the density of links between entities (default: %(default)s)')
+
+    parser.add_argument('--seed', dest = 'seed',
+        action = 'store', type = int, default = benchmarks.models.DEFAULT_SEED,
+        help = 'the seed for generating data (default: %(default)s)')
+
+    parser.add_argument('--timeout', dest = 'timeout',
+        action = 'store', type = float, default = DEFAULT_TIMEOUT_SECS,
+        help = 'the maximum number of seconds for a single run (default: %(default)s)')
+
+    parser.add_argument('--out', dest = 'out_path',
+        action = 'store', type = str, default = None,
+        help = 'where to write the JSON report (default: %(default)s)')
+
+    parser.add_argument('--baseline', dest = 'baseline_path',
+        action = 'store', type = str, default = None,
+        help = 'a previous JSON report to check for regressions against (default: %(default)s)')
+
+    parser.add_argument('--tolerance', dest = 'tolerance',
+        action = 'store', type = float, default = DEFAULT_TOLERANCE,
+        help = 'the allowed relative increase in time/memory over the baseline (default: %(default)s)')
+
+    parser.add_argument('--quality-tolerance', dest = 'quality_tolerance',
+        action = 'store', type = float, default = DEFAULT_QUALITY_TOLERANCE,
+        help = 'the allowed absolute drop in a metric from the baseline (default: %(default)s)')
+
+    return parser.parse_args()
+
+if (__name__ == '__main__'):
+    sys.exit(main(_load_args()))
@@ -6,6 +6,7 @@ import sys
 import unittest
 
 BASE_DIR = os.path.join('tests')
+MICROBENCHMARK_FLAG = '--micro'
 
 # Return a list of unittest.TestCase
 def _collect_tests(suite, testCases = []):
@@ -42,18 +43,32 @@ def main(pattern = None):
     if not runner.run(tests).wasSuccessful():
         sys.exit(1)
 
+def run_microbenchmarks(baseline_path = None):
+    import benchmarks.micro
+
+    if not benchmarks.micro.main(baseline_path = baseline_path):
+        sys.exit(1)
+
 def _load_args(args):
     executable = args.pop(0)
-    if (len(args) >  1 or ({'h', 'help'} & {arg.lower().strip().replace('-', '') for arg in args})):
+    if (len(args) >  2 or ({'h', 'help'} & {arg.lower().strip().replace('-', '') for arg in args})
+            or ((len(args) == 2) and (args[0] != MICROBENCHMARK_FLAG))):
         print("USAGE: python3 %s [test pattern]" % (executable), file = sys.stderr)
+        print("       python3 %s %s [baseline path]" % (executable, MICROBENCHMARK_FLAG), file = sys.stderr)
         print('The test pattern will be used directly in re.search() to see if a test will be run.', file = sys.stderr)
+        print('Microbenchmarks will fail if any are slower than the baseline (see benchmarks/micro.py).', file = sys.stderr)
         sys.exit(1)
 
     pattern = None
     if (len(args) > 0):
         pattern = args.pop(0)
 
-    return (pattern, )
+    return (pattern, args)
 
 if __name__ == '__main__':
-    main(*_load_args(sys.argv))
+    pattern, args = _load_args(list(sys.argv))
+
+    if (pattern == MICROBENCHMARK_FLAG):
+        run_microbenchmarks(*args)
+    else:
+        main(pattern)
@@ -0,0 +1,201 @@
+"""
+An on-disk cache of inference results, keyed by a fingerprint of everything that can change the results:
+the rules (text, weights, and options), the relation schemas (arity, types, priors, and sum constraints),
+the data contents, the engine, the seed, and the engine options.
+
+Results are stored as gzipped JSON (one file per fingerprint),
+and the least recently used entries are evicted once the cache grows past its size limit.
+Cached results are returned as-is, so the cache directory must be private to the user (see make_private_dir()).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import uuid
+
+import srli.util
+
+# A private (per-user) directory for all of srli's caches.
+USER_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'srli')
+
+DEFAULT_CACHE_DIR = os.path.join(USER_CACHE_DIR, 'results')
+DEFAULT_MAX_SIZE_MB = 512
+
+# Bump when the fingerprint or storage format changes.
+CACHE_VERSION = 2
+
+ENTRY_SUFFIX = '.json.gz'
+
+class ResultCache(object):
+    """
+    Entries are only ever written whole (to a temp file that is then moved into place),
+    so a cache directory can be safely shared between processes.
+    Recency is tracked with each entry's modification time (touched on every hit).
+    """
+
+    def __init__(self, cache_dir = DEFAULT_CACHE_DIR, max_size_mb = DEFAULT_MAX_SIZE_MB):
+        if (max_size_mb <= 0):
+            raise ValueError("Max cache size must be positive, found: %s." % (max_size_mb))
+
+        self._cache_dir = cache_dir
+        self._max_size = int(max_size_mb * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, engine_name, relations, rules, seed = None, options = {}):
+        """
+        Get the key for a model (with all its currently loaded data) run with a specific engine configuration.
+        Data is not rehashed (see srli.relation.Relation.data_fingerprint()).
+        Seedless runs use a random seed (so their results are not reproducible) and should not be cached:
+        the returned key is None.
+        """
+
+        if (seed is None):
+            return None
+
+        header = {
+            'version': CACHE_VERSION,
+            'engine': engine_name,
+            'seed': seed,
+            'options': options,
+            'model': srli.util.model_fingerprint(relations, rules),
+        }
+
+        return hashlib.blake2b(json.dumps(header, sort_keys = True, default = str).encode(), digest_size = 16).hexdigest()
+
+    def get(self, key, relations):
+        """
+        Get the results for a key, or None if they are not cached.
+        Returns: {relation: [[arg, ..., value], ...], ...}
+        """
+
+        check_private_dir(self._cache_dir)
+
+        path = self._path(key)
+
+        try:
+            with gzip.open(path, 'rt') as file:
+                raw_results = json.load(file)
+
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, just evicted, or (in the worst case) corrupt.
+            self.misses += 1
+            return None
+
+        relation_map = {relation.name() : relation for relation in relations}
+
+        results = {}
+        for (name, data) in raw_results.items():
+            if (name not in relation_map):
+                self.misses += 1
+                return None
+
+            results[relation_map[name]] = data
+
+        self.hits += 1
+        return results
+
+    def put(self, key, results):
+        make_private_dir(self._cache_dir)
+
+        raw_results = {relation.name() : [list(row) for row in data] for (relation, data) in results.items()}
+
+        path = self._path(key)
+        temp_path = "%s.%s.tmp" % (path, uuid.uuid4())
+
+        with gzip.open(temp_path, 'wt') as file:
+            json.dump(raw_results, file, separators = (',', ':'))
+
+        os.replace(temp_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in its max size.
+        Returns the number of entries removed.
+        """
+
+        return evict_lru(self._cache_dir, self._max_size, ENTRY_SUFFIX)
+
+    def clear(self):
+        if (not os.path.isdir(self._cache_dir)):
+            return
+
+        for filename in os.listdir(self._cache_dir):
+            if (filename.endswith(ENTRY_SUFFIX)):
+                os.remove(os.path.join(self._cache_dir, filename))
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key + ENTRY_SUFFIX)
+
+def make_private_dir(path):
+    """
+    Make sure that |path| exists and belongs to the current user (a new dir is only accessible by the current user).
+    """
+
+    os.makedirs(path, mode = 0o700, exist_ok = True)
+    check_private_dir(path)
+
+def check_private_dir(path):
+    """
+    Raise if |path| exists, but is not owned by the current user.
+    Someone else's directory could feed us any files.
+    """
+
+    if (not hasattr(os, 'getuid')):
+        return
+
+    try:
+        owner = os.stat(path).st_uid
+    except FileNotFoundError:
+        return
+
+    if (owner != os.getuid()):
+        raise RuntimeError("Cache directory (%s) is not owned by the current user." % (path))
+
+def evict_lru(cache_dir, max_size, suffixes):
+    """
+    Remove the least recently used (oldest modification time) files in |cache_dir| that end with |suffixes| (a string or tuple)
+    until all those files together fit in |max_size| bytes.
+    Returns the number of files removed.
+    """
+
+    if (not os.path.isdir(cache_dir)):
+        return 0
+
+    # [(last used, size, path), ...]
+    entries = []
+    total_size = 0
+
+    for filename in os.listdir(cache_dir):
+        if (not filename.endswith(suffixes)):
+            continue
+
+        path = os.path.join(cache_dir, filename)
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total_size += stat.st_size
+
+    count = 0
+    for (_, size, path) in sorted(entries):
+        if (total_size <= max_size):
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+        total_size -= size
+        count += 1
+
+    return count
@@ -1,34 +1,234 @@
 import abc
+import asyncio
+import functools
+import multiprocessing
 import random
 import re
+import time
+import traceback
 
+import srli.instrumentation
 import srli.rule
+import srli.util
 
 class BaseEngine(abc.ABC):
     WEIGHT_SLACK = 0.01
 
     def __init__(self, relations, rules, seed = None, evaluations = [], options = {},
-            normalize_weights = True,
+            normalize_weights = True, instrumentation = None, progress = None, profiler = None,
             **kwargs):
         self._relations = relations
         self._evaluations = evaluations
         self._options = options
 
+        if (instrumentation is None):
+            instrumentation = srli.instrumentation.NullInstrumentation()
+        self._instrumentation = instrumentation
+
+        # A srli.profiling.Profiler for only the selected phases (e.g. 'prep', 'reason').
+        if (profiler is not None):
+            self._instrumentation.set_profiler(profiler)
+
+        # A srli.progress.ProgressSink (or None).
+        # Inner loops should check that this is set before building any events.
+        self._progress = progress
+        self._progress_start = time.perf_counter()
+
         if (seed is None):
             seed = random.randint(0, 2 ** 31)
         self._rng = random.Random(seed)
 
         self._rules = self._normalize_rules(rules, normalize_weights)
 
+        # The results and ground rule keys (see _diff_ground_rules()) of the last solve (for warm starts).
+        self._previous_results = None
+        self._previous_ground_rule_keys = None
+
     def solve(self, **kwargs):
         raise NotImplementedError("BaseEngine.solve")
 
+    def solve_weights(self, weight_vectors, **kwargs):
+        """
+        Solve once for each vector of rule weights ([weight, ...], aligned with the rules, with None for unweighted rules).
+        Engines that can solve an already ground program (see _prep()) only ground once,
+        and then just update the weights of the ground rules (through their rule index) before each solve.
+        Other engines fall back to a full solve() for each weight vector.
+        Weights are used as given (they are not normalized), and the rules keep their original weights afterwards.
+        Returns: [results, ...] (one for each weight vector).
+        """
+
+        for weights in weight_vectors:
+            self._check_rule_weights(weights)
+
+        original_weights = [rule.weight() for rule in self._rules]
+
+        ground = self._prep()
+
+        results = []
+
+        try:
+            for weights in weight_vectors:
+                self._set_rule_weights(weights)
+
+                if (ground is None):
+                    results.append(self.solve(**kwargs))
+                    continue
+
+                with self._instrumentation.phase('reweight'):
+                    self._reweight(ground)
+
+                results.append(self._solve_ground(ground, **kwargs))
+        finally:
+            # Ground rules may be kept between solves (e.g., incremental engines), so they also need their weights back.
+            self._set_rule_weights(original_weights)
+            if (ground is not None):
+                self._reweight(ground)
+
+        return results
+
     def learn(self, **kwargs):
         raise NotImplementedError("BaseEngine.learn")
 
     def ground(self, **kwargs):
         raise NotImplementedError("BaseEngine.ground")
 
+    async def solve_async(self, **kwargs):
+        """
+        A coroutine version of solve().
+        By default, solve() is just run on a thread, so cancellation will not interrupt it.
+        Engines that run out of process should override this so that cancellation stops the underlying process.
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.solve, **kwargs))
+
+    async def learn_async(self, **kwargs):
+        """
+        A coroutine version of learn().
+        See solve_async().
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.learn, **kwargs))
+
+    def close(self):
+        """
+        Release any long-lived resources (processes, containers, etc) held by this engine.
+        """
+
+        pass
+
+    def _prep(self):
+        """
+        Ground (and process) the program for _solve_ground().
+        Engines that cannot solve an already ground program return None.
+        """
+
+        return None
+
+    def _solve_ground(self, ground, **kwargs):
+        """
+        Solve an already ground program (from _prep()).
+        """
+
+        raise NotImplementedError("BaseEngine._solve_ground")
+
+    def _reweight(self, ground):
+        """
+        Update the weights of an already ground program (from _prep()) to the current rule weights,
+        and reset any search state left on it (so the next solve starts fresh).
+        """
+
+        raise NotImplementedError("BaseEngine._reweight")
+
+    def _check_rule_weights(self, weights):
+        if (len(weights) != len(self._rules)):
+            raise ValueError("Expected a weight for each rule (%d), found %d weights." % (len(self._rules), len(weights)))
+
+        for (rule, weight) in zip(self._rules, weights):
+            # Hard rules can be ground differently than weighted ones.
+            if ((weight is None) != (not rule.is_weighted())):
+                raise ValueError("Rules cannot switch between weighted and unweighted when reweighting, found %s for rule: [%s]." % (weight, rule.text()))
+
+    def _set_rule_weights(self, weights):
+        for (rule, weight) in zip(self._rules, weights):
+            rule.set_weight(weight)
+
+    def _start_progress(self):
+        """
+        Mark the start of a solve (for the elapsed time on progress events).
+        """
+
+        self._progress_start = time.perf_counter()
+
+    def _report_progress(self, event, **values):
+        """
+        Send an event to the progress sink (which the caller should have already checked is set).
+        """
+
+        values['engine'] = type(self).__name__
+        values['event'] = event
+        values['elapsed'] = time.perf_counter() - self._progress_start
+
+        self._progress.report(values)
+
+    def _get_warm_start_values(self, warm_start):
+        """
+        Get the (discrete) values to warm start a solve from.
+        |warm_start| may be True (use the results of the previous solve),
+        or results to start from (in the same form solve() returns: {relation: [[arg, ..., value], ...], ...}).
+        Returns: {(predicate, (arg, ...)): 0 or 1, ...}, or None for a cold start.
+        """
+
+        if ((warm_start is None) or (warm_start is False)):
+            return None
+
+        if (warm_start is True):
+            warm_start = self._previous_results
+            if (warm_start is None):
+                return None
+
+        values = {}
+        for (relation, rows) in warm_start.items():
+            name = relation.name().upper()
+            for row in rows:
+                values[(name, tuple(map(str, row[0:-1])))] = int(float(row[-1]) >= srli.util.DEFAULT_TRUTH_THRESHOLD)
+
+        return values
+
+    def _tracks_ground_rules(self, warm_start):
+        """
+        Ground rule keys (see _diff_ground_rules()) are only built once a warm start has been requested,
+        so engines that are never warm started do not pay for them.
+        The first warm start after cold solves has nothing to diff against,
+        so it uses the ground rules that its start values do not satisfy instead.
+        """
+
+        return ((warm_start is not None) and (warm_start is not False)) or (self._previous_ground_rule_keys is not None)
+
+    def _diff_ground_rules(self, ground_rule_keys):
+        """
+        Compare ground rules against the ones from the previous solve (and remember them for the next solve).
+        Ground rules are compared with keys that do not depend on atom ids:
+            (rule index, ..., ((predicate, (arg, ...)), ...), ...)
+        where the last element has an entry (that starts with the atom's key) for every atom in the ground rule.
+        Returns: {(predicate, (arg, ...)), ...} for all the atoms in ground rules that were added or removed,
+            or None if there was no previous solve.
+        """
+
+        previous_keys = self._previous_ground_rule_keys
+        self._previous_ground_rule_keys = ground_rule_keys
+
+        if (previous_keys is None):
+            return None
+
+        changed_atoms = set()
+        for key in ground_rule_keys.symmetric_difference(previous_keys):
+            for atom_entry in key[-1]:
+                changed_atoms.add(atom_entry[0])
+
+        return changed_atoms
+
     def _normalize_rules(self, base_rules, normalize_weights):
         rules = []
         weight_sum = 0.0
@@ -123,3 +323,67 @@ class BaseEngine(abc.ABC):
 
         for relation in self._relations:
             relation.set_variable_types(variable_types[relation.name().upper()])
+
+async def run_process_async(target, *args):
+    """
+    Run |target|(*args) in a new (spawned) process without blocking the event loop, and return its result.
+    |target|, |args|, and the result must all be picklable.
+    If the awaiting task is cancelled, then the process is killed (and reaped) before the cancellation is passed on.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    (receiver, sender) = context.Pipe(duplex = False)
+
+    process = context.Process(target = _run_process_target, args = (sender, target, args), daemon = True)
+    process.start()
+    sender.close()
+
+    loop = asyncio.get_running_loop()
+
+    # Wait on a thread, since not every event loop can watch a pipe (e.g. the Windows Proactor loop has no add_reader()).
+    # The wait ends when there is a result or when the process exits (closing its end of the pipe).
+    waiter = loop.run_in_executor(None, _wait_readable, receiver)
+
+    success = None
+    value = None
+
+    try:
+        # Shielded, so a cancellation does not abandon the thread while it still uses the pipe.
+        await asyncio.shield(waiter)
+
+        try:
+            (success, value) = receiver.recv()
+        except EOFError:
+            pass
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    finally:
+        await asyncio.shield(waiter)
+        receiver.close()
+
+        await loop.run_in_executor(None, process.join)
+
+    if (success is None):
+        raise RuntimeError("Process exited (code: %s) without returning a result." % (process.exitcode))
+
+    if (not success):
+        raise RuntimeError("Process failed with the following error:\n%s" % (value))
+
+    return value
+
+def _wait_readable(connection):
+    try:
+        connection.poll(None)
+    except (OSError, EOFError):
+        # The other end is already gone (some platforms raise instead of reporting the pipe as readable).
+        pass
+
+def _run_process_target(connection, target, args):
+    try:
+        result = (True, target(*args))
+    except Exception:
+        result = (False, traceback.format_exc())
+
+    connection.send(result)
+    connection.close()
@@ -0,0 +1,564 @@
+"""
+Ground programs (in the same format as PSL's grounding API) that can be kept up-to-date with relation deltas
+(see srli.relation.Relation.changes_since()) instead of regrounding from scratch.
+"""
+
+import math
+
+import srli.relation
+
+# The weight PSL gives unweighted ground rules.
+UNWEIGHTED = -1.0
+
+OPERATOR_LOGICAL = '|'
+OPERATOR_EQUALS = '='
+
+class GroundProgram(object):
+    """
+    A full ground program (from PSL) along with everything needed to update it in place.
+
+    When the data changes, only the ground rules that touch a changed atom are removed and reground (in Python).
+    Grounding follows PSL's semantics:
+        - logical rules are grounded over their negative (body) literals, and their other atoms are just looked up,
+        - arithmetic rules are grounded over all their atoms,
+        - atoms of a relation without targets (a closed relation) that do not exist are observed as zero,
+        - ground rules that are trivially satisfied by observed atoms, or that do not have any unobserved atoms, are dropped.
+
+    Anything else (untracked data changes, a relation gaining its first or losing its last target,
+    or rules that cannot be handled here) requires a full reground, which update() signals by returning None.
+
+    |all_atoms| should match whether all atoms (and not just the ones used in ground rules) were asked for when grounding.
+    """
+
+    def __init__(self, relations, rules, ground_program, all_atoms = False):
+        self._relations = list(relations)
+        self._rules = list(rules)
+        self._all_atoms = all_atoms
+
+        self._relation_map = {relation.name().upper() : relation for relation in self._relations}
+
+        # {relation: version, ...}
+        self._versions = {relation : relation.version() for relation in self._relations}
+
+        # {relation: has targets, ...}
+        self._open = {relation : relation.has_unobserved_data() for relation in self._relations}
+
+        # [GroundProgram._Rule, ...] (or None if any rule cannot be handled).
+        self._parsed_rules = self._parse_rules()
+
+        # {atom_id: {'predicate': name, 'arguments': [arg, ...], 'value': value, 'observed': bool, 'relation': relation}, ...}
+        self.atoms = {}
+
+        # {ground_rule_id: {'ruleIndex': index, 'operator': op, 'weight': weight, 'constant': constant, 'coefficients': [...], 'atoms': [atom_id, ...]}, ...}
+        self.ground_rules = {}
+
+        # {(predicate, (arg, ...)): atom_id, ...}
+        self._atom_ids = {}
+
+        # {atom_id: {ground_rule_id, ...}, ...}
+        self._atom_uses = {}
+
+        for (atom_id, atom) in ground_program['atoms'].items():
+            atom['relation'] = self._relation_map[atom['predicate']]
+            self._add_atom(int(atom_id), atom)
+
+        self._next_atom_id = max(self.atoms.keys(), default = -1) + 1
+        self._next_ground_rule_id = 0
+
+        for ground_rule in ground_program['groundRules']:
+            self._add_ground_rule(ground_rule)
+
+        # Lookup indexes for grounding, built on first use.
+        # {(predicate, (position, ...)): {(value, ...): {(arg, ...), ...}, ...}, ...}
+        self._indexes = {}
+
+        # The current data for every relation.
+        # Each data type is tracked separately, since an atom can briefly be both while changes are applied
+        # (e.g., an observation that becomes a target may be inserted as unobserved before its observation is deleted).
+        # {predicate: {(arg, ...): {data_type: (observed, value), ...}, ...}, ...}
+        self._data = {name : {} for name in self._relation_map}
+        for relation in self._relations:
+            for data_type in [srli.relation.Relation.DataType.OBSERVED, srli.relation.Relation.DataType.UNOBSERVED]:
+                for row in relation.get_data(data_type):
+                    self._set_data(relation, row, data_type)
+
+    def update(self):
+        """
+        Bring the ground program up-to-date with the current data.
+        Returns: ({removed ground_rule_id: ground rule, ...}, [added ground_rule_id, ...]),
+            or None if this program cannot be updated (and a full reground is needed).
+        """
+
+        if (self._parsed_rules is None):
+            return None
+
+        # [(relation, [change, ...]), ...]
+        all_changes = []
+
+        for relation in self._relations:
+            changes = relation.changes_since(self._versions[relation])
+            if (changes is None):
+                return None
+
+            # Opening/closing a relation changes how missing atoms are treated everywhere.
+            if (relation.has_unobserved_data() != self._open[relation]):
+                return None
+
+            all_changes.append((relation, changes))
+
+        # {(predicate, (arg, ...)), ...}
+        changed_keys = set()
+
+        for (relation, changes) in all_changes:
+            for (version, operation, data_type, old_row, new_row) in changes:
+                if (data_type == srli.relation.Relation.DataType.TRUTH):
+                    continue
+
+                if (operation == srli.relation.Relation.Operation.DELETE):
+                    key = self._unset_data(relation, old_row, data_type)
+                else:
+                    key = self._set_data(relation, new_row, data_type)
+
+                changed_keys.add(key)
+
+            self._versions[relation] = relation.version()
+
+        # Remove every ground rule that touches a changed atom.
+
+        removed = {}
+
+        # Atoms that may no longer be used.
+        # {atom_id, ...}
+        orphan_candidates = set()
+
+        for key in changed_keys:
+            atom_id = self._atom_ids.get(key)
+            if (atom_id is None):
+                continue
+
+            orphan_candidates.add(atom_id)
+
+            for ground_rule_id in list(self._atom_uses[atom_id]):
+                ground_rule = self._remove_ground_rule(ground_rule_id)
+                removed[ground_rule_id] = ground_rule
+                orphan_candidates.update(ground_rule['atoms'])
+
+        # Refresh the changed atoms that stay around.
+        for key in changed_keys:
+            self._refresh_atom(key)
+
+        # Reground everything that touches a changed atom.
+
+        added = []
+
+        # Groundings already made in this update (a ground rule can touch multiple changed atoms).
+        # {(rule index, (variable value, ...)), ...}
+        seen = set()
+
+        for key in changed_keys:
+            for ground_rule in self._ground_around(key, seen):
+                added.append(self._add_ground_rule(ground_rule))
+
+        for atom_id in orphan_candidates:
+            self._drop_if_unused(atom_id)
+
+        return removed, added
+
+    def _parse_rules(self):
+        import srli.parser
+
+        parsed_rules = []
+
+        for rule in self._rules:
+            try:
+                parsed_rule = GroundProgram._Rule(srli.parser.parse(rule.text()), self._relation_map)
+            except (ValueError, NotImplementedError):
+                return None
+
+            parsed_rules.append(parsed_rule)
+
+        return parsed_rules
+
+    def _set_data(self, relation, row, data_type):
+        name = relation.name().upper()
+        args = tuple(map(str, row[0:relation.arity()]))
+
+        if (data_type == srli.relation.Relation.DataType.OBSERVED):
+            value = 1.0
+            if (len(row) > relation.arity()):
+                value = float(row[-1])
+
+            state = (True, value)
+        else:
+            state = (False, 1.0)
+
+        data = self._data[name]
+        if (args not in data):
+            data[args] = {}
+            self._index_args(name, args, True)
+
+        data[args][data_type] = state
+
+        return (name, args)
+
+    def _unset_data(self, relation, row, data_type):
+        name = relation.name().upper()
+        args = tuple(map(str, row[0:relation.arity()]))
+
+        states = self._data[name].get(args)
+        if (states is None):
+            return (name, args)
+
+        states.pop(data_type, None)
+        if (len(states) == 0):
+            self._data[name].pop(args)
+            self._index_args(name, args, False)
+
+        return (name, args)
+
+    def _index_args(self, name, args, add):
+        for ((index_name, positions), index) in self._indexes.items():
+            if (index_name != name):
+                continue
+
+            values = tuple([args[position] for position in positions])
+
+            if (add):
+                if (values not in index):
+                    index[values] = set()
+                index[values].add(args)
+            else:
+                index[values].discard(args)
+
+    def _lookup(self, name, positions, values):
+        """
+        Get the arguments of all the atoms in the data that have |values| at |positions|.
+        """
+
+        data = self._data[name]
+
+        if (len(positions) == 0):
+            return list(data.keys())
+
+        key = (name, positions)
+        if (key not in self._indexes):
+            index = {}
+            for args in data:
+                index_values = tuple([args[position] for position in positions])
+                if (index_values not in index):
+                    index[index_values] = set()
+                index[index_values].add(args)
+
+            self._indexes[key] = index
+
+        return list(self._indexes[key].get(values, ()))
+
+    def _atom_state(self, name, args):
+        """
+        Returns: (observed, value), or None if the atom does not exist.
+        """
+
+        states = self._data[name].get(args)
+        if (states is not None):
+            # Observations win over targets (a valid model never has both once all the changes are applied).
+            if (srli.relation.Relation.DataType.OBSERVED in states):
+                return states[srli.relation.Relation.DataType.OBSERVED]
+
+            return states[srli.relation.Relation.DataType.UNOBSERVED]
+
+        # Closed relations treat any missing atoms as observed zeros.
+        if (not self._relation_map[name].has_unobserved_data()):
+            return (True, 0.0)
+
+        return None
+
+    def _ground_around(self, key, seen):
+        """
+        Generate all the ground rules that include the atom at |key|.
+        """
+
+        name, args = key
+
+        for (rule_index, rule) in enumerate(self._parsed_rules):
+            for literal in rule.literals:
+                if (literal.name != name):
+                    continue
+
+                binding = literal.unify(args, {})
+                if (binding is None):
+                    continue
+
+                for full_binding in self._join(rule.query_literals, binding):
+                    if (not rule.check_term_operations(full_binding)):
+                        continue
+
+                    grounding_key = (rule_index, tuple([full_binding[variable] for variable in rule.variables]))
+                    if (grounding_key in seen):
+                        continue
+                    seen.add(grounding_key)
+
+                    ground_rule = self._instantiate(rule_index, rule, full_binding)
+                    if (ground_rule is not None):
+                        yield ground_rule
+
+    def _join(self, literals, binding):
+        """
+        Generate every extension of |binding| where all of |literals| exist in the data.
+        """
+
+        if (len(literals) == 0):
+            yield binding
+            return
+
+        # Join on the literal with the most bound arguments next.
+        best_index = None
+        best_positions = None
+
+        for i in range(len(literals)):
+            positions = literals[i].bound_positions(binding)
+            if ((best_positions is None) or (len(positions) > len(best_positions))):
+                best_index = i
+                best_positions = positions
+
+        literal = literals[best_index]
+        remaining = literals[0:best_index] + literals[(best_index + 1):]
+
+        values = tuple([literal.resolve(position, binding) for position in best_positions])
+
+        if (len(best_positions) == len(literal.arguments)):
+            candidates = [values] if (values in self._data[literal.name]) else []
+        else:
+            candidates = self._lookup(literal.name, best_positions, values)
+
+        for args in candidates:
+            new_binding = literal.unify(args, binding)
+            if (new_binding is None):
+                continue
+
+            yield from self._join(remaining, new_binding)
+
+    def _instantiate(self, rule_index, rule, binding):
+        atom_keys = []
+        states = []
+
+        for literal in rule.literals:
+            args = tuple([literal.resolve(position, binding) for position in range(len(literal.arguments))])
+
+            state = self._atom_state(literal.name, args)
+            if (state is None):
+                raise ValueError("Found a target atom that was not explicitly specified in the targets: %s(%s)." % (literal.name, ', '.join(args)))
+
+            atom_keys.append((literal.name, args))
+            states.append(state)
+
+        has_unobserved = False
+
+        for i in range(len(rule.literals)):
+            observed, value = states[i]
+
+            if (not observed):
+                has_unobserved = True
+                continue
+
+            if (rule.operator != OPERATOR_LOGICAL):
+                continue
+
+            # Trivially satisfied.
+            coefficient = rule.literals[i].coefficient
+            if (((coefficient < 0) and math.isclose(value, 0.0)) or ((coefficient > 0) and math.isclose(value, 1.0))):
+                return None
+
+        if (not has_unobserved):
+            return None
+
+        weight = UNWEIGHTED
+        if (self._rules[rule_index].is_weighted()):
+            weight = self._rules[rule_index].weight()
+
+        return {
+            'ruleIndex': rule_index,
+            'operator': rule.operator,
+            'weight': weight,
+            'constant': rule.constant,
+            'coefficients': [literal.coefficient for literal in rule.literals],
+            'atoms': [self._get_atom_id(atom_key) for atom_key in atom_keys],
+        }
+
+    def _get_atom_id(self, key):
+        atom_id = self._atom_ids.get(key)
+        if (atom_id is not None):
+            return atom_id
+
+        atom_id = self._next_atom_id
+        self._next_atom_id += 1
+
+        self._add_atom(atom_id, self._make_atom(key))
+
+        return atom_id
+
+    def _make_atom(self, key):
+        name, args = key
+        observed, value = self._atom_state(name, args)
+
+        return {
+            'predicate': name,
+            'arguments': list(args),
+            'value': value,
+            'observed': observed,
+            'relation': self._relation_map[name],
+        }
+
+    def _refresh_atom(self, key):
+        name, args = key
+        atom_id = self._atom_ids.get(key)
+
+        if (self._atom_state(name, args) is None):
+            # The atom no longer exists (all its ground rules were removed).
+            if (atom_id is not None):
+                self._remove_atom(atom_id)
+            return
+
+        if (atom_id is not None):
+            # Replace (instead of modify) so anything holding the old atom is unaffected.
+            self.atoms[atom_id] = self._make_atom(key)
+        elif (self._all_atoms and (args in self._data[name])):
+            self._get_atom_id(key)
+
+    def _drop_if_unused(self, atom_id):
+        if ((atom_id not in self.atoms) or (len(self._atom_uses[atom_id]) > 0)):
+            return
+
+        atom = self.atoms[atom_id]
+        if (self._all_atoms and (tuple(atom['arguments']) in self._data[atom['predicate']])):
+            return
+
+        self._remove_atom(atom_id)
+
+    def _add_atom(self, atom_id, atom):
+        self.atoms[atom_id] = atom
+        self._atom_ids[(atom['predicate'], tuple(atom['arguments']))] = atom_id
+        self._atom_uses[atom_id] = set()
+
+    def _remove_atom(self, atom_id):
+        atom = self.atoms.pop(atom_id)
+        self._atom_ids.pop((atom['predicate'], tuple(atom['arguments'])))
+        self._atom_uses.pop(atom_id)
+
+    def _add_ground_rule(self, ground_rule):
+        ground_rule_id = self._next_ground_rule_id
+        self._next_ground_rule_id += 1
+
+        self.ground_rules[ground_rule_id] = ground_rule
+        for atom_id in ground_rule['atoms']:
+            self._atom_uses[atom_id].add(ground_rule_id)
+
+        return ground_rule_id
+
+    def _remove_ground_rule(self, ground_rule_id):
+        ground_rule = self.ground_rules.pop(ground_rule_id)
+        for atom_id in ground_rule['atoms']:
+            self._atom_uses[atom_id].discard(ground_rule_id)
+
+        return ground_rule
+
+    class _Literal(object):
+        def __init__(self, atom, coefficient, relation_map):
+            import srli.parser
+
+            self.name = atom.relation_name.upper()
+            self.coefficient = float(coefficient)
+
+            if (self.name not in relation_map):
+                raise ValueError("Unknown relation: '%s'." % (atom.relation_name))
+
+            # [(is variable, variable name or constant value), ...]
+            self.arguments = [(isinstance(argument, srli.parser.Variable), str.__str__(argument)) for argument in atom.arguments]
+
+        def bound_positions(self, binding):
+            return tuple([position for (position, (is_variable, value)) in enumerate(self.arguments) if ((not is_variable) or (value in binding))])
+
+        def resolve(self, position, binding):
+            is_variable, value = self.arguments[position]
+            if (is_variable):
+                return binding[value]
+
+            return value
+
+        def unify(self, args, binding):
+            """
+            Returns: a new binding that maps this literal onto |args| (or None if it cannot).
+            """
+
+            new_binding = dict(binding)
+
+            for ((is_variable, value), arg) in zip(self.arguments, args):
+                if (not is_variable):
+                    if (value != arg):
+                        return None
+                elif (value in new_binding):
+                    if (new_binding[value] != arg):
+                        return None
+                else:
+                    new_binding[value] = arg
+
+            return new_binding
+
+    class _Rule(object):
+        def __init__(self, parsed_rule, relation_map):
+            import srli.parser
+
+            if (isinstance(parsed_rule, srli.parser.DNF)):
+                self.operator = OPERATOR_LOGICAL
+                self.constant = 0.0
+            elif (isinstance(parsed_rule, srli.parser.LinearRelation)):
+                if (parsed_rule.operator not in ['=', '==']):
+                    raise NotImplementedError("Unsupported arithmetic operator: '%s'." % (parsed_rule.operator))
+
+                self.operator = OPERATOR_EQUALS
+                self.constant = float(parsed_rule.constant)
+            else:
+                raise NotImplementedError("Unsupported rule type: %s." % (type(parsed_rule)))
+
+            self.literals = [GroundProgram._Literal(atom, atom.modifier, relation_map) for atom in parsed_rule.atoms]
+
+            # Logical rules are grounded over their body (negative literals), arithmetic rules over everything.
+            if (self.operator == OPERATOR_LOGICAL):
+                self.query_literals = [literal for literal in self.literals if (literal.coefficient < 0)]
+            else:
+                self.query_literals = list(self.literals)
+
+            self.variables = []
+            for literal in self.literals:
+                for (is_variable, value) in literal.arguments:
+                    if (is_variable and (value not in self.variables)):
+                        self.variables.append(value)
+
+            query_variables = {value for literal in self.query_literals for (is_variable, value) in literal.arguments if is_variable}
+            if (set(self.variables) != query_variables):
+                raise NotImplementedError("All variables must appear in the rule's body.")
+
+            # [(operator, (is variable, value), (is variable, value)), ...]
+            self.term_operations = []
+            for term_operation in parsed_rule.term_operations:
+                if (term_operation.operator != '!='):
+                    raise NotImplementedError("Unsupported term operation: '%s'." % (term_operation.operator))
+
+                arguments = [self._parse_term(argument) for argument in term_operation.arguments]
+                self.term_operations.append((term_operation.operator, arguments[0], arguments[1]))
+
+        def _parse_term(self, argument):
+            if (argument in self.variables):
+                return (True, argument)
+
+            # Constants come back from the parser quoted.
+            return (False, argument[1:-1])
+
+        def check_term_operations(self, binding):
+            for (operator, a, b) in self.term_operations:
+                a_value = binding[a[1]] if a[0] else a[1]
+                b_value = binding[b[1]] if b[0] else b[1]
+
+                if (a_value == b_value):
+                    return False
+
+            return True
@@ -1,12 +1,25 @@
 import math
+import time
 
 import srli.engine.base
+import srli.engine.grounding
 import srli.engine.psl.engine
 
 # TODO(eriq): Atoms can be missed if they are not present in any ground rules.
 class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
     """
     A rough implentation of a discrete logical inference engine.
+    Progress is reported as 'iteration' events (every progress interval) and 'attempt' events (at the end of each attempt).
+    If |max_time| (seconds) is given, then search stops (between iterations) once that much time has been spent reasoning
+    (and the best values found so far are used).
+    If |incremental|, then the ground program is kept between solves,
+    and only the parts touched by data deltas (see srli.relation.Relation.insert_data()) are reground.
+    If solve() is given a |warm_start| (see BaseEngine._get_warm_start_values()), then search starts from those values,
+    and later attempts only perturb the neighborhood of the changes:
+    atoms without a value and atoms in ground rules that were added or removed since the previous solve
+    (or, without an earlier solve to compare against (see BaseEngine._tracks_ground_rules()),
+    atoms in ground rules that the warm start values do not satisfy).
+    Warm started attempts stop once an attempt does not improve on the best loss so far.
     """
 
     HARD_WEIGHT = 1000.0
@@ -20,6 +33,7 @@ class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
     def __init__(self, relations, rules,
             max_iterations = DEFAULT_MAX_ITERATIONS, max_retries = DEFAULT_MAX_RETRIES,
             stop_loss_delta = DEFAULT_STOP_LOSS_DELTA, stop_motion = DEFAULT_STOP_MOTION,
+            max_time = None, incremental = False,
             **kwargs):
         super().__init__(relations, rules, **kwargs)
 
@@ -27,6 +41,16 @@ class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
         self._max_retries = max_retries
         self._stop_loss_delta = stop_loss_delta
         self._stop_motion = stop_motion
+        self._max_time = max_time
+        self._incremental = incremental
+
+        # Only kept when incremental.
+        # srli.engine.grounding.GroundProgram
+        self._ground_program = None
+        # {ground_rule_id: DiscreteWeightedSolver._LogicalRule or DiscreteWeightedSolver._ArithmeticRule, ...}
+        self._made_rules = None
+        # The rule weights that the made rules were built with.
+        self._ground_weights = None
 
     def learn(self, **kwargs):
         engine = srli.engine.psl.engine.PSL(self._relations, self._rules, options = self._options)
@@ -34,50 +58,184 @@ class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
 
         return self
 
-    def solve(self, **kwargs):
-        atoms, ground_rules, atom_uses, sum_constraints = self._prep()
+    def solve(self, warm_start = None, **kwargs):
+        return self._solve_ground(self._prep(), warm_start = warm_start)
+
+    def _solve_ground(self, ground, warm_start = None, **kwargs):
+        atoms, ground_rules, atom_uses, sum_constraints = ground
+
+        changed_atoms = None
+        if (self._tracks_ground_rules(warm_start)):
+            changed_atoms = self._diff_ground_rules(self._ground_rule_keys(atoms, ground_rules))
+
+        start_values, neighborhood = self._warm_start(warm_start, atoms, ground_rules, changed_atoms)
+
+        self._start_progress()
+
+        deadline = None
+        if (self._max_time is not None):
+            deadline = time.perf_counter() + self._max_time
 
         best_loss = None
         best_attempt = None
         best_values = None
 
-        for attempt in range(1, self._max_retries + 1):
-            for atom in atoms.values():
-                atom.value = bool(self._rng.randint(0, 1))
+        # The warm start values are a candidate themselves (attempt 0), since an attempt may end up worse than where it started.
+        if (start_values is not None):
+            self._set_values(atoms, start_values)
+            best_loss = self._loss(atoms, ground_rules, sum_constraints)
+            best_attempt = 0
+            best_values = {atom_id : atom.value for (atom_id, atom) in atoms.items()}
+
+        with self._instrumentation.phase('reason'):
+            for attempt in range(1, self._max_retries + 1):
+                self._instrumentation.count('attempts')
+
+                if (start_values is None):
+                    for atom in atoms.values():
+                        if (not atom.observed):
+                            atom.value = bool(self._rng.randint(0, 1))
+                else:
+                    self._set_values(atoms, start_values)
+                    if (attempt > 1):
+                        for atom_id in neighborhood:
+                            atoms[atom_id].value = bool(self._rng.randint(0, 1))
+
+                loss = self._attempt(attempt, atoms, ground_rules, atom_uses, sum_constraints, best_loss, deadline)
 
-            loss = self._attempt(attempt, atoms, ground_rules, atom_uses, sum_constraints)
+                if ((best_loss is None) or (loss < best_loss)):
+                    best_loss = loss
+                    best_attempt = attempt
+                    best_values = {atom_id : atom.value for (atom_id, atom) in atoms.items()}
+                elif (start_values is not None):
+                    print("Stopping after attempt %d (no improvement on the warm start)." % (attempt))
+                    break
 
-            if ((best_loss is None) or (loss < best_loss)):
-                best_loss = loss
-                best_attempt = attempt
-                best_values = {atom_id : atom.value for (atom_id, atom) in atoms.items()}
+                if ((deadline is not None) and (time.perf_counter() >= deadline)):
+                    print("Time limit (%0.2fs) reached." % (self._max_time))
+                    break
 
         print("Using values from attempt %d (loss: %f)." % (best_attempt, best_loss))
 
-        return self._create_results(best_values, atoms)
+        results = self._create_results(best_values, atoms)
+        self._previous_results = results
+
+        return results
+
+    def _warm_start(self, warm_start, atoms, ground_rules, changed_atoms):
+        """
+        Returns: ({atom_id: value, ...} to start from (for unobserved atoms), {atom_id, ...} in the neighborhood of changes),
+            or (None, None) for a cold start.
+        """
+
+        previous_values = self._get_warm_start_values(warm_start)
+        if (previous_values is None):
+            return None, None
+
+        start_values = {}
+        neighborhood = set()
+
+        for (atom_id, atom) in atoms.items():
+            if (atom.observed):
+                continue
+
+            key = (atom.relation.name().upper(), tuple(atom.arguments))
+
+            if (key in previous_values):
+                start_values[atom_id] = bool(previous_values[key])
+            else:
+                start_values[atom_id] = bool(self._rng.randint(0, 1))
+                neighborhood.add(atom_id)
+
+            if ((changed_atoms is not None) and (key in changed_atoms)):
+                neighborhood.add(atom_id)
+
+        if (changed_atoms is None):
+            self._set_values(atoms, start_values)
+
+            for ground_rule in ground_rules:
+                if (ground_rule.loss(atoms) > 0.0):
+                    neighborhood.update([atom_id for atom_id in ground_rule.atom_ids if (not atoms[atom_id].observed)])
 
-    def _attempt(self, attempt, atoms, ground_rules, atom_uses, sum_constraints):
+        print("Warm start with %d of %d atoms in the neighborhood of changes." % (len(neighborhood), len(start_values)))
+        self._instrumentation.set('warm_start_neighborhood', len(neighborhood))
+
+        return start_values, neighborhood
+
+    def _ground_rule_keys(self, atoms, ground_rules):
+        """
+        See BaseEngine._diff_ground_rules().
+        Observed values are part of the keys (since they are not folded into the ground rules).
+        Weights are not (ground rules are matched through their rule), so reweighting (see solve_weights()) does not change any keys.
+        """
+
+        # {atom_id: ((predicate, (arg, ...)), observed value or None), ...}
+        atom_keys = {atom_id : ((atom.relation.name().upper(), tuple(atom.arguments)), atom.value if atom.observed else None) for (atom_id, atom) in atoms.items()}
+
+        keys = set()
+
+        for ground_rule in ground_rules:
+            atom_entries = []
+            for (atom_id, coefficient) in zip(ground_rule.atom_ids, ground_rule.coefficients):
+                atom_key, value = atom_keys[atom_id]
+                atom_entries.append((atom_key, coefficient, value))
+
+            if (isinstance(ground_rule, DiscreteWeightedSolver._ArithmeticRule)):
+                operator, constant = ground_rule.operator, ground_rule.constant
+            else:
+                operator, constant = '|', 0.0
+
+            keys.add((ground_rule.rule_index, operator, constant, tuple(sorted(atom_entries))))
+
+        return keys
+
+    def _reweight(self, ground):
+        atoms, ground_rules, atom_uses, sum_constraints = ground
+
+        # [weight, ...] (aligned with the rules).
+        weights = [(DiscreteWeightedSolver.HARD_WEIGHT if (rule.weight() is None) else rule.weight()) for rule in self._rules]
+
+        for ground_rule in ground_rules:
+            ground_rule.weight = weights[ground_rule.rule_index]
+
+    def _set_values(self, atoms, values):
+        for (atom_id, value) in values.items():
+            atoms[atom_id].value = value
+
+    def _attempt(self, attempt, atoms, ground_rules, atom_uses, sum_constraints, best_loss = None, deadline = None):
         previous_loss = self._loss(atoms, ground_rules, sum_constraints)
         print("Attempt: %d, Initial Loss: %f" % (attempt, previous_loss))
 
+        if ((best_loss is None) or (previous_loss < best_loss)):
+            best_loss = previous_loss
+
         for iteration in range(1, self._max_iterations + 1):
             motion = self._iteration(atoms, ground_rules, atom_uses, sum_constraints)
+            self._instrumentation.count('iterations')
 
             loss = self._loss(atoms, ground_rules, sum_constraints)
 
             loss_delta = abs(loss - previous_loss)
             previous_loss = loss
+            best_loss = min(best_loss, loss)
 
-            if (iteration % 5 == 0):
-                print("Attempt: %d, Iteration: %d, Loss: %f, Loss Delta: %f, Motion: %f" % (attempt, iteration, loss, loss_delta, motion))
+            if ((self._progress is not None) and (iteration % self._progress.interval == 0)):
+                self._report_progress('iteration', attempt = attempt, iteration = iteration,
+                        loss = loss, loss_delta = loss_delta, motion = motion, best_loss = best_loss)
 
             if ((loss_delta < self._stop_loss_delta) and (motion < self._stop_motion)):
                 print("Stopping Attempt -- Attempt: %d, Iteration: %d, Loss: %f, Loss Delta: %f, Motion: %f" % (attempt, iteration, loss, loss_delta, motion))
                 break
 
+            if ((deadline is not None) and (time.perf_counter() >= deadline)):
+                break
+
         loss = self._loss(atoms, ground_rules, sum_constraints)
         print("Attempt: %d, Final Loss: %f" % (attempt, loss))
 
+        if (self._progress is not None):
+            self._report_progress('attempt', attempt = attempt, iteration = iteration, loss = loss, best_loss = min(best_loss, loss))
+
         return loss
 
     def _iteration(self, atoms, ground_rules, atom_uses, sum_constraints):
@@ -220,14 +378,85 @@ class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
         return loss
 
     def _prep(self):
+        with self._instrumentation.phase('prep'):
+            if (self._incremental):
+                atoms, ground_rules, atom_uses, sum_constraints = self._update_ground_program()
+            else:
+                with self._instrumentation.phase('ground'):
+                    ground_program = self._ground()
+
+                with self._instrumentation.phase('process_ground_program'):
+                    atoms, ground_rules, atom_uses, sum_constraints = self._process_ground_program(ground_program)
+
+        self._instrumentation.set('ground_rules', len(ground_rules))
+        self._instrumentation.set('atoms', len(atoms))
+        self._instrumentation.set('unobserved_atoms', len(atom_uses))
+        self._instrumentation.set('sum_constraints', len(sum_constraints))
+
+        return atoms, ground_rules, atom_uses, sum_constraints
+
+    def _ground(self):
         engine = srli.engine.psl.engine.PSL(self._relations, self._rules, options = self._options)
-        ground_program = engine.ground(ignore_priors = True, ignore_sum_constraint = True, get_all_atoms = True)
+        return engine.ground(ignore_priors = True, ignore_sum_constraint = True, get_all_atoms = True)
+
+    def _update_ground_program(self):
+        """
+        Bring the kept ground program up-to-date with the data (regrounding from scratch only when it has to).
+        Only the ground rules are kept between solves,
+        the atoms (which hold the search state) and the indexes over them are rebuilt every time.
+        Returns the same as _process_ground_program().
+        """
+
+        weights = [rule.weight() for rule in self._rules]
+
+        update = None
+        if ((self._ground_program is not None) and (weights == self._ground_weights)):
+            with self._instrumentation.phase('update_ground_program'):
+                update = self._ground_program.update()
+
+        if (update is None):
+            with self._instrumentation.phase('ground'):
+                ground_program = self._ground()
+                self._ground_program = srli.engine.grounding.GroundProgram(self._relations, self._rules, ground_program, all_atoms = True)
+
+            self._ground_weights = weights
+            self._made_rules = {}
+
+            removed = {}
+            added = list(self._ground_program.ground_rules.keys())
+        else:
+            removed, added = update
+            print("Updating the ground program -- Removed: %d, Added: %d." % (len(removed), len(added)))
 
+        self._instrumentation.count('removed_ground_rules', len(removed))
+        self._instrumentation.count('added_ground_rules', len(added))
+
+        with self._instrumentation.phase('process_ground_program'):
+            for ground_rule_id in removed:
+                self._made_rules.pop(ground_rule_id)
+
+            for ground_rule_id in added:
+                self._made_rules[ground_rule_id] = self._make_rule(self._ground_program.ground_rules[ground_rule_id])
+
+            relation_map = {relation.name().upper() : relation for relation in self._relations}
+            atoms = {atom_id : DiscreteWeightedSolver._Atom(atom, relation_map, self._rng) for (atom_id, atom) in self._ground_program.atoms.items()}
+
+            return self._index_ground_program(atoms, list(self._made_rules.values()))
+
+    def _process_ground_program(self, ground_program):
         relation_map = {relation.name().upper() : relation for relation in self._relations}
 
         atoms = {int(atom_id) : DiscreteWeightedSolver._Atom(atom, relation_map, self._rng) for (atom_id, atom) in ground_program['atoms'].items()}
         ground_rules = [self._make_rule(ground_rule) for ground_rule in ground_program['groundRules']]
 
+        return self._index_ground_program(atoms, ground_rules)
+
+    def _index_ground_program(self, atoms, ground_rules):
+        """
+        Map atoms to the ground rules that use them, and collect the (unsolved) sum constraints.
+        Returns: (atoms, ground_rules, atom_uses, sum_constraints)
+        """
+
         # {atom_id: [ground_rule_index, ...], ...}
         atom_uses = {}
 
@@ -290,10 +519,11 @@ class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
         return atoms, ground_rules, atom_uses, sum_constraints
 
     class _LogicalRule(object):
-        def __init__(self, atom_ids, coefficients, weight):
+        def __init__(self, atom_ids, coefficients, weight, rule_index = None):
             self.atom_ids = list(atom_ids)
             self.coefficients = coefficients
             self.weight = weight
+            self.rule_index = rule_index
 
         def loss(self, atoms):
             for i in range(len(self.atom_ids)):
@@ -308,12 +538,13 @@ class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
             return self.weight
 
     class _ArithmeticRule(object):
-        def __init__(self, atom_ids, coefficients, constant, operator, weight):
+        def __init__(self, atom_ids, coefficients, constant, operator, weight, rule_index = None):
             self.atom_ids = list(atom_ids)
             self.coefficients = list(coefficients)
             self.constant = constant
             self.operator = operator
             self.weight = weight
+            self.rule_index = rule_index
 
         def loss(self, atoms):
             atom_sum = 0.0
@@ -345,9 +576,10 @@ class DiscreteWeightedSolver(srli.engine.base.BaseEngine):
             weight = DiscreteWeightedSolver.HARD_WEIGHT
 
         if (ground_info['operator'] == '|'):
-            return DiscreteWeightedSolver._LogicalRule(ground_info['atoms'], ground_info['coefficients'], weight)
+            return DiscreteWeightedSolver._LogicalRule(ground_info['atoms'], ground_info['coefficients'], weight, ground_info['ruleIndex'])
 
-        return DiscreteWeightedSolver._ArithmeticRule(ground_info['atoms'], ground_info['coefficients'], ground_info['constant'], ground_info['operator'], weight)
+        return DiscreteWeightedSolver._ArithmeticRule(ground_info['atoms'], ground_info['coefficients'], ground_info['constant'], ground_info['operator'],
+                weight, ground_info['ruleIndex'])
 
     class _Atom(object):
         def __init__(self, ground_info, relation_map, rng):
@@ -2,6 +2,7 @@ import abc
 import math
 
 import srli.engine.base
+import srli.engine.grounding
 import srli.engine.psl.engine
 import srli.rule
 
@@ -11,24 +12,62 @@ HARD_WEIGHT = 1000.0
 class BaseMLN(srli.engine.base.BaseEngine):
     """
     The common base for a basic implementation of MLNs with inference using MaxWalkSat.
+    If |incremental|, then the ground program is kept between solves,
+    and only the parts touched by data deltas (see srli.relation.Relation.insert_data()) are reground.
     """
 
-    def __init__(self, relations, rules, **kwargs):
+    def __init__(self, relations, rules, incremental = False, **kwargs):
         super().__init__(relations, rules, **kwargs)
 
+        self._incremental = incremental
+
+        # Only kept when incremental.
+        # srli.engine.grounding.GroundProgram
+        self._ground_program = None
+        # {ground_rule_id: GroundRule (or None if trivial), ...}
+        self._processed_ground_rules = None
+        # The rule weights that the processed ground rules were built with.
+        self._ground_weights = None
+
     def solve(self, **kwargs):
-        # Specifically ground with only hard constraints so arithmetic == is not turned into <= and >=.
-        grounding_rules = [srli.rule.Rule(rule.text()) for rule in self._rules]
-        engine = srli.engine.psl.engine.PSL(self._relations, grounding_rules, options = self._options)
-        ground_program = engine.ground(ignore_priors = True, ignore_sum_constraint = True)
+        return self._solve_ground(self._prep(), **kwargs)
+
+    def _prep(self):
+        if (self._incremental):
+            return self._update_ground_program()
+
+        with self._instrumentation.phase('ground'):
+            ground_program = self._ground()
 
-        ground_rules, atoms = self._process_ground_program(ground_program)
+        with self._instrumentation.phase('process_ground_program'):
+            return self._process_ground_program(ground_program)
+
+    def _solve_ground(self, ground, **kwargs):
+        ground_rules, atoms = ground
+
+        self._instrumentation.set('ground_rules', len(ground_rules))
+        self._instrumentation.set('atoms', len(atoms))
 
         print("Building an MLN with %d ground rules and %d variables." % (len(ground_rules), len(atoms)))
 
-        atom_values = self.reason(ground_rules, atoms, **kwargs)
+        with self._instrumentation.phase('reason'):
+            atom_values = self.reason(ground_rules, atoms, **kwargs)
+
+        results = self._create_results(atom_values, atoms)
+        self._previous_results = results
+
+        return results
+
+    def _reweight(self, ground):
+        ground_rules, atoms = ground
+
+        # [weight, ...] (aligned with the rules).
+        weights = [(HARD_WEIGHT if (rule.weight() is None) else rule.weight()) for rule in self._rules]
 
-        return self._create_results(atom_values, atoms)
+        for ground_rule in ground_rules:
+            # Priors keep their weight.
+            if (ground_rule.rule_index != NEGATIVE_PRIOR_RULE_INDEX):
+                ground_rule.weight = weights[ground_rule.rule_index]
 
     # Offload learning to PSL.
     def learn(self, **kwargs):
@@ -41,6 +80,58 @@ class BaseMLN(srli.engine.base.BaseEngine):
     def reason(self, ground_rules, atoms, **kwargs):
         pass
 
+    def _grounding_rules(self):
+        # Specifically ground with only hard constraints so arithmetic == is not turned into <= and >=.
+        return [srli.rule.Rule(rule.text()) for rule in self._rules]
+
+    def _ground(self):
+        engine = srli.engine.psl.engine.PSL(self._relations, self._grounding_rules(), options = self._options)
+        return engine.ground(ignore_priors = True, ignore_sum_constraint = True)
+
+    def _update_ground_program(self):
+        """
+        Bring the kept ground program up-to-date with the data (regrounding from scratch only when it has to).
+        Returns the same as _process_ground_program().
+        """
+
+        weights = [rule.weight() for rule in self._rules]
+
+        update = None
+        if ((self._ground_program is not None) and (weights == self._ground_weights)):
+            with self._instrumentation.phase('update_ground_program'):
+                update = self._ground_program.update()
+
+        if (update is None):
+            with self._instrumentation.phase('ground'):
+                ground_program = self._ground()
+                self._ground_program = srli.engine.grounding.GroundProgram(self._relations, self._grounding_rules(), ground_program)
+
+            self._ground_weights = weights
+            self._processed_ground_rules = {}
+
+            removed = {}
+            added = list(self._ground_program.ground_rules.keys())
+        else:
+            removed, added = update
+            print("Updating the ground program -- Removed: %d, Added: %d." % (len(removed), len(added)))
+
+        self._instrumentation.count('removed_ground_rules', len(removed))
+        self._instrumentation.count('added_ground_rules', len(added))
+
+        atoms = self._ground_program.atoms
+
+        with self._instrumentation.phase('process_ground_program'):
+            for ground_rule_id in removed:
+                self._processed_ground_rules.pop(ground_rule_id)
+
+            for ground_rule_id in added:
+                raw_ground_rule = self._ground_program.ground_rules[ground_rule_id]
+                self._processed_ground_rules[ground_rule_id] = self._process_ground_rule(raw_ground_rule, atoms)
+
+        ground_rules = [ground_rule for ground_rule in self._processed_ground_rules.values() if (ground_rule is not None)]
+
+        return ground_rules, atoms
+
     def _get_initial_atom_value(self, relation):
         if (relation.has_negative_prior_weight()):
             return int(self._rng.random() < relation.get_negative_prior_weight())
@@ -106,52 +197,54 @@ class BaseMLN(srli.engine.base.BaseEngine):
 
 
         for raw_ground_rule in ground_program['groundRules']:
-            rule_index = raw_ground_rule['ruleIndex']
-            operator = raw_ground_rule['operator']
-            weight = self._rules[rule_index].weight()
-            constant = int(raw_ground_rule['constant'])
+            ground_rule = self._process_ground_rule(raw_ground_rule, ground_atoms)
+            if (ground_rule is not None):
+                ground_rules.append(ground_rule)
 
-            raw_coefficients = raw_ground_rule['coefficients']
-            raw_atoms = raw_ground_rule['atoms']
+        return ground_rules, ground_atoms
 
-            if (weight is None):
-                weight = HARD_WEIGHT
+    def _process_ground_rule(self, raw_ground_rule, ground_atoms):
+        """
+        Fold the observed values of a raw ground rule into its constant.
+        Returns a GroundRule, or None if the ground rule is trivial.
+        """
 
-            # TODO(eriq): An additional check for trivial rules can be useful here.
+        rule_index = raw_ground_rule['ruleIndex']
+        operator = raw_ground_rule['operator']
+        weight = self._rules[rule_index].weight()
+        constant = int(raw_ground_rule['constant'])
 
-            # Check the atoms for observed values (which will be folded into the constant) and trivality.
-            coefficients = []
-            atoms = []
-            skip = False
+        raw_coefficients = raw_ground_rule['coefficients']
+        raw_atoms = raw_ground_rule['atoms']
 
-            for i in range(len(raw_atoms)):
-                atom = ground_atoms[raw_atoms[i]]
-                coefficient = int(raw_coefficients[i])
+        if (weight is None):
+            weight = HARD_WEIGHT
 
-                if (atom['observed']):
-                    value = int(atom['value'])
+        # TODO(eriq): An additional check for trivial rules can be useful here.
 
-                    if (operator == '|'):
-                        # Skip trivials.
-                        if ((math.isclose(coefficient, 1.0) and math.isclose(value, 1.0))
-                                or (math.isclose(coefficient, -1.0) and math.isclose(value, 0.0))):
-                            skip = True
-                            break
+        # Check the atoms for observed values (which will be folded into the constant) and trivality.
+        coefficients = []
+        atoms = []
 
-                    constant -= (coefficient * value)
-                else:
-                    coefficients.append(coefficient)
-                    atoms.append(raw_atoms[i])
+        for i in range(len(raw_atoms)):
+            atom = ground_atoms[raw_atoms[i]]
+            coefficient = int(raw_coefficients[i])
 
-            if (skip):
-                continue
+            if (atom['observed']):
+                value = int(atom['value'])
 
-            ground_rule = GroundRule(rule_index, weight, atoms, coefficients, constant, operator)
+                if (operator == '|'):
+                    # Skip trivials.
+                    if ((math.isclose(coefficient, 1.0) and math.isclose(value, 1.0))
+                            or (math.isclose(coefficient, -1.0) and math.isclose(value, 0.0))):
+                        return None
 
-            ground_rule_index = len(ground_rules)
-            ground_rules.append(ground_rule)
+                constant -= (coefficient * value)
+            else:
+                coefficients.append(coefficient)
+                atoms.append(raw_atoms[i])
 
-        return ground_rules, ground_atoms
+        return GroundRule(rule_index, weight, atoms, coefficients, constant, operator)
 
 class GroundRule(object):
     def __init__(self, rule_index, weight, atoms, coefficients, constant, operator):
@@ -1,33 +1,74 @@
 import math
+import time
 
 import srli.engine.mln.base
 
 DEFAULT_MAX_TRIES = 3
 DEFAULT_NOISE = 0.05
-LOG_MOD = 50
 FLIP_MULTIPLIER = 2
 
 class NativeMLN(srli.engine.mln.base.BaseMLN):
     """
     A basic implementation of MLNs with inference using MaxWalkSat.
     If unspecified, the number of flips defaults to FLIP_MULTIPLIER x the number of unobserved atoms (similar to Tuffy).
+    Progress is reported as 'flip' events (every progress interval) and 'attempt' events (at the end of each attempt).
+    If |max_time| (seconds) is given, then search stops once that much time has been spent reasoning
+    (and the best values found so far are returned).
+    If |warm_start| is given (see BaseEngine._get_warm_start_values()), then search starts from those values
+    (with atoms that have no value getting an initial value as usual),
+    and later attempts only perturb the neighborhood of the changes:
+    atoms without a value and atoms in ground rules that were added or removed since the previous solve
+    (or, without an earlier solve to compare against (see BaseEngine._tracks_ground_rules()),
+    atoms in ground rules that the warm start values do not satisfy).
+    The number of flips then defaults to FLIP_MULTIPLIER x the size of that neighborhood.
     """
 
     def __init__(self, relations, rules, **kwargs):
         super().__init__(relations, rules, **kwargs)
 
-    def reason(self, ground_rules, atoms, max_flips = None, max_tries = DEFAULT_MAX_TRIES, noise = DEFAULT_NOISE, **kwargs):
+    def reason(self, ground_rules, atoms, max_flips = None, max_tries = DEFAULT_MAX_TRIES, noise = DEFAULT_NOISE, max_time = None,
+            warm_start = None, **kwargs):
         atom_rule_map = self._map_atoms(ground_rules)
 
+        changed_atoms = None
+        if (self._tracks_ground_rules(warm_start)):
+            changed_atoms = self._diff_ground_rules(self._ground_rule_keys(ground_rules, atoms))
+
+        start_values, neighborhood = self._warm_start(warm_start, ground_rules, atoms, atom_rule_map, changed_atoms)
+
         if (max_flips is None):
-            max_flips = FLIP_MULTIPLIER * len(atom_rule_map)
+            if (start_values is None):
+                max_flips = FLIP_MULTIPLIER * len(atom_rule_map)
+            else:
+                max_flips = FLIP_MULTIPLIER * len(neighborhood)
+
+        self._start_progress()
+
+        deadline = None
+        if (max_time is not None):
+            deadline = time.perf_counter() + max_time
 
         best_atom_values = None
         best_total_loss = None
         best_attempt = None
 
+        # The warm start values are a candidate themselves (attempt 0), since an attempt may end up worse than where it started.
+        if (start_values is not None):
+            best_atom_values = dict(start_values)
+            best_total_loss = sum([ground_rule.loss(start_values) for ground_rule in ground_rules])
+            best_attempt = 0
+
         for attempt in range(1, max_tries + 1):
-            atom_values, total_loss = self._inference_attempt(attempt, max_flips, noise, ground_rules, atoms, atom_rule_map)
+            self._instrumentation.count('attempts')
+
+            initial_values = None
+            if (start_values is not None):
+                initial_values = dict(start_values)
+                if (attempt > 1):
+                    for atom_index in neighborhood:
+                        initial_values[atom_index] = self._get_initial_atom_value(atoms[atom_index]['relation'])
+
+            atom_values, total_loss = self._inference_attempt(attempt, max_flips, noise, ground_rules, atoms, atom_rule_map, best_total_loss, deadline, initial_values)
             if (best_total_loss is None or total_loss < best_total_loss):
                 best_total_loss = total_loss
                 best_atom_values = atom_values
@@ -36,14 +77,21 @@ class NativeMLN(srli.engine.mln.base.BaseMLN):
             if (math.isclose(total_loss, 0.0)):
                 break
 
+            if ((deadline is not None) and (time.perf_counter() >= deadline)):
+                print("MLN Inference - Time limit (%0.2fs) reached." % (max_time))
+                break
+
         print("MLN Inference Complete - Best Attempt: %d, Loss: %f." % (best_attempt, best_total_loss))
 
         return best_atom_values
 
-    def _inference_attempt(self, attempt, max_flips, noise, ground_rules, atoms, atom_rule_map):
-        atom_values = {}
-        for atom_index in atom_rule_map:
-            atom_values[atom_index] = self._get_initial_atom_value(atoms[atom_index]['relation'])
+    def _inference_attempt(self, attempt, max_flips, noise, ground_rules, atoms, atom_rule_map, best_total_loss = None, deadline = None, initial_values = None):
+        if (initial_values is not None):
+            atom_values = initial_values
+        else:
+            atom_values = {}
+            for atom_index in atom_rule_map:
+                atom_values[atom_index] = self._get_initial_atom_value(atoms[atom_index]['relation'])
 
         total_loss = 0.0
         for ground_rule in ground_rules:
@@ -51,12 +99,22 @@ class NativeMLN(srli.engine.mln.base.BaseMLN):
 
         print("MLN Inference - Attempt: %d, Iteration 0, Loss: %f, Max Flips: %d." % (attempt, total_loss, max_flips))
 
+        # The best loss seen in this attempt (or any previous attempt).
+        best_loss = total_loss
+        if (best_total_loss is not None):
+            best_loss = min(best_loss, best_total_loss)
+
+        start_time = time.perf_counter()
+
         flip = 1
         for flip in range(1, max_flips + 1):
             if (math.isclose(total_loss, 0.0)):
                 print("Full satisfaction found.")
                 break
 
+            if ((deadline is not None) and (time.perf_counter() >= deadline)):
+                break
+
             # Pick a random unsatisfied ground rule.
             ground_rule_index = None
             while (ground_rule_index is None or math.isclose(ground_rules[ground_rule_index].loss(atom_values), 0.0)):
@@ -95,13 +153,77 @@ class NativeMLN(srli.engine.mln.base.BaseMLN):
             for ground_rule in ground_rules:
                 total_loss += ground_rule.loss(atom_values)
 
-            if (flip % LOG_MOD == 0):
-                print("MLN Inference - Attempt: %d, Iteration %d, Loss: %f." % (attempt, flip, total_loss))
+            if (total_loss < best_loss):
+                best_loss = total_loss
+
+            if ((self._progress is not None) and (flip % self._progress.interval == 0)):
+                self._report_progress('flip', attempt = attempt, flip = flip, loss = total_loss, best_loss = best_loss,
+                        flips_per_sec = flip / max(1e-9, time.perf_counter() - start_time))
 
         print("MLN Inference Attempt Complete - Attempt: %d, Iteration %d, Loss: %f." % (attempt, flip, total_loss))
+        self._instrumentation.count('flips', flip)
+
+        if (self._progress is not None):
+            self._report_progress('attempt', attempt = attempt, flip = flip, loss = total_loss, best_loss = best_loss,
+                    flips_per_sec = flip / max(1e-9, time.perf_counter() - start_time))
 
         return atom_values, total_loss
 
+    def _warm_start(self, warm_start, ground_rules, atoms, atom_rule_map, changed_atoms):
+        """
+        Returns: ({atom_index: value, ...} to start from, {atom_index, ...} in the neighborhood of changes),
+            or (None, None) for a cold start.
+        """
+
+        previous_values = self._get_warm_start_values(warm_start)
+        if (previous_values is None):
+            return None, None
+
+        start_values = {}
+        neighborhood = set()
+
+        for atom_index in atom_rule_map:
+            key = (atoms[atom_index]['predicate'], tuple(atoms[atom_index]['arguments']))
+
+            if (key in previous_values):
+                start_values[atom_index] = previous_values[key]
+            else:
+                start_values[atom_index] = self._get_initial_atom_value(atoms[atom_index]['relation'])
+                neighborhood.add(atom_index)
+
+            if ((changed_atoms is not None) and (key in changed_atoms)):
+                neighborhood.add(atom_index)
+
+        if (changed_atoms is None):
+            for ground_rule in ground_rules:
+                if (not math.isclose(ground_rule.loss(start_values), 0.0)):
+                    neighborhood.update(ground_rule.atoms)
+
+        print("MLN Inference - Warm start with %d of %d atoms in the neighborhood of changes." % (len(neighborhood), len(atom_rule_map)))
+        self._instrumentation.set('warm_start_neighborhood', len(neighborhood))
+
+        return start_values, neighborhood
+
+    def _ground_rule_keys(self, ground_rules, atoms):
+        """
+        See BaseEngine._diff_ground_rules().
+        """
+
+        # {atom_index: (predicate, (arg, ...)), ...}
+        atom_keys = {}
+
+        keys = set()
+
+        for ground_rule in ground_rules:
+            for atom_index in ground_rule.atoms:
+                if (atom_index not in atom_keys):
+                    atom_keys[atom_index] = (atoms[atom_index]['predicate'], tuple(atoms[atom_index]['arguments']))
+
+            atom_entries = tuple(sorted([(atom_keys[atom_index], coefficient) for (atom_index, coefficient) in zip(ground_rule.atoms, ground_rule.coefficients)]))
+            keys.add((ground_rule.rule_index, ground_rule.operator, ground_rule.constant, atom_entries))
+
+        return keys
+
     def _map_atoms(self, ground_rules):
         atom_rule_map = {}
 
@@ -1,22 +1,54 @@
+import collections
 import math
 
-import pysat.examples.rc2
-import pysat.formula
-
 import srli.engine.mln.base
 
 class PySATMLN(srli.engine.mln.base.BaseMLN):
     """
     A basic implementation of MLNs with inference using PySAT as a SAT solver.
+    If |persistent|, then a MaxSAT solver session is kept between solves (see _solve_session()).
     """
 
-    def __init__(self, relations, rules, **kwargs):
+    def __init__(self, relations, rules, persistent = False, **kwargs):
         super().__init__(relations, rules, **kwargs)
 
+        self._persistent = persistent
+
+        # Only used when persistent.
+        # Atoms keep the same variable across solves (even when the ground program is rebuilt).
+        # {(predicate, (arg, ...)): variable, ...}
+        self._variables = {}
+        # pysat.examples.rc2.RC2Stratified
+        self._session = None
+        # Everything loaded into the session: Counter({(clause, weight), ...}).
+        self._session_clauses = None
+        # The values from the last model: {variable: bool, ...}.
+        self._phases = {}
+
     def reason(self, ground_rules, atoms, **kwargs):
-        ground_rules, atoms = self._adjust_atom_ids(ground_rules, atoms)
+        variables = None
+        if (self._persistent):
+            variables = self._get_variables(atoms)
+
+        ground_rules, atoms = self._adjust_atom_ids(ground_rules, atoms, variables)
 
         cnf = self._create_cnf(ground_rules, atoms)
+
+        self._instrumentation.set('hard_clauses', len(cnf.hard))
+        self._instrumentation.set('soft_clauses', len(cnf.soft))
+        self._instrumentation.set('cardinality_constraints', len(cnf.atms))
+
+        if (self._persistent):
+            solution = self._solve_session(cnf)
+
+            # {variable: atom_id, ...}
+            atom_ids = {variable : atom_id for (atom_id, variable) in variables.items()}
+
+            # The session may know about variables that are not in this ground program.
+            return {atom_ids[abs(variable)] : (0.0 if variable < 0 else 1.0) for variable in solution if (abs(variable) in atom_ids)}
+
+        import pysat.examples.rc2
+
         rc2 = pysat.examples.rc2.RC2Stratified(cnf, solver = 'Gluecard4',
                 adapt = True, exhaust = True, minz = True, trim = 10)
         solution = rc2.compute()
@@ -25,16 +57,108 @@ class PySATMLN(srli.engine.mln.base.BaseMLN):
         # Remember to re-adjust the atom ids.
         return {(abs(atom_id) - 1) : (0.0 if atom_id < 0.0 else 1.0) for atom_id in solution}
 
-    # PySat does not allow 0 for an id, so we need to add 1 to all atom ids.
-    def _adjust_atom_ids(self, ground_rules, atoms):
-        for ground_rule in ground_rules:
-            ground_rule.atoms = [atom_id + 1 for atom_id in ground_rule.atoms]
+    def close(self):
+        if (self._session is not None):
+            self._session.delete()
+            self._session = None
+
+        self._session_clauses = None
+
+    def _get_variables(self, atoms):
+        """
+        Get the (persistent) session variable for each atom.
+        Returns: {atom_id: variable, ...}
+        """
+
+        variables = {}
+
+        for (atom_id, atom) in atoms.items():
+            key = (atom['predicate'], tuple(atom['arguments']))
+            if (key not in self._variables):
+                self._variables[key] = len(self._variables) + 1
+
+            variables[atom_id] = self._variables[key]
+
+        return variables
+
+    def _solve_session(self, cnf):
+        """
+        Solve with the kept session if the only changes since the last solve are added clauses,
+        so all the cores and learned clauses the solver has found so far are reused.
+        Otherwise (e.g., some evidence changed the folded clauses), start a new session
+        using the values from the last model as phase hints.
 
-        new_atoms = {atom_id + 1 : atom for (atom_id, atom) in atoms.items()}
+        Evidence is still folded into the clauses (instead of being passed as assumptions):
+        RC2 relaxes the cores it finds into new constraints,
+        and a core found under some evidence is no longer valid once that evidence is retracted.
+        For the same reason, the session never hardens soft clauses (nohard),
+        since that is only valid for the soft clauses known at the time.
+        """
+
+        import pysat.examples.rc2
+
+        # Counter({(clause, weight), ...})
+        # Cardinality constraints are always hard (as (literals, bound)).
+        clauses = collections.Counter()
+        clauses.update([(tuple(clause), None) for clause in cnf.hard])
+        clauses.update([(tuple(clause), weight) for (clause, weight) in zip(cnf.soft, cnf.wght)])
+        clauses.update([((tuple(literals), bound), None) for (literals, bound) in cnf.atms])
+
+        added = None
+        if (self._session is not None):
+            added = clauses - self._session_clauses
+            # Empty (always unsatisfied) clauses cannot be added to a session.
+            if ((len(self._session_clauses - clauses) > 0) or any([len(clause) == 0 for (clause, weight) in added])):
+                added = None
+
+        if (added is None):
+            self.close()
+
+            self._session = pysat.examples.rc2.RC2Stratified(cnf, solver = 'Gluecard4',
+                    adapt = True, exhaust = True, minz = True, trim = 10, nohard = True)
+
+            # Only variables in the formula (anything else would clash with the session's own variables).
+            hints = [(variable if value else -variable) for (variable, value) in self._phases.items() if (variable <= cnf.nv)]
+            self._session.oracle.set_phases(hints)
+
+            self._instrumentation.count('new_sessions')
+        else:
+            # Soft unit clauses use their literal as their selector:
+            # RC2 adds to the weight of a selector that is still active, and starts a new one for a selector already relaxed into a core.
+            for ((clause, weight), count) in added.items():
+                if ((weight is None) and isinstance(clause[0], tuple)):
+                    clause = (list(clause[0]), clause[1])
+
+                for i in range(count):
+                    self._session.add_clause(clause, weight = weight)
+
+            print("Reusing the MaxSAT session -- Added clauses: %d." % (sum(added.values())))
+            self._instrumentation.count('reused_sessions')
+            self._instrumentation.count('session_added_clauses', sum(added.values()))
+
+        self._session_clauses = clauses
+
+        solution = self._session.compute()
+        self._phases.update({abs(variable) : (variable > 0) for variable in solution})
+
+        return solution
+
+    # PySat does not allow 0 for an id, so we need to add 1 to all atom ids (or use the given variables: {atom_id: variable, ...}).
+    # Ground rules are copied (instead of modified), since they may be kept around between solves.
+    def _adjust_atom_ids(self, ground_rules, atoms, variables = None):
+        if (variables is None):
+            variables = {atom_id : atom_id + 1 for atom_id in atoms}
+
+        ground_rules = [srli.engine.mln.base.GroundRule(ground_rule.rule_index, ground_rule.weight, [variables[atom_id] for atom_id in ground_rule.atoms],
+                ground_rule.coefficients, ground_rule.constant, ground_rule.operator) for ground_rule in ground_rules]
+
+        new_atoms = {variables[atom_id] : atom for (atom_id, atom) in atoms.items()}
 
         return ground_rules, new_atoms
 
     def _create_cnf(self, ground_rules, atoms):
+        import pysat.formula
+
         cnf = pysat.formula.WCNFPlus()
 
         # Add in priors.
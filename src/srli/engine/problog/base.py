@@ -1,10 +1,165 @@
 import math
-
-import problog
+import multiprocessing
+import os
+import re
+import signal
 
 import srli.engine.base
 import srli.engine.psl.engine
 
+# Exact inference via knowledge compilation.
+BACKEND_EXACT = 'exact'
+# Anytime k-best proof search, stopped once the lower and upper bounds are within a tolerance.
+BACKEND_KBEST = 'kbest'
+# Monte Carlo estimates from forward sampling.
+BACKEND_SAMPLE = 'sample'
+# Exact inference on each query's neighbourhood (up to some depth), with the rest of the program fixed.
+# This backend works on the ground program, not the program text, so it is handled by the engines.
+BACKEND_BOUNDED_DEPTH = 'bounded_depth'
+
+BACKENDS = [BACKEND_EXACT, BACKEND_KBEST, BACKEND_SAMPLE, BACKEND_BOUNDED_DEPTH]
+
+DEFAULT_KBEST_CONVERGENCE = 1e-3
+DEFAULT_NUM_SAMPLES = 1000
+
+def evaluate_program(text, backend = BACKEND_EXACT,
+        kbest_convergence = DEFAULT_KBEST_CONVERGENCE, num_samples = DEFAULT_NUM_SAMPLES):
+    """
+    Compile and evaluate a ProbLog program.
+    This is a module-level function so that it can be dispatched to worker processes.
+    Returns: {query_str: probability, ...}
+    """
+
+    # print(text)
+
+    import problog
+    import problog.engine
+    import problog.program
+    import problog.tasks.sample
+
+    # A program may use an atom (only in rule bodies) of a predicate that it never defines
+    # (e.g. a single component of a larger program), those atoms are just false.
+    options = {'unknown': problog.engine.DefaultEngine.UNKNOWN_FAIL}
+
+    try:
+        program = problog.program.PrologString(text)
+
+        if (backend == BACKEND_EXACT):
+            raw_results = problog.get_evaluatable().create_from(program, **options).evaluate()
+        elif (backend == BACKEND_KBEST):
+            raw_results = problog.get_evaluatable('kbest').create_from(program, **options).evaluate(convergence = kbest_convergence)
+
+            # Unconverged queries come back as (lower bound, upper bound).
+            for (key, value) in raw_results.items():
+                if (isinstance(value, tuple)):
+                    raw_results[key] = (value[0] + value[1]) / 2.0
+        elif (backend == BACKEND_SAMPLE):
+            # Queries that were never true in any sample are not reported.
+            raw_results = {query : 0.0 for query in re.findall(r'^query\((.+)\) \.$', text, flags = re.MULTILINE)}
+            raw_results.update({str(key) : value for (key, value) in problog.tasks.sample.estimate(program, n = num_samples, **options).items()})
+        else:
+            raise ValueError("Unknown (text) ProbLog backend: '%s'." % (backend))
+    except Exception as ex:
+        print("Failed to run ProbLog program:")
+        print('---')
+        print(text)
+        print('---')
+        raise ex
+
+    return {str(key): float(value) for (key, value) in raw_results.items()}
+
+def evaluate_program_bounded(text, time_limit = None, memory_limit = None, **kwargs):
+    """
+    Run evaluate_program() in a child process that is limited to |time_limit| seconds (wall) and |memory_limit| MB (address space).
+    Any helper processes (e.g. knowledge compilers) are held to the same limits.
+    The memory limit needs the resource module, so it is not enforced where that is missing (e.g. Windows).
+    Returns None if the budget was exceeded or the evaluation otherwise failed.
+    """
+
+    receiver, sender = multiprocessing.Pipe(duplex = False)
+    process = multiprocessing.Process(target = _bounded_worker, args = (sender, text, memory_limit, kwargs))
+    process.start()
+    sender.close()
+
+    # The child also does this itself, but it may not get to it before the time limit runs out.
+    _set_process_group(process)
+
+    try:
+        if (not receiver.poll(time_limit)):
+            print("ProbLog evaluation exceeded the time limit (%s seconds)." % (str(time_limit)))
+            return None
+
+        try:
+            status, payload = receiver.recv()
+        except EOFError:
+            print("ProbLog evaluation died (exit code: %s), likely from exceeding the memory limit." % (str(process.exitcode)))
+            return None
+
+        if (status != 'ok'):
+            print("ProbLog evaluation failed within the budget: %s" % (payload))
+            return None
+
+        return payload
+    finally:
+        receiver.close()
+
+        if (process.is_alive()):
+            _kill_process_group(process)
+
+        process.join()
+
+def _set_process_group(process):
+    """
+    Put |process| in its own process group (if it is still our fork and has not done so already).
+    """
+
+    if (not hasattr(os, 'setpgid')):
+        return
+
+    try:
+        os.setpgid(process.pid, process.pid)
+    except OSError:
+        # The child already exec'd (it sets its own group), is not our direct child (e.g. a forkserver), or already exited.
+        pass
+
+def _kill_process_group(process):
+    """
+    Kill |process| along with any helpers in its process group.
+    """
+
+    if (hasattr(os, 'killpg')):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except (ProcessLookupError, PermissionError):
+            # The group does not exist (yet), so the child has not started any helpers.
+            pass
+
+    process.kill()
+
+def _bounded_worker(connection, text, memory_limit, kwargs):
+    # Use our own process group so the parent can kill any helpers along with us.
+    if (hasattr(os, 'setpgrp')):
+        os.setpgrp()
+
+    if (memory_limit is not None):
+        try:
+            import resource
+        except ImportError:
+            # E.g. Windows, run without a memory cap.
+            resource = None
+
+        if (resource is not None):
+            limit = int(memory_limit * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    try:
+        connection.send(('ok', evaluate_program(text, **kwargs)))
+    except BaseException as ex:
+        connection.send(('error', repr(ex)))
+    finally:
+        connection.close()
+
 class BaseGroundProbLog(srli.engine.base.BaseEngine):
     """
     An abstract engine base that works with pre-grounding programs.
@@ -15,6 +170,13 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
     def __init__(self, relations, rules, **kwargs):
         super().__init__(relations, rules, **kwargs)
 
+        # The backend that produced the current value of each atom.
+        # {atom_id: backend, ...}
+        self._atom_backends = {}
+
+        # {relation: [backend, ...], ...}
+        self._result_backends = {}
+
     def learn(self, **kwargs):
         engine = srli.engine.psl.engine.PSL(self._relations, self._rules, options = self._options)
         engine.learn()
@@ -22,20 +184,14 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
         return self
 
     def _run(self, text, query_atom_ids, atoms):
-        # print(text)
+        return self._apply_results(evaluate_program(text), query_atom_ids, atoms)
 
-        try:
-            program = problog.program.PrologString(text)
-            problog_program = problog.get_evaluatable().create_from(program)
-            raw_results = problog_program.evaluate()
-        except Exception as ex:
-            print("Failed to run ProbLog program:")
-            print('---')
-            print(text)
-            print('---')
-            raise ex
-
-        raw_results = {str(key): float(value) for (key, value) in raw_results.items()}
+    def _apply_results(self, raw_results, query_atom_ids, atoms, deltas = None):
+        """
+        Write the results of a ProbLog evaluation into the query atoms.
+        If supplied, |deltas| will be filled with the (absolute) movement of each query atom: {atom_id: delta, ...}.
+        Returns the total (absolute) movement of the query atoms.
+        """
 
         movement = 0.0
 
@@ -46,11 +202,25 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
             if (atom_str not in query_map):
                 raise ValueError("Could not locate query result (%s), queries: (%s)." % (atom_str, ', '.join(query_map.keys())))
 
-            movement += abs(atoms[query_map[atom_str]].value - value)
+            delta = abs(atoms[query_map[atom_str]].value - value)
+            movement += delta
             atoms[query_map[atom_str]].value = value
 
+            if (deltas is not None):
+                deltas[query_map[atom_str]] = delta
+
         return movement
 
+    def _get_target_atom_ids(self, atom_id, atoms, sum_constraints):
+        target_atom_ids = set([atom_id])
+
+        # All atoms sharing a sum constraint with the main target also gets to be a target.
+        for key in atoms[atom_id].sum_constraints:
+            for other_atom_id in sum_constraints[key]:
+                target_atom_ids.add(other_atom_id)
+
+        return target_atom_ids
+
     def _write_queries(self, query_atom_ids, atoms):
         program = ['% Queries', '']
 
@@ -109,8 +279,18 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
 
         return program
 
+    def backends(self):
+        """
+        Get the backend that produced each answer from the last solve().
+        Atoms that did not participate in inference (and were given a default value) have a backend of None.
+        Returns: {relation: [backend, ...], ...}, aligned with the rows of the results.
+        """
+
+        return self._result_backends
+
     def _create_results(self, atoms):
         results = {}
+        self._result_backends = {}
 
         # {(atom arg, ...): atom_id, ...}
         atom_map = {tuple(atom.arguments) : atom_id for (atom_id, atom) in atoms.items()}
@@ -122,26 +302,62 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
             data = relation.get_unobserved_data()
 
             values = []
+            backends = []
 
             for row in data:
                 key = tuple(row)
 
                 if ((key in atom_map) and (atom_map[key] in atoms)):
                     value = float(atoms[atom_map[key]].value)
+                    backend = self._atom_backends.get(atom_map[key])
                 else:
                     # An atom not participating in any used ground rules just get a default value.
                     value = float(self._rng.randint(0, 1))
+                    backend = None
 
                 values.append(list(row) + [value])
+                backends.append(backend)
 
             results[relation] = values
+            self._result_backends[relation] = backends
 
         return results
 
     def _prep(self):
-        engine = srli.engine.psl.engine.PSL(self._relations, self._rules, options = self._options)
-        ground_program = engine.ground(ignore_priors = True, ignore_sum_constraint = True, get_all_atoms = True)
+        with self._instrumentation.phase('prep'):
+            with self._instrumentation.phase('ground'):
+                engine = srli.engine.psl.engine.PSL(self._relations, self._rules, options = self._options)
+                ground_program = engine.ground(ignore_priors = True, ignore_sum_constraint = True, get_all_atoms = True)
+
+            with self._instrumentation.phase('process_ground_program'):
+                atoms, ground_rules, atom_uses, sum_constraints = self._process_ground_program(ground_program)
+
+        self._instrumentation.set('ground_rules', len(ground_rules))
+        self._instrumentation.set('atoms', len(atoms))
+        self._instrumentation.set('unobserved_atoms', len(atom_uses))
+        self._instrumentation.set('sum_constraints', len(sum_constraints))
+
+        return atoms, ground_rules, atom_uses, sum_constraints
+
+    def _reweight(self, ground):
+        """
+        Rule weights are not (yet) written into the ProbLog programs, but the ground rules are kept up-to-date anyways.
+        """
+
+        atoms, ground_rules, atom_uses, sum_constraints = ground
+
+        # [weight, ...] (aligned with the rules).
+        weights = [(BaseGroundProbLog.HARD_WEIGHT if (rule.weight() is None) else rule.weight()) for rule in self._rules]
+
+        for ground_rule in ground_rules:
+            ground_rule.weight = weights[ground_rule.rule_index]
+
+        # Unobserved atoms start from a random value again.
+        for atom in atoms.values():
+            if (not atom.observed):
+                atom.value = float(self._rng.randint(0, 1))
 
+    def _process_ground_program(self, ground_program):
         relation_map = {relation.name().upper() : relation for relation in self._relations}
 
         atoms = {int(atom_id) : BaseGroundProbLog._Atom(atom, relation_map, self._rng) for (atom_id, atom) in ground_program['atoms'].items()}
@@ -215,10 +431,11 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
         return atoms, ground_rules, atom_uses, sum_constraints
 
     class _LogicalRule(object):
-        def __init__(self, atom_ids, coefficients, weight):
+        def __init__(self, atom_ids, coefficients, weight, rule_index = None):
             self.atom_ids = list(atom_ids)
             self.coefficients = coefficients
             self.weight = weight
+            self.rule_index = rule_index
 
         # TODO(eriq): Weight is not included.
         def to_problog(self, atoms, queries, rng):
@@ -242,7 +459,8 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
                 head_atom_id = possible_heads[0]
 
             head_atom = atoms[head_atom_id]
-            body_atoms = [atoms[atom_id] for atom_id in (set(self.atom_ids) - set([head_atom_id]))]
+            # Keep the rule's own order, so groundings of the same rule are written the same way (see NonCollectiveProbLog._canonicalize()).
+            body_atoms = [atoms[atom_id] for atom_id in dict.fromkeys(self.atom_ids) if (atom_id != head_atom_id)]
 
             return "1.0 :: %s :- %s ." % (head_atom.to_problog(), ', '.join([atom.to_problog() for atom in body_atoms]))
 
@@ -254,12 +472,13 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
         TYPE_BINARY_EQUALITY = 'binary_equality'
         TYPE_FIXED_BINARY_VALUE = 'fixed_binary_value'
 
-        def __init__(self, atom_ids, coefficients, constant, operator, weight):
+        def __init__(self, atom_ids, coefficients, constant, operator, weight, rule_index = None):
             self.atom_ids = list(atom_ids)
             self.coefficients = list(coefficients)
             self.constant = constant
             self.operator = operator
             self.weight = weight
+            self.rule_index = rule_index
 
             self._rule_type = None
 
@@ -317,9 +536,10 @@ class BaseGroundProbLog(srli.engine.base.BaseEngine):
             weight = BaseGroundProbLog.HARD_WEIGHT
 
         if (ground_info['operator'] == '|'):
-            return BaseGroundProbLog._LogicalRule(ground_info['atoms'], ground_info['coefficients'], weight)
+            return BaseGroundProbLog._LogicalRule(ground_info['atoms'], ground_info['coefficients'], weight, ground_info['ruleIndex'])
 
-        return BaseGroundProbLog._ArithmeticRule(ground_info['atoms'], ground_info['coefficients'], ground_info['constant'], ground_info['operator'], weight)
+        return BaseGroundProbLog._ArithmeticRule(ground_info['atoms'], ground_info['coefficients'], ground_info['constant'], ground_info['operator'],
+                weight, ground_info['ruleIndex'])
 
     class _Atom(object):
         def __init__(self, ground_info, relation_map, rng):
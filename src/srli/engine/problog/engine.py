@@ -1,33 +1,305 @@
+import concurrent.futures
+import functools
+
 import srli.engine.problog.base
 
 class ProbLog(srli.engine.problog.base.BaseGroundProbLog):
     """
     A basic implementation that builds a problog model and calls into the Python interface.
+
+    By default, exact inference is run on the full program with no limits.
+    A per-call budget can be set with |time_limit| (seconds) and/or |memory_limit| (MB).
+    If the main backend does not finish within the budget, the engine falls back to |fallback_backend| (which is run without limits).
+    The backend that produced each answer is available through backends() after solving.
+
+    Unless |split_components| is disabled, the ground program is first split into connected components of unobserved atoms
+    (observations are independent probabilistic facts, so they do not connect components).
+    Each component is compiled and evaluated as its own program (on up to |num_workers| processes),
+    which is exact but keeps the cost exponential in only the size of the largest component.
+    Budgets and fallbacks apply to each component separately.
     """
 
-    def __init__(self, relations, rules, **kwargs):
+    DEFAULT_FALLBACK_BACKEND = srli.engine.problog.base.BACKEND_SAMPLE
+    DEFAULT_MAX_DEPTH = 2
+
+    def __init__(self, relations, rules,
+            backend = srli.engine.problog.base.BACKEND_EXACT, fallback_backend = DEFAULT_FALLBACK_BACKEND,
+            time_limit = None, memory_limit = None,
+            kbest_convergence = srli.engine.problog.base.DEFAULT_KBEST_CONVERGENCE,
+            num_samples = srli.engine.problog.base.DEFAULT_NUM_SAMPLES,
+            max_depth = DEFAULT_MAX_DEPTH,
+            split_components = True, num_workers = 1,
+            **kwargs):
         super().__init__(relations, rules, **kwargs)
 
+        for name in [backend, fallback_backend]:
+            if ((name is not None) and (name not in srli.engine.problog.base.BACKENDS)):
+                raise ValueError("Unknown ProbLog backend ('%s'), expected one of: [%s]." % (name, ', '.join(srli.engine.problog.base.BACKENDS)))
+
+        if (max_depth < 1):
+            raise ValueError("Max depth must be at least 1, found: %d." % (max_depth))
+
+        self._backend = backend
+        self._fallback_backend = fallback_backend
+        self._time_limit = time_limit
+        self._memory_limit = memory_limit
+        self._kbest_convergence = kbest_convergence
+        self._num_samples = num_samples
+        self._max_depth = max_depth
+        self._split_components = split_components
+        self._num_workers = num_workers
+
     def solve(self, **kwargs):
-        atoms, ground_rules, atom_uses, sum_constraints = self._prep()
+        return self._solve_ground(self._prep(), **kwargs)
+
+    def _solve_ground(self, ground, **kwargs):
+        atoms, ground_rules, atom_uses, sum_constraints = ground
+        self._atom_backends = {}
+
+        query_atom_ids = [atom_id for (atom_id, atom) in atoms.items() if (not atom.observed)]
 
-        query_atom_ids = []
-        observed_atom_ids = []
+        if (self._backend == srli.engine.problog.base.BACKEND_BOUNDED_DEPTH):
+            self._solve_bounded_depth(atoms, ground_rules, atom_uses, sum_constraints)
+            self._set_backend(query_atom_ids, self._backend)
+            print("ProbLog inference complete using backend: %s." % (self._backend))
 
-        for (atom_id, atom) in atoms.items():
-            if (atom.observed):
-                observed_atom_ids.append(atom_id)
+            return self._create_results(atoms)
+
+        if (self._split_components):
+            components = self._find_components(atoms, ground_rules, sum_constraints)
+        else:
+            components = [query_atom_ids]
+
+        # Components that are not involved in any rules or constraints cannot be true.
+        trivial_components = []
+        programs = []
+
+        for component in components:
+            program = self._write_component(component, atoms, ground_rules, atom_uses, sum_constraints)
+            if (program is None):
+                trivial_components.append(component)
             else:
-                query_atom_ids.append(atom_id)
+                programs.append((component, program))
+
+        for component in trivial_components:
+            self._apply_results({atoms[atom_id].to_problog() : 0.0 for atom_id in component}, component, atoms)
+            self._set_backend(component, srli.engine.problog.base.BACKEND_EXACT)
+
+        print("Solving %d ProbLog component(s) (%d trivial), largest has %d unobserved atoms." % (
+                len(components), len(trivial_components), max([0] + [len(component) for (component, _) in programs])))
+
+        self._instrumentation.set('components', len(components))
+        self._instrumentation.set('largest_component', max([0] + [len(component) for component in components]))
+
+        with self._instrumentation.phase('evaluate_programs'):
+            all_raw_results = self._evaluate_programs([program for (_, program) in programs], self._backend, limited = True)
+
+        for ((component, program), raw_results) in zip(programs, all_raw_results):
+            backend = self._backend
+
+            if (raw_results is None):
+                if (self._fallback_backend is None):
+                    raise RuntimeError("ProbLog inference (backend: %s) exceeded its budget and no fallback backend is set." % (backend))
+
+                print("ProbLog backend (%s) exceeded its budget on a component (%d unobserved atoms), falling back to: %s." % (
+                        backend, len(component), self._fallback_backend))
+
+                backend = self._fallback_backend
+                self._instrumentation.count('fallbacks')
+
+                if (backend == srli.engine.problog.base.BACKEND_BOUNDED_DEPTH):
+                    self._solve_bounded_depth(atoms, ground_rules, atom_uses, sum_constraints, atom_ids = component)
+                else:
+                    raw_results = self._evaluate_programs([program], backend, limited = False)[0]
+
+            if (raw_results is not None):
+                self._apply_results(raw_results, component, atoms)
+
+            self._set_backend(component, backend)
+
+        backend_counts = {}
+        for backend in self._atom_backends.values():
+            backend_counts[backend] = backend_counts.get(backend, 0) + 1
+
+        print("ProbLog inference complete using backends: {%s}." % (', '.join(["%s: %d" % (backend, count) for (backend, count) in sorted(backend_counts.items())])))
+
+        return self._create_results(atoms)
+
+    def _set_backend(self, atom_ids, backend):
+        for atom_id in atom_ids:
+            self._atom_backends[atom_id] = backend
+
+    def _evaluate_programs(self, programs, backend, limited = True):
+        """
+        Evaluate each program with the given (text) backend, in parallel if there are multiple workers.
+        Returns: [raw_results, ...], where raw_results is None if that program exceeded the budget.
+        """
+
+        options = {
+            'backend': backend,
+            'kbest_convergence': self._kbest_convergence,
+            'num_samples': self._num_samples,
+        }
+
+        if (limited and ((self._time_limit is not None) or (self._memory_limit is not None))):
+            evaluate = functools.partial(srli.engine.problog.base.evaluate_program_bounded,
+                    time_limit = self._time_limit, memory_limit = self._memory_limit, **options)
+
+            # Bounded evaluations already run in their own process, so threads are enough to run them in parallel.
+            if ((self._num_workers > 1) and (len(programs) > 1)):
+                with concurrent.futures.ThreadPoolExecutor(max_workers = self._num_workers) as pool:
+                    return list(pool.map(evaluate, programs))
+
+            return [evaluate(program) for program in programs]
+
+        evaluate = functools.partial(srli.engine.problog.base.evaluate_program, **options)
+
+        if ((self._num_workers > 1) and (len(programs) > 1)):
+            with concurrent.futures.ProcessPoolExecutor(max_workers = self._num_workers) as pool:
+                return list(pool.map(evaluate, programs))
+
+        return [evaluate(program) for program in programs]
+
+    def _find_components(self, atoms, ground_rules, sum_constraints):
+        """
+        Partition the unobserved atoms into connected components,
+        where two atoms are connected if they appear in the same ground rule or sum constraint.
+        Returns: [[atom_id, ...], ...], largest components first.
+        """
+
+        # A union-find over unobserved atoms.
+        # {atom_id: parent atom_id, ...}
+        parents = {atom_id : atom_id for (atom_id, atom) in atoms.items() if (not atom.observed)}
+
+        def find(atom_id):
+            while (parents[atom_id] != atom_id):
+                parents[atom_id] = parents[parents[atom_id]]
+                atom_id = parents[atom_id]
+            return atom_id
+
+        def union(atom_ids):
+            roots = [find(atom_id) for atom_id in atom_ids if (atom_id in parents)]
+            for root in roots[1:]:
+                parents[root] = roots[0]
+
+        for ground_rule in ground_rules:
+            union(ground_rule.atom_ids)
+
+        for atom_ids in sum_constraints.values():
+            union(atom_ids)
+
+        # {root: [atom_id, ...], ...}
+        components = {}
+        for atom_id in parents:
+            root = find(atom_id)
+            if (root not in components):
+                components[root] = []
+            components[root].append(atom_id)
+
+        return list(sorted(components.values(), key = len, reverse = True))
+
+    def _write_component(self, component, atoms, ground_rules, atom_uses, sum_constraints):
+        """
+        Write the program for a single component.
+        Returns None if the component does not take part in any rules or constraints.
+        """
+
+        ground_rule_ids = set()
+        constrained = False
+
+        for atom_id in component:
+            ground_rule_ids.update(atom_uses.get(atom_id, []))
+            constrained |= (len(atoms[atom_id].sum_constraints) > 0)
+
+        if ((len(ground_rule_ids) == 0) and (not constrained)):
+            return None
+
+        observed_atom_ids = set()
+        for ground_rule_id in ground_rule_ids:
+            for atom_id in ground_rules[ground_rule_id].atom_ids:
+                if (atoms[atom_id].observed):
+                    observed_atom_ids.add(atom_id)
 
         program = []
 
-        program += self._write_ground_rules(list(range(len(ground_rules))), ground_rules, atoms, query_atom_ids, sum_constraints)
+        program += self._write_ground_rules(list(sorted(ground_rule_ids)), ground_rules, atoms, component, sum_constraints)
         program.append('')
-        program += self._write_observations(observed_atom_ids, atoms)
+        program += self._write_observations(list(sorted(observed_atom_ids)), atoms)
         program.append('')
-        program += self._write_queries(query_atom_ids, atoms)
+        program += self._write_queries(component, atoms)
 
-        self._run("\n".join(program), query_atom_ids, atoms)
+        return "\n".join(program)
 
-        return self._create_results(atoms)
+    def _solve_bounded_depth(self, atoms, ground_rules, atom_uses, sum_constraints, atom_ids = None):
+        """
+        Exactly solve each query (and any atoms sharing a sum constraint with it) on only its neighbourhood:
+        unobserved atoms within |max_depth| hops (through ground rules) are free, and everything else is fixed at its current value.
+        All neighbourhoods are solved against the same values, and the updates are applied together.
+        If |atom_ids| is supplied, then only those atoms are solved for.
+        """
+
+        if (atom_ids is None):
+            atom_ids = atom_uses.keys()
+
+        # [(target_atom_ids, raw_results), ...]
+        updates = []
+        seen_atom_ids = set()
+
+        for atom_id in atom_ids:
+            if (atom_id not in atom_uses):
+                continue
+
+            if (atoms[atom_id].observed or (atom_id in seen_atom_ids)):
+                continue
+
+            target_atom_ids = self._get_target_atom_ids(atom_id, atoms, sum_constraints)
+            seen_atom_ids |= target_atom_ids
+
+            free_atom_ids = self._expand_neighbourhood(target_atom_ids, atoms, ground_rules, atom_uses, sum_constraints)
+
+            neighbourhood_ground_rules = set()
+            fixed_atom_ids = set()
+
+            for free_atom_id in free_atom_ids:
+                for ground_rule_index in atom_uses.get(free_atom_id, []):
+                    neighbourhood_ground_rules.add(ground_rule_index)
+                    fixed_atom_ids |= set(ground_rules[ground_rule_index].atom_ids)
+
+            fixed_atom_ids -= free_atom_ids
+
+            program = []
+
+            program += self._write_ground_rules(neighbourhood_ground_rules, ground_rules, atoms, free_atom_ids, sum_constraints)
+            program.append('')
+            program += self._write_observations(fixed_atom_ids, atoms)
+            program.append('')
+            program += self._write_queries(target_atom_ids, atoms)
+
+            updates.append((target_atom_ids, srli.engine.problog.base.evaluate_program("\n".join(program))))
+
+        for (target_atom_ids, raw_results) in updates:
+            self._apply_results(raw_results, target_atom_ids, atoms)
+
+    def _expand_neighbourhood(self, target_atom_ids, atoms, ground_rules, atom_uses, sum_constraints):
+        neighbourhood = set(target_atom_ids)
+        frontier = set(target_atom_ids)
+
+        for depth in range(1, self._max_depth):
+            next_frontier = set()
+
+            for atom_id in frontier:
+                for ground_rule_index in atom_uses.get(atom_id, []):
+                    for other_atom_id in ground_rules[ground_rule_index].atom_ids:
+                        if (atoms[other_atom_id].observed or (other_atom_id in neighbourhood)):
+                            continue
+
+                        next_frontier |= self._get_target_atom_ids(other_atom_id, atoms, sum_constraints)
+
+            next_frontier -= neighbourhood
+            if (len(next_frontier) == 0):
+                break
+
+            neighbourhood |= next_frontier
+            frontier = next_frontier
+
+        return neighbourhood
@@ -1,9 +1,35 @@
+import collections
+import concurrent.futures
+import heapq
+import math
+import os
+import re
+import time
+
 import srli.engine.problog.base
 
 class NonCollectiveProbLog(srli.engine.problog.base.BaseGroundProbLog):
     """
     An engine that tries to run non (or less) collective chunks of a ProbLog program at a time.
     This should, hoprefully, allow larger and more complex programs to be run without issues.
+
+    Two update modes are supported:
+     - Gauss-Seidel (default): each neighbourhood is solved in turn and its update is applied immediately,
+       so later neighbourhoods see the values of earlier ones.
+     - Jacobi: every neighbourhood is solved against the values from the previous iteration
+       (in parallel using a process pool), and then all the updates are applied together.
+
+    Two schedules are supported:
+     - Sweep (default): every atom is visited (in a random order) on every iteration.
+     - Residual: atoms are kept in a priority queue keyed by how much their neighbours moved since the atom was last updated
+       (like residual belief propagation), and only atoms whose residual exceeds a threshold are recomputed.
+
+    If cache_size > 0, subprogram results are memoized in an LRU cache keyed by a canonical form of the subprogram
+    (atoms renamed in a stable order, observations rounded to cache_precision digits, and sorted clauses).
+    Structurally identical neighbourhoods then only need to be evaluated by ProbLog once.
+    Note that when caching is enabled, the (rounded) canonical subprogram is what gets evaluated.
+
+    If |max_time| (seconds) is given, then no new iterations are started once that much time has been spent reasoning.
     """
 
     DEFAULT_MAX_ITERATIONS = 10
@@ -12,70 +38,465 @@ class NonCollectiveProbLog(srli.engine.problog.base.BaseGroundProbLog):
     # TODO(eriq): Stop conditions need more work.
     DEFAULT_STOP_MOVEMENT = 0.05
 
+    UPDATE_GAUSS_SEIDEL = 'gauss_seidel'
+    UPDATE_JACOBI = 'jacobi'
+    UPDATE_MODES = [UPDATE_GAUSS_SEIDEL, UPDATE_JACOBI]
+
+    SCHEDULE_SWEEP = 'sweep'
+    SCHEDULE_RESIDUAL = 'residual'
+    SCHEDULES = [SCHEDULE_SWEEP, SCHEDULE_RESIDUAL]
+
+    DEFAULT_RESIDUAL_THRESHOLD = 0.01
+
+    DEFAULT_CACHE_SIZE = 0
+    DEFAULT_CACHE_PRECISION = 3
+
     def __init__(self, relations, rules,
             max_iterations = DEFAULT_MAX_ITERATIONS, max_ground_rules = DEFAULT_MAX_GROUND_RULES,
             stop_movement = DEFAULT_STOP_MOVEMENT,
+            update_mode = UPDATE_GAUSS_SEIDEL, num_workers = None,
+            schedule = SCHEDULE_SWEEP, residual_threshold = DEFAULT_RESIDUAL_THRESHOLD,
+            cache_size = DEFAULT_CACHE_SIZE, cache_precision = DEFAULT_CACHE_PRECISION,
+            max_time = None,
             **kwargs):
         super().__init__(relations, rules, **kwargs)
 
+        if (update_mode not in NonCollectiveProbLog.UPDATE_MODES):
+            raise ValueError("Unknown update mode ('%s'), expected one of: [%s]." % (update_mode, ', '.join(NonCollectiveProbLog.UPDATE_MODES)))
+
+        if (schedule not in NonCollectiveProbLog.SCHEDULES):
+            raise ValueError("Unknown schedule ('%s'), expected one of: [%s]." % (schedule, ', '.join(NonCollectiveProbLog.SCHEDULES)))
+
         self._max_iterations = max_iterations
         self._max_ground_rules = max_ground_rules
         self._stop_movement = stop_movement
+        self._update_mode = update_mode
+        self._schedule = schedule
+        self._residual_threshold = residual_threshold
+        self._max_time = max_time
+
+        if (num_workers is None):
+            num_workers = os.cpu_count()
+        self._num_workers = num_workers
+
+        self._cache_precision = cache_precision
+        self._cache = None
+        if (cache_size > 0):
+            self._cache = NonCollectiveProbLog._ResultCache(cache_size)
+
+        self._evaluation_count = 0
 
     def solve(self, **kwargs):
-        atoms, ground_rules, atom_uses, sum_constraints = self._prep()
+        return self._solve_ground(self._prep(), **kwargs)
 
-        for iteration in range(1, self._max_iterations + 1):
-            movement = self._iteration(atoms, ground_rules, atom_uses, sum_constraints)
+    def _solve_ground(self, ground, **kwargs):
+        atoms, ground_rules, atom_uses, sum_constraints = ground
 
-            # Normalize movement by the number of RVAs.
-            movement /= float(len(atom_uses))
+        queue = None
+        if (self._schedule == NonCollectiveProbLog.SCHEDULE_RESIDUAL):
+            neighbours = self._map_neighbours(atoms, ground_rules, atom_uses)
+            queue = NonCollectiveProbLog._ResidualQueue(neighbours, self._rng)
 
-            print("Iteration: %d, Movement: %f" % (iteration, movement))
+        pool = None
+        if (self._update_mode == NonCollectiveProbLog.UPDATE_JACOBI):
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers = self._num_workers)
 
-            if ((iteration > 1) and (movement < self._stop_movement)):
-                print("Stopping Early -- Iteration: %d, Movement: %f" % (iteration, movement))
-                break
+        self._evaluation_count = 0
+        self._start_progress()
+
+        deadline = None
+        if (self._max_time is not None):
+            deadline = time.perf_counter() + self._max_time
+
+        try:
+            for iteration in range(1, self._max_iterations + 1):
+                movement, updates = self._iteration(atoms, ground_rules, atom_uses, sum_constraints, pool = pool, queue = queue)
+
+                self._instrumentation.count('iterations')
+                self._instrumentation.count('updates', updates)
+
+                # Normalize movement by the number of RVAs.
+                movement /= float(len(atom_uses))
+
+                if ((self._progress is not None) and (iteration % self._progress.interval == 0)):
+                    self._report_progress('iteration', iteration = iteration, movement = movement, updates = updates,
+                            evaluations = self._evaluation_count)
+
+                if (updates == 0):
+                    print("Stopping Early -- Iteration: %d, No atoms left to update." % (iteration))
+                    break
+
+                if ((iteration > 1) and (movement < self._stop_movement)):
+                    print("Stopping Early -- Iteration: %d, Movement: %f" % (iteration, movement))
+                    break
+
+                if ((deadline is not None) and (time.perf_counter() >= deadline)):
+                    print("Stopping Early -- Iteration: %d, Time limit (%0.2fs) reached." % (iteration, self._max_time))
+                    break
+        finally:
+            if (pool is not None):
+                pool.shutdown()
+
+        print("Total ProbLog Evaluations: %d" % (self._evaluation_count))
+        self._instrumentation.count('problog_evaluations', self._evaluation_count)
+
+        if (self._cache is not None):
+            print("Subprogram Cache -- %s" % (self._cache))
+            self._instrumentation.set('cache_hits', self._cache.hits)
+            self._instrumentation.set('cache_misses', self._cache.misses)
 
         return self._create_results(atoms)
 
-    def _iteration(self, atoms, ground_rules, atom_uses, sum_constraints):
+    def _iteration(self, atoms, ground_rules, atom_uses, sum_constraints, pool = None, queue = None):
+        """
+        Returns: (movement, number of subprograms solved)
+        """
+
+        if (queue is None):
+            atom_ids = list(atom_uses.keys())
+            self._rng.shuffle(atom_ids)
+        else:
+            # One iteration is allowed as many updates as a full sweep.
+            # Note that this is a generator, so Gauss-Seidel updates will affect the order of later atoms.
+            atom_ids = queue.pop(self._residual_threshold, len(atom_uses))
+
+        if (pool is not None):
+            return self._iteration_jacobi(atom_ids, atoms, ground_rules, atom_uses, sum_constraints, pool, queue)
+
         movement = 0.0
+        updates = 0
+
+        for atom_id in atom_ids:
+            if (atoms[atom_id].observed):
+                continue
+
+            target_atom_ids = self._get_target_atom_ids(atom_id, atoms, sum_constraints)
+            program, renaming = self._write_subprogram(target_atom_ids, atoms, ground_rules, atom_uses, sum_constraints)
+
+            raw_results = None
+            if (self._cache is not None):
+                raw_results = self._cache.get(program)
+
+            if (raw_results is None):
+                raw_results = srli.engine.problog.base.evaluate_program(program)
+                self._evaluation_count += 1
+
+                if (self._cache is not None):
+                    self._cache.put(program, raw_results)
+
+            deltas = {}
+            movement += self._apply_results(self._rename_results(raw_results, renaming), target_atom_ids, atoms, deltas = deltas)
+            updates += 1
 
-        atom_ids = list(atom_uses.keys())
-        self._rng.shuffle(atom_ids)
+            if (queue is not None):
+                queue.update([deltas])
 
-        for atom_id in atom_uses:
+        return movement, updates
+
+    def _iteration_jacobi(self, atom_ids, atoms, ground_rules, atom_uses, sum_constraints, pool, queue):
+        # Write all the subprograms before any values change.
+        # Atoms that share a sum constraint also share a subprogram, so each target set only needs to be solved once.
+        # With caching, different target sets may also end up with the same (canonical) program.
+        # {program: [(target_atom_ids, renaming), ...], ...}
+        subprograms = {}
+        seen_targets = set()
+
+        for atom_id in atom_ids:
             if (atoms[atom_id].observed):
                 continue
 
-            target_atom_ids = set([atom_id])
+            target_atom_ids = self._get_target_atom_ids(atom_id, atoms, sum_constraints)
+
+            key = frozenset(target_atom_ids)
+            if (key in seen_targets):
+                continue
+            seen_targets.add(key)
+
+            program, renaming = self._write_subprogram(target_atom_ids, atoms, ground_rules, atom_uses, sum_constraints)
+
+            if (program not in subprograms):
+                subprograms[program] = []
+            subprograms[program].append((target_atom_ids, renaming))
+
+        if (len(subprograms) == 0):
+            return 0.0, 0
+
+        # {program: raw_results, ...}
+        all_raw_results = {}
+        programs = []
+
+        for program in subprograms:
+            raw_results = None
+            if (self._cache is not None):
+                raw_results = self._cache.get(program)
+
+            if (raw_results is None):
+                programs.append(program)
+            else:
+                all_raw_results[program] = raw_results
+
+        if (len(programs) > 0):
+            # Batch small subprograms together to keep the IPC overhead down.
+            chunk_size = max(1, len(programs) // (4 * self._num_workers))
+            new_raw_results = pool.map(srli.engine.problog.base.evaluate_program, programs, chunksize = chunk_size)
+
+            for (program, raw_results) in zip(programs, new_raw_results):
+                all_raw_results[program] = raw_results
+
+                if (self._cache is not None):
+                    self._cache.put(program, raw_results)
+
+            self._evaluation_count += len(programs)
+
+        movement = 0.0
+        all_deltas = []
+
+        for (program, targets) in subprograms.items():
+            for (target_atom_ids, renaming) in targets:
+                deltas = {}
+                movement += self._apply_results(self._rename_results(all_raw_results[program], renaming), target_atom_ids, atoms, deltas = deltas)
+                all_deltas.append(deltas)
+
+        if (queue is not None):
+            queue.update(all_deltas)
+
+        return movement, len(seen_targets)
+
+    def _map_neighbours(self, atoms, ground_rules, atom_uses):
+        """
+        Get the unobserved atoms that share a ground rule with each unobserved atom.
+        Returns: {atom_id: {atom_id, ...}, ...}
+        """
+
+        neighbours = {}
+
+        for (atom_id, ground_rule_indexes) in atom_uses.items():
+            if (atoms[atom_id].observed):
+                continue
+
+            neighbours[atom_id] = set()
+
+            for ground_rule_index in ground_rule_indexes:
+                for other_atom_id in ground_rules[ground_rule_index].atom_ids:
+                    if ((other_atom_id != atom_id) and (not atoms[other_atom_id].observed)):
+                        neighbours[atom_id].add(other_atom_id)
+
+        return neighbours
+
+    def _write_subprogram(self, target_atom_ids, atoms, ground_rules, atom_uses, sum_constraints):
+        """
+        Returns: (program, renaming)
+        When caching is enabled, the program is in canonical form and |renaming| maps canonical atom names back to the
+        original atoms: {canonical name: atom string, ...}.
+        Otherwise, |renaming| is None.
+        """
+
+        # Any other adjacent atoms are treated as observed.
+        target_ground_rules = set()
+        observed_atom_ids = set()
+
+        for target_atom_id in target_atom_ids:
+            for ground_rule_index in atom_uses[target_atom_id]:
+                target_ground_rules.add(ground_rule_index)
+                observed_atom_ids |= set(ground_rules[ground_rule_index].atom_ids)
+
+        observed_atom_ids -= target_atom_ids
+
+        rules = self._write_ground_rules(target_ground_rules, ground_rules, atoms, target_atom_ids, sum_constraints,
+                max_ground_rules = self._max_ground_rules)
+
+        if (self._cache is not None):
+            return self._canonicalize(rules, target_atom_ids, observed_atom_ids, atoms)
+
+        program = []
+
+        program += rules
+        program.append('')
+        program += self._write_observations(observed_atom_ids, atoms)
+        program.append('')
+        program += self._write_queries(target_atom_ids, atoms)
+
+        return "\n".join(program), None
+
+    def _canonicalize(self, rules, target_atom_ids, observed_atom_ids, atoms):
+        """
+        Rename all the atoms in a subprogram to propositional atoms (a0, a1, ...) in a stable order,
+        so that isomorphic subprograms produce the same text.
+        Atoms are ordered by their role (target or rounded observation) and then by the (partially renamed) clauses they appear in.
+        Ties that remain are broken by the original atom name, so some isomorphic subprograms may still differ,
+        but two subprograms with the same canonical text are always isomorphic.
+
+        Returns: (program, {canonical name: atom string, ...})
+        """
+
+        # {atom string: base label, ...}
+        labels = {}
+
+        for atom_id in target_atom_ids:
+            labels[atoms[atom_id].to_problog()] = '?'
+
+        for atom_id in observed_atom_ids:
+            labels[atoms[atom_id].to_problog()] = "%.*f" % (self._cache_precision, atoms[atom_id].value)
+
+        pattern = re.compile(r'(?<!\w)(%s)' % ('|'.join([re.escape(name) for name in sorted(labels, key = len, reverse = True)])))
+
+        # Split each clause into alternating text and atom parts (atoms are at odd indexes).
+        clauses = []
+        for rule in rules:
+            rule = rule.strip()
+            if ((rule == '') or rule.startswith('%')):
+                continue
+
+            clauses.append(pattern.split(rule))
+
+        # {atom string: [clause signature, ...], ...}
+        signatures = {name : [] for name in labels}
+
+        for parts in clauses:
+            for name in set(parts[1::2]):
+                signature = []
+                for i in range(len(parts)):
+                    if (i % 2 == 0):
+                        signature.append(parts[i])
+                    elif (parts[i] == name):
+                        signature.append('@')
+                    else:
+                        signature.append('<' + labels[parts[i]] + '>')
+
+                signatures[name].append(''.join(signature))
+
+        ordered_names = sorted(labels, key = lambda name: (labels[name], sorted(signatures[name]), name))
+        canonical_names = {ordered_names[i] : "a%d" % (i) for i in range(len(ordered_names))}
+
+        program = []
+
+        for parts in clauses:
+            for i in range(1, len(parts), 2):
+                parts[i] = canonical_names[parts[i]]
+            program.append(''.join(parts))
+
+        for (name, label) in labels.items():
+            if (label == '?'):
+                program.append("query(%s) ." % (canonical_names[name]))
+            else:
+                program.append("%s :: %s ." % (label, canonical_names[name]))
+
+        renaming = {canonical_name : name for (name, canonical_name) in canonical_names.items()}
+
+        return "\n".join(sorted(program)), renaming
+
+    def _rename_results(self, raw_results, renaming):
+        if (renaming is None):
+            return raw_results
+
+        return {renaming[name] : value for (name, value) in raw_results.items()}
+
+    class _ResidualQueue(object):
+        """
+        A max priority queue of atoms keyed by their residual:
+        the total movement of their neighbours since the atom was last updated.
+        Every atom starts with an infinite residual so it is computed at least once.
+        Entries are never removed from the heap on update, instead stale entries are skipped when popped.
+        """
+
+        def __init__(self, neighbours, rng):
+            self._neighbours = neighbours
+
+            # {atom_id: residual, ...}
+            self._residuals = {}
+
+            # [(-residual, insertion order, atom_id), ...]
+            self._heap = []
+            self._next_order = 0
+
+            # Ties are broken by insertion order, so start in a random order.
+            atom_ids = list(sorted(neighbours.keys()))
+            rng.shuffle(atom_ids)
+
+            for atom_id in atom_ids:
+                self._residuals[atom_id] = math.inf
+                self._push(atom_id)
+
+        def pop(self, threshold, limit):
+            """
+            Yield (up to |limit|) atoms in order of decreasing residual, while the residual is at least |threshold|.
+            """
+
+            count = 0
+
+            while ((len(self._heap) > 0) and (count < limit)):
+                priority, _, atom_id = self._heap[0]
+                residual = -priority
+
+                if (residual != self._residuals[atom_id]):
+                    heapq.heappop(self._heap)
+                    continue
+
+                if (residual < threshold):
+                    return
+
+                heapq.heappop(self._heap)
+                count += 1
+
+                yield atom_id
+
+        def update(self, all_deltas):
+            """
+            Record that some atoms were just updated and how far they (absolutely) moved.
+            Each entry in |all_deltas| is one jointly solved group of atoms: [{atom_id: delta, ...}, ...].
+            Atoms only pass residuals to neighbours outside of their own group.
+            """
+
+            for deltas in all_deltas:
+                for atom_id in deltas:
+                    self._residuals[atom_id] = 0.0
+
+            for deltas in all_deltas:
+                for (atom_id, delta) in deltas.items():
+                    if (delta <= 0.0):
+                        continue
+
+                    for neighbour_atom_id in self._neighbours.get(atom_id, []):
+                        if (neighbour_atom_id in deltas):
+                            continue
+
+                        self._residuals[neighbour_atom_id] += delta
+                        self._push(neighbour_atom_id)
+
+        def _push(self, atom_id):
+            heapq.heappush(self._heap, (-self._residuals[atom_id], self._next_order, atom_id))
+            self._next_order += 1
+
+    class _ResultCache(object):
+        """
+        A simple LRU cache of ProbLog results keyed by (canonical) program text.
+        """
 
-            # All atoms sharing a sum constraint with the main target also gets to be a target.
-            for key in atoms[atom_id].sum_constraints:
-                for other_atom_id in sum_constraints[key]:
-                    target_atom_ids.add(other_atom_id)
+        def __init__(self, max_size):
+            self._max_size = max_size
+            self._entries = collections.OrderedDict()
 
-            # Any other adjacent atoms are treated as observed.
-            target_ground_rules = set()
-            observed_atom_ids = set()
+            self.hits = 0
+            self.misses = 0
 
-            for target_atom_id in target_atom_ids:
-                for ground_rule_index in atom_uses[target_atom_id]:
-                    target_ground_rules.add(ground_rule_index)
-                    observed_atom_ids |= set(ground_rules[ground_rule_index].atom_ids)
+        def get(self, program):
+            if (program not in self._entries):
+                self.misses += 1
+                return None
 
-            observed_atom_ids -= target_atom_ids
+            self.hits += 1
+            self._entries.move_to_end(program)
+            return self._entries[program]
 
-            program = []
+        def put(self, program, raw_results):
+            self._entries[program] = raw_results
+            self._entries.move_to_end(program)
 
-            program += self._write_ground_rules(target_ground_rules, ground_rules, atoms, target_atom_ids, sum_constraints,
-                    max_ground_rules = self._max_ground_rules)
-            program.append('')
-            program += self._write_observations(observed_atom_ids, atoms)
-            program.append('')
-            program += self._write_queries(target_atom_ids, atoms)
+            while (len(self._entries) > self._max_size):
+                self._entries.popitem(last = False)
 
-            movement += self._run("\n".join(program), target_atom_ids, atoms)
+        def __len__(self):
+            return len(self._entries)
 
-        return movement
+        def __repr__(self):
+            return "Hits: %d, Misses: %d, Size: %d / %d" % (self.hits, self.misses, len(self._entries), self._max_size)
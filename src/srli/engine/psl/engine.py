@@ -1,65 +1,71 @@
 import string
 import uuid
 
-import pslpython.model
-import pslpython.partition
-import pslpython.predicate
-import pslpython.rule
-
 import srli.engine.base
 import srli.evaluation
 
 class PSL(srli.engine.base.BaseEngine):
-    EVAL_MAP = {
-        srli.evaluation.CategoricalAccuracy: 'CategoricalEvaluator',
-        srli.evaluation.F1: 'DiscreteEvaluator',
-        srli.evaluation.RMSE: 'ContinuousEvaluator',
-        srli.evaluation.AuROC: 'AUCEvaluator',
-        srli.evaluation.AuPRC: 'AUCEvaluator',
-    }
+    """
+    pslpython (and the JVM) is only loaded once a model is built,
+    so other engines can use this one for grounding without paying for it up front.
+    """
+
+    EVAL_MAP = srli.evaluation.PSL_EVALUATORS
 
     def __init__(self, relations, rules, **kwargs):
         super().__init__(relations, rules, noramlize_weights = False, **kwargs)
 
     def solve(self, additional_config = {}, transform_config = None, **kwargs):
         model = self._prep_model(additional_config = additional_config)
+        return self._convert_results(_infer(model, transform_config))
 
-        raw_results = model.infer(transform_config = transform_config)
+    def learn(self, additional_config = {}, transform_config = None, **kwargs):
+        model = self._prep_model(additional_config)
+        self._apply_weights(_learn(model, transform_config))
+        return self
 
-        results = {}
-        for (predicate, data) in raw_results.items():
-            results[self._find_relation(predicate.name())] = data.to_numpy().tolist()
+    async def solve_async(self, additional_config = {}, transform_config = None, **kwargs):
+        """
+        PSL runs in the JVM of the calling process, so the async variants run the model in a child process
+        (which is killed on cancellation).
+        |transform_config| must be picklable.
+        """
 
-        return results
+        model = self._prep_model(additional_config = additional_config)
+        return self._convert_results(await srli.engine.base.run_process_async(_infer, model, transform_config))
 
-    def learn(self, additional_config = {}, transform_config = None, **kwargs):
+    async def learn_async(self, additional_config = {}, transform_config = None, **kwargs):
         model = self._prep_model(additional_config)
+        self._apply_weights(await srli.engine.base.run_process_async(_learn, model, transform_config))
+        return self
 
-        model.learn(transform_config = transform_config)
-
-        learned_rules = model.get_rules()
+    def _convert_results(self, raw_results):
+        return {self._find_relation(name) : data for (name, data) in raw_results.items()}
 
+    def _apply_weights(self, weights):
         # Note that additional rules were added that are not SRLi rules (like negative priors).
         for i in range(len(self._rules)):
             if (self._rules[i].is_weighted()):
-                self._rules[i].set_weight(learned_rules[i].weight())
+                self._rules[i].set_weight(weights[i])
 
         current_rule = len(self._rules)
         for relation in self._relations:
             if (not relation.has_negative_prior_weight()):
                 continue
 
-            relation.set_negative_prior_weight(learned_rules[current_rule].weight())
+            relation.set_negative_prior_weight(weights[current_rule])
             current_rule += 1
 
-        return self
-
     def ground(self, additional_config = {}, ignore_priors = False, ignore_sum_constraint = False, get_all_atoms = False, transform_config = None, **kwargs):
         additional_config['runtime.output.atoms.all'] = get_all_atoms
         model = self._prep_model(additional_config, ignore_priors, ignore_sum_constraint)
         return model.ground(transform_config = transform_config)
 
     def _prep_model(self, additional_config = {}, ignore_priors = False, ignore_sum_constraint = False):
+        import pslpython.model
+        import pslpython.predicate
+        import pslpython.rule
+
         model = pslpython.model.Model(str(uuid.uuid4()))
 
         options = dict(self._options)
@@ -160,3 +166,19 @@ class PSL(srli.engine.base.BaseEngine):
             if (relation.name().lower() == name.lower()):
                 return relation
         return None
+
+def _infer(model, transform_config):
+    """
+    Returns: {predicate name: [row, ...], ...}
+    """
+
+    raw_results = model.infer(transform_config = transform_config)
+    return {predicate.name() : data.to_numpy().tolist() for (predicate, data) in raw_results.items()}
+
+def _learn(model, transform_config):
+    """
+    Returns: [weight, ...] (for every rule in the model, including non-SRLi rules).
+    """
+
+    model.learn(transform_config = transform_config)
+    return [rule.weight() for rule in model.get_rules()]
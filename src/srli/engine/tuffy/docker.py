@@ -1,18 +1,22 @@
+import asyncio
 import atexit
 import copy
 import math
 import functools
+import hashlib
 import os
 import re
 import shutil
 import string
 import tempfile
+import threading
 import uuid
+import weakref
 
-import docker
-
+import srli.cache
 import srli.engine.base
 import srli.parser
+import srli.relation
 
 EVIDENCE_FILENAME = 'evidence.db'
 PROGRAM_FILENAME = 'prog.mln'
@@ -21,28 +25,79 @@ OUTPUT_FILENAME = 'out.txt'
 
 TEMP_DIR_PREFIX = 'srli.tuffy.'
 
+# Evidence and query files are keyed by the data they were written from, and reused while that data does not change.
+# The cache is private to the user (since cached files are fed straight to Tuffy),
+# and the least recently used files are evicted once it grows past its size limit.
+# Bump the version whenever the format of these files changes.
+CACHE_DIR = os.path.join(srli.cache.USER_CACHE_DIR, 'tuffy')
+CACHE_VERSION = 2
+CACHE_SUFFIXES = ('.evidence', '.query')
+DEFAULT_CACHE_MAX_SIZE_MB = 1024
+
+WRITE_BUFFER_SIZE = 1 << 20
+
 THIS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)))
 LIB_DIR = os.path.join(THIS_DIR, 'lib')
 
 DOCKER_TAG = 'srli.tuffy'
 DOCKER_TUFFY_IO_DIR = '/tuffy/io'
+DOCKER_RUN_SCRIPT = '/tuffy/run-tuffy.sh'
+
+# Must match WORKER_READY_MESSAGE in run-tuffy.sh.
+WORKER_READY_MESSAGE = 'Tuffy worker ready.'
+
+# How often to re-check a cancelled run while waiting for it to stop.
+CANCEL_POLL_SECONDS = 1.0
 
 # Tuffy variables must start with a lower case letter.
 DUMMY_VARIABLE_PREFIX = 'var_srli__'
 # Tuffy constants must be only integer or start with an upper case letter.
 DUMMY_CONSTANT_PREFIX = 'CON_srli__'
 
+# The Docker client and image are shared by all Tuffy engines in this process.
+# See _get_client() and _get_image().
+_client = None
+_image_tag = None
+_image_lock = threading.Lock()
+
+# Workers that still need to be closed when the process exits (see _close_workers()).
+# Weak, so that a worker does not outlive its engine just for this.
+_workers = weakref.WeakSet()
+
 # TODO(eriq): Partial functionals are ignored.
 class Tuffy(srli.engine.base.BaseEngine):
     """
     Run Tuffy in a Docker container.
+
+    By default, every call to learn/solve starts a fresh container (and a fresh database).
+    With |persistent|, a single worker container (with the database already running) is started on first use
+    and each call is run inside it with `docker exec`.
+    The worker is stopped after |idle_timeout| seconds without a call (and restarted on the next call),
+    when close() is called, or when the process exits.
+    A worker that is not ready within |start_timeout| seconds of starting is stopped (and the call fails).
     """
 
-    def __init__(self, relations, rules, cleanup_files = True, include_priors = True, **kwargs):
+    DEFAULT_IDLE_TIMEOUT = 300
+    DEFAULT_START_TIMEOUT = 300
+
+    def __init__(self, relations, rules, cleanup_files = True, include_priors = True,
+            persistent = False, idle_timeout = DEFAULT_IDLE_TIMEOUT, start_timeout = DEFAULT_START_TIMEOUT,
+            cache_files = True, cache_dir = CACHE_DIR, cache_max_size_mb = DEFAULT_CACHE_MAX_SIZE_MB,
+            **kwargs):
         super().__init__(relations, rules, **kwargs)
 
+        if (cache_max_size_mb <= 0):
+            raise ValueError("Max cache size must be positive, found: %s." % (cache_max_size_mb))
+
         self._cleanup_files = cleanup_files
         self._include_priors = include_priors
+        self._cache_files = cache_files
+        self._cache_dir = cache_dir
+        self._cache_max_size = int(cache_max_size_mb * 1024 * 1024)
+
+        self._worker = None
+        if (persistent):
+            self._worker = _Worker(idle_timeout, start_timeout, cleanup_files)
 
         missing_types = False
         for relation in self._relations:
@@ -56,21 +111,14 @@ class Tuffy(srli.engine.base.BaseEngine):
     def learn(self, max_iterations = None, **kwargs):
         temp_dir, output_path = self._prep_run()
 
-        args = ['-learnwt']
-
-        if (max_iterations is not None):
-            args += ['-dMaxIter', str(max_iterations)]
-
         try:
-            self._run_tuffy(temp_dir, additional_args = args)
+            self._run_tuffy(temp_dir, additional_args = self._learn_args(max_iterations))
             self._check_output(output_path)
             weights = self._parse_weights(output_path)
         finally:
             self._cleanup(temp_dir)
 
-        for i in range(len(self._rules)):
-            self._rules[i].set_weight(weights[i])
-
+        self._apply_weights(weights)
         return self
 
     def solve(self, **kwargs):
@@ -83,6 +131,46 @@ class Tuffy(srli.engine.base.BaseEngine):
         finally:
             self._cleanup(temp_dir)
 
+        return self._convert_results(raw_results)
+
+    async def learn_async(self, max_iterations = None, **kwargs):
+        temp_dir, output_path = self._prep_run()
+
+        try:
+            await self._run_tuffy_async(temp_dir, additional_args = self._learn_args(max_iterations))
+            self._check_output(output_path)
+            weights = self._parse_weights(output_path)
+        finally:
+            self._cleanup(temp_dir)
+
+        self._apply_weights(weights)
+        return self
+
+    async def solve_async(self, **kwargs):
+        temp_dir, output_path = self._prep_run()
+
+        try:
+            await self._run_tuffy_async(temp_dir)
+            self._check_output(output_path)
+            raw_results = self._read_results(output_path)
+        finally:
+            self._cleanup(temp_dir)
+
+        return self._convert_results(raw_results)
+
+    def _learn_args(self, max_iterations):
+        args = ['-learnwt']
+
+        if (max_iterations is not None):
+            args += ['-dMaxIter', str(max_iterations)]
+
+        return args
+
+    def _apply_weights(self, weights):
+        for i in range(len(self._rules)):
+            self._rules[i].set_weight(weights[i])
+
+    def _convert_results(self, raw_results):
         results = {}
         for relation in self._relations:
             if (not relation.has_unobserved_data()):
@@ -105,12 +193,23 @@ class Tuffy(srli.engine.base.BaseEngine):
 
         return results
 
+    def close(self):
+        if (self._worker is not None):
+            self._worker.close()
+
     def _check_output(self, output_path):
         if (not os.path.isfile(output_path)):
             raise RuntimeError("Tuffy did not complete successfully.")
 
     def _prep_run(self):
-        temp_dir = tempfile.mkdtemp(prefix = TEMP_DIR_PREFIX)
+        with self._instrumentation.phase('write_files'):
+            return self._write_files()
+
+    def _write_files(self):
+        if (self._worker is None):
+            temp_dir = tempfile.mkdtemp(prefix = TEMP_DIR_PREFIX)
+        else:
+            temp_dir = self._worker.make_run_dir()
 
         program_path = os.path.join(temp_dir, PROGRAM_FILENAME)
         evidence_path = os.path.join(temp_dir, EVIDENCE_FILENAME)
@@ -118,8 +217,13 @@ class Tuffy(srli.engine.base.BaseEngine):
         output_path = os.path.join(temp_dir, OUTPUT_FILENAME)
 
         self._write_program(program_path)
-        self._write_evidence(evidence_path)
-        self._write_query(query_path)
+
+        if (self._cache_files):
+            self._write_cached(evidence_path, 'evidence', srli.relation.Relation.DataType.OBSERVED, self._write_evidence)
+            self._write_cached(query_path, 'query', srli.relation.Relation.DataType.UNOBSERVED, self._write_query)
+        else:
+            self._write_evidence(evidence_path)
+            self._write_query(query_path)
 
         return temp_dir, output_path
 
@@ -128,10 +232,64 @@ class Tuffy(srli.engine.base.BaseEngine):
             shutil.rmtree(temp_dir)
 
     def _write_file(self, path, lines):
-        with open(path, 'w') as file:
+        with open(path, 'w', buffering = WRITE_BUFFER_SIZE) as file:
             for line in lines:
                 file.write(str(line) + "\n")
 
+    def _write_cached(self, path, name, data_type, write_function):
+        """
+        Put a file at |path| that was written by |write_function|,
+        reusing a previously written file if the data (of |data_type|) has not changed.
+        Uses the relations' data fingerprints, so the data itself is not rehashed.
+        """
+
+        hasher = hashlib.blake2b(digest_size = 16)
+        hasher.update(("%s\0%d\0" % (name, CACHE_VERSION)).encode())
+
+        for relation in self._relations:
+            if (not relation.has_data(data_type)):
+                continue
+
+            hasher.update(("%s\0%d\0%s\0" % (relation.name().upper(), relation.arity(), relation.data_fingerprint(data_type))).encode())
+
+        cache_path = os.path.join(self._cache_dir, "%s.%s" % (hasher.hexdigest(), name))
+
+        srli.cache.check_private_dir(self._cache_dir)
+
+        hit = True
+        try:
+            # Mark as recently used.
+            os.utime(cache_path)
+        except OSError:
+            hit = False
+
+        if (not hit):
+            srli.cache.make_private_dir(self._cache_dir)
+
+            # Write to the side and move into place so that concurrent writers never expose a partial file.
+            temp_path = "%s.%s.tmp" % (cache_path, uuid.uuid4())
+            write_function(temp_path)
+            os.replace(temp_path, cache_path)
+
+        try:
+            os.link(cache_path, path)
+        except OSError:
+            shutil.copyfile(cache_path, path)
+
+        # Only evict after the file is in place (evicting a linked file does not affect the link).
+        if (not hit):
+            srli.cache.evict_lru(self._cache_dir, self._cache_max_size, CACHE_SUFFIXES)
+
+    def _get_observed_data(self):
+        for relation in self._relations:
+            if (relation.has_observed_data()):
+                yield (relation, relation.get_observed_data())
+
+    def _get_unobserved_data(self):
+        for relation in self._relations:
+            if (relation.has_unobserved_data()):
+                yield (relation, relation.get_unobserved_data())
+
     def _find_relation(self, name):
         for relation in self._relations:
             if (relation.name().upper() == name.upper()):
@@ -332,42 +490,79 @@ class Tuffy(srli.engine.base.BaseEngine):
         return DUMMY_VARIABLE_PREFIX + text
 
     def _write_evidence(self, path):
-        evidence = []
+        self._write_file(path, self._generate_evidence())
 
-        for relation in self._relations:
-            if (not relation.has_observed_data()):
-                continue
+    def _generate_evidence(self):
+        for (relation, rows) in self._get_observed_data():
+            name = relation.name().upper()
+            arity = relation.arity()
 
-            for row in relation.get_observed_data():
-                args = list(map(lambda argument: self._convert_constant(argument), row[0:relation.arity()]))
-                line = "%s(%s)" % (relation.name().upper(), ', '.join(map(str, args)))
+            for row in rows:
+                line = "%s(%s)" % (name, ', '.join([self._convert_constant(str(argument)) for argument in row[0:arity]]))
 
-                if (len(row) > relation.arity()):
+                if (len(row) > arity):
                     line = "%f %s" % (float(row[-1]), line)
 
-                evidence.append(line)
-
-        self._write_file(path, evidence)
+                yield line
 
     def _write_query(self, path):
-        query = []
+        self._write_file(path, self._generate_query())
 
-        for relation in self._relations:
-            if (not relation.has_unobserved_data()):
-                continue
+    def _generate_query(self):
+        for (relation, rows) in self._get_unobserved_data():
+            name = relation.name().upper()
+            arity = relation.arity()
 
-            for row in relation.get_unobserved_data():
-                args = list(map(lambda argument: self._convert_constant(argument), row[0:relation.arity()]))
-                line = "%s(%s)" % (relation.name().upper(), ', '.join(map(str, args)))
-                query.append(line)
-
-        self._write_file(path, query)
+            for row in rows:
+                yield "%s(%s)" % (name, ', '.join([self._convert_constant(str(argument)) for argument in row[0:arity]]))
 
     def _run_tuffy(self, io_dir, additional_args = []):
-        client = docker.from_env()
+        with self._instrumentation.phase('run_tuffy'):
+            if (self._worker is not None):
+                self._worker.run(io_dir, additional_args)
+            else:
+                self._run_container(DOCKER_TAG + '_' + str(uuid.uuid4()), io_dir, additional_args)
 
-        # Build the image (Docker's cache will be used for subsequent runs).
-        client.images.build(path = LIB_DIR, tag = DOCKER_TAG, rm = True, quiet = False)
+    async def _run_tuffy_async(self, io_dir, additional_args = []):
+        """
+        The blocking Docker calls (and log streaming) are run on a thread.
+        On cancellation, the container running this call is stopped (which ends the run) before the cancellation is passed on.
+        A call still waiting for a persistent worker is just dropped (see _Worker.cancel()).
+        """
+
+        loop = asyncio.get_running_loop()
+
+        if (self._worker is not None):
+            run = loop.run_in_executor(None, self._worker.run, io_dir, additional_args)
+            stop = functools.partial(self._worker.cancel, io_dir)
+        else:
+            container_id = DOCKER_TAG + '_' + str(uuid.uuid4())
+            run = loop.run_in_executor(None, self._run_container, container_id, io_dir, additional_args)
+
+            def stop():
+                Tuffy._stop_container(container_id)
+                return True
+
+        try:
+            with self._instrumentation.phase('run_tuffy'):
+                await asyncio.shield(run)
+        except asyncio.CancelledError:
+            # The run will fail, but nothing will await it anymore.
+            run.add_done_callback(_discard_result)
+
+            # Keep stopping until the run ends, in case the container had not been started yet.
+            while (not run.done()):
+                if (not await loop.run_in_executor(None, stop)):
+                    # The run had not started, and will fail on its own once it gets its turn.
+                    break
+
+                await asyncio.wait([run], timeout = CANCEL_POLL_SECONDS)
+
+            raise
+
+    def _run_container(self, container_id, io_dir, additional_args):
+        client = _get_client()
+        image_tag = _get_image()
 
         # Run the container with the temp dir as a mount.
         volumes = {
@@ -377,17 +572,16 @@ class Tuffy(srli.engine.base.BaseEngine):
             },
         }
 
-        container_id = DOCKER_TAG + '_' + str(uuid.uuid4())
         container = None
+        stop_container_partial = functools.partial(Tuffy._stop_container, container_id)
 
         try:
             # Ideally we would disable all networking (network_disabled = True),
             # but Tuffy will throw an error.
-            container = client.containers.run(DOCKER_TAG, command = additional_args, volumes = volumes, name = container_id,
+            container = client.containers.run(image_tag, command = additional_args, volumes = volumes, name = container_id,
                     remove = True, network_disabled = False,
                     detach = True)
 
-            stop_container_partial = functools.partial(Tuffy._stop_container, container_id)
             atexit.register(stop_container_partial)
 
             for line in container.logs(stream = True):
@@ -405,10 +599,13 @@ class Tuffy(srli.engine.base.BaseEngine):
             raise ex
         finally:
             Tuffy._stop_container(container_id)
+            atexit.unregister(stop_container_partial)
 
     @staticmethod
     def _stop_container(container_id):
-        client = docker.from_env()
+        import docker.errors
+
+        client = _get_client()
 
         try:
             container = client.containers.get(container_id)
@@ -417,3 +614,279 @@ class Tuffy(srli.engine.base.BaseEngine):
 
         if (container.status == 'running'):
             container.stop()
+
+class _Worker(object):
+    """
+    A long-lived Tuffy container that runs each request in its own IO dir (under a single mounted dir).
+    Requests are serialized, since they share one database.
+    Requests are identified by their run dir (see make_run_dir()).
+    """
+
+    def __init__(self, idle_timeout, start_timeout, cleanup_files):
+        self._idle_timeout = idle_timeout
+        self._start_timeout = start_timeout
+        self._cleanup_files = cleanup_files
+
+        # The dir mounted into the container, created along with the first run dir.
+        self._io_dir = None
+        self._closed = False
+
+        self._container_id = None
+        self._idle_timer = None
+
+        # The run dir of the run in progress, and runs that were cancelled before they started.
+        self._active_run_dir = None
+        self._cancelled_run_dirs = set()
+
+        # Held for a whole run.
+        self._lock = threading.Lock()
+        # Held only briefly (so it can be taken while a run is in progress).
+        self._state_lock = threading.Lock()
+
+        _workers.add(self)
+
+    def make_run_dir(self):
+        with self._state_lock:
+            if (self._closed):
+                raise RuntimeError("Tuffy worker has already been closed.")
+
+            if (self._io_dir is None):
+                self._io_dir = tempfile.mkdtemp(prefix = TEMP_DIR_PREFIX + 'worker.')
+
+            io_dir = self._io_dir
+
+        return tempfile.mkdtemp(prefix = 'run.', dir = io_dir)
+
+    def run(self, run_dir, additional_args):
+        with self._lock:
+            with self._state_lock:
+                if (run_dir in self._cancelled_run_dirs):
+                    self._cancelled_run_dirs.remove(run_dir)
+                    raise RuntimeError("Tuffy run was cancelled before it started.")
+
+                self._active_run_dir = run_dir
+
+            try:
+                self._run(run_dir, additional_args)
+            finally:
+                with self._state_lock:
+                    self._active_run_dir = None
+
+    def _run(self, run_dir, additional_args):
+        import docker.errors
+
+        self._cancel_idle_timer()
+
+        # The container may have gone away since the last run (e.g. it was stopped outside of this worker).
+        if ((self._container_id is not None) and (not self._is_running())):
+            self._container_id = None
+
+        if (self._container_id is None):
+            self._start()
+
+        client = _get_client()
+        command = [DOCKER_RUN_SCRIPT, '--exec', DOCKER_TUFFY_IO_DIR + '/' + os.path.basename(run_dir)] + list(additional_args)
+
+        exec_id = client.api.exec_create(self._container_id, command)
+        for line in client.api.exec_start(exec_id, stream = True):
+            print(line.decode(), end = '')
+        print()
+
+        try:
+            exit_code = client.api.exec_inspect(exec_id)['ExitCode']
+        except docker.errors.NotFound:
+            exit_code = None
+
+        if (not self._is_running()):
+            # The container was stopped out from under this run (see cancel()).
+            self._container_id = None
+            raise RuntimeError("Tuffy worker was stopped during a run.")
+
+        # The worker itself is still fine, so it can idle until the next run either way.
+        if (self._idle_timeout is not None):
+            self._idle_timer = threading.Timer(self._idle_timeout, self._stop_idle)
+            self._idle_timer.daemon = True
+            self._idle_timer.start()
+
+        if (exit_code != 0):
+            raise RuntimeError("Tuffy worker run exited with code %d." % (exit_code))
+
+    def cancel(self, run_dir):
+        """
+        Cancel the run in |run_dir|.
+        If that run is in progress, then the worker container is stopped without waiting for the run (which will then fail),
+        and a new container will be started on the next run.
+        If it has not started yet, then it is dropped (and fails) once it gets its turn, and other runs are not affected.
+        Returns: True if the run was in progress.
+        """
+
+        with self._state_lock:
+            if (self._active_run_dir != run_dir):
+                self._cancelled_run_dirs.add(run_dir)
+                return False
+
+            container_id = self._container_id
+
+        if (container_id is not None):
+            Tuffy._stop_container(container_id)
+
+        return True
+
+    def close(self):
+        with self._lock:
+            self._cancel_idle_timer()
+            self._stop()
+
+            with self._state_lock:
+                io_dir = self._io_dir
+                self._io_dir = None
+                self._closed = True
+
+            if ((io_dir is not None) and self._cleanup_files):
+                shutil.rmtree(io_dir, ignore_errors = True)
+
+        _workers.discard(self)
+
+    def _start(self):
+        client = _get_client()
+
+        volumes = {
+            self._io_dir: {
+                'bind': DOCKER_TUFFY_IO_DIR,
+                'mode': 'rw',
+            },
+        }
+
+        container_id = DOCKER_TAG + '_worker_' + str(uuid.uuid4())
+        print("Starting Tuffy worker container: '%s'." % (container_id))
+
+        container = client.containers.run(_get_image(), command = ['--worker'], volumes = volumes, name = container_id,
+                remove = True, network_disabled = False,
+                detach = True)
+        self._container_id = container_id
+
+        # The log stream blocks, so watch it on a thread (which ends with the container) to be able to time out.
+        ready = threading.Event()
+
+        def watch_logs():
+            for line in container.logs(stream = True):
+                if (WORKER_READY_MESSAGE in line.decode()):
+                    ready.set()
+                    return
+
+        watcher = threading.Thread(target = watch_logs, daemon = True)
+        watcher.start()
+        watcher.join(self._start_timeout)
+
+        if (ready.is_set()):
+            return
+
+        self._container_id = None
+
+        if (watcher.is_alive()):
+            Tuffy._stop_container(container_id)
+            raise RuntimeError("Tuffy worker container did not become ready within %s seconds." % (str(self._start_timeout)))
+
+        raise RuntimeError("Tuffy worker container exited before becoming ready.")
+
+    def _is_running(self):
+        import docker.errors
+
+        try:
+            return (_get_client().containers.get(self._container_id).status == 'running')
+        except docker.errors.NotFound:
+            return False
+
+    def _stop(self):
+        if (self._container_id is None):
+            return
+
+        Tuffy._stop_container(self._container_id)
+        self._container_id = None
+
+    def _stop_idle(self):
+        with self._lock:
+            self._idle_timer = None
+            self._stop()
+
+    def _cancel_idle_timer(self):
+        if (self._idle_timer is not None):
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+def _discard_result(future):
+    """
+    A done callback for futures that nobody will await, so their exceptions are not reported as never retrieved.
+    """
+
+    if (not future.cancelled()):
+        future.exception()
+
+def _close_workers():
+    for worker in list(_workers):
+        worker.close()
+
+atexit.register(_close_workers)
+
+def _get_client():
+    """
+    The docker package is only loaded (and the daemon only contacted) once it is actually needed.
+    """
+
+    global _client
+
+    if (_client is None):
+        import docker
+        _client = docker.from_env()
+
+    return _client
+
+def _get_image():
+    """
+    Get the tag for the Tuffy image, building it only if an image for the current contents of LIB_DIR does not already exist.
+    The check is only done once per process.
+    """
+
+    import docker.errors
+
+    global _image_tag
+
+    with _image_lock:
+        if (_image_tag is not None):
+            return _image_tag
+
+        client = _get_client()
+        image_tag = "%s:%s" % (DOCKER_TAG, _fingerprint_lib_dir())
+
+        try:
+            client.images.get(image_tag)
+        except docker.errors.ImageNotFound:
+            print("Building Tuffy Docker image: '%s'." % (image_tag))
+            client.images.build(path = LIB_DIR, tag = image_tag, rm = True, quiet = False)
+
+        _image_tag = image_tag
+        return _image_tag
+
+def _fingerprint_lib_dir():
+    """
+    Hash the names and contents of all the files used to build the image.
+    """
+
+    hasher = hashlib.sha256()
+
+    for (dirpath, dirnames, filenames) in os.walk(LIB_DIR):
+        dirnames.sort()
+
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+
+            with open(path, 'rb') as file:
+                contents = file.read()
+
+            hasher.update(os.path.relpath(path, LIB_DIR).encode())
+            hasher.update(b'\0')
+            hasher.update(str(len(contents)).encode())
+            hasher.update(b'\0')
+            hasher.update(contents)
+
+    return hasher.hexdigest()[0:16]
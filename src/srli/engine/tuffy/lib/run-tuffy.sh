@@ -1,29 +1,37 @@
 #!/bin/bash
 
+# Usage:
+#   run-tuffy.sh [tuffy args ...]
+#       Start postgres and run Tuffy once on the files in the default IO dir.
+#   run-tuffy.sh --worker
+#       Start postgres and wait for runs to be sent in (via `docker exec`) until the container is stopped.
+#   run-tuffy.sh --exec <io dir> [tuffy args ...]
+#       Run Tuffy on the files in the given IO dir using the postgres instance already started by a worker.
+
 readonly TUFFY_DIR='/tuffy'
 
 readonly JAR_PATH="${TUFFY_DIR}/tuffy.jar"
 readonly CONFIG_PATH="${TUFFY_DIR}/tuffy.conf"
 
-readonly IO_DIR="${TUFFY_DIR}/io"
-readonly PROGRAM_PATH="${IO_DIR}/prog.mln"
-readonly EVIDENCE_PATH="${IO_DIR}/evidence.db"
-readonly QUERY_PATH="${IO_DIR}/query.db"
-readonly OUTPUT_PATH="${IO_DIR}/out.txt"
+readonly DEFAULT_IO_DIR="${TUFFY_DIR}/io"
+
+readonly WORKER_READY_MESSAGE='Tuffy worker ready.'
+
+IO_DIR="${DEFAULT_IO_DIR}"
 
 function check_files() {
-    if [[ ! -f "${PROGRAM_PATH}" ]]; then
-        echo "ERROR: Tuffy program (${PROGRAM_PATH}) does not exist."
+    if [[ ! -f "${IO_DIR}/prog.mln" ]]; then
+        echo "ERROR: Tuffy program (${IO_DIR}/prog.mln) does not exist."
         exit 101
     fi
 
-    if [[ ! -f "${EVIDENCE_PATH}" ]]; then
-        echo "ERROR: Tuffy evidence (${EVIDENCE_PATH}) does not exist."
+    if [[ ! -f "${IO_DIR}/evidence.db" ]]; then
+        echo "ERROR: Tuffy evidence (${IO_DIR}/evidence.db) does not exist."
         exit 102
     fi
 
-    if [[ ! -f "${QUERY_PATH}" ]]; then
-        echo "ERROR: Tuffy query (${QUERY_PATH}) does not exist."
+    if [[ ! -f "${IO_DIR}/query.db" ]]; then
+        echo "ERROR: Tuffy query (${IO_DIR}/query.db) does not exist."
         exit 103
     fi
 }
@@ -34,12 +42,19 @@ function setup_postgres() {
     sleep 2
 }
 
+function wait_for_postgres() {
+    # The server used for init only listens on a local socket, so this waits for the real server.
+    until pg_isready --quiet --host localhost --username tuffy --dbname tuffy ; do
+        sleep 0.5
+    done
+}
+
 function run_tuffy() {
     java -jar "${JAR_PATH}" -conf "${CONFIG_PATH}" \
-        -mln "${PROGRAM_PATH}" \
-        -evidence "${EVIDENCE_PATH}" \
-        -queryFile "${QUERY_PATH}" \
-        -result "${OUTPUT_PATH}" \
+        -mln "${IO_DIR}/prog.mln" \
+        -evidence "${IO_DIR}/evidence.db" \
+        -queryFile "${IO_DIR}/query.db" \
+        -result "${IO_DIR}/out.txt" \
         "$@"
 }
 
@@ -47,9 +62,30 @@ function main() {
     set -e
     trap exit SIGINT
 
+    if [[ "$1" == '--worker' ]]; then
+        trap exit SIGTERM
+
+        setup_postgres
+        wait_for_postgres
+        echo "${WORKER_READY_MESSAGE}"
+
+        sleep infinity &
+        wait
+        return
+    fi
+
+    if [[ "$1" == '--exec' ]]; then
+        IO_DIR="$2"
+        shift 2
+
+        check_files
+        run_tuffy "$@"
+        return
+    fi
+
     check_files
     setup_postgres
-    run_tuffy $@
+    run_tuffy "$@"
 }
 
 [[ "${BASH_SOURCE[0]}" == "${0}" ]] && main "$@"
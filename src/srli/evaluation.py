@@ -1,7 +1,5 @@
 import abc
 
-import sklearn.metrics
-
 import srli.util
 
 
@@ -17,9 +15,11 @@ class Evaluation(abc.ABC):
         self._primary = primary
 
     @abc.abstractmethod
-    def evaluate(self, results):
+    def evaluate(self, results, context = None):
         """
         Take in the inference results and perform an evaluation.
+        If multiple evaluations are run on the same results, then an EvaluationContext (for those results) can be passed in
+        so that the truth and predictions are only aligned once.
         """
 
         pass
@@ -27,6 +27,18 @@ class Evaluation(abc.ABC):
     def relation(self):
         return self._relation
 
+    def _get_values(self, results, context, discretize):
+        if (context is None):
+            context = EvaluationContext(results)
+
+        return context.get_values(self._relation, discretize = discretize)
+
+    def _get_categories(self, results, context):
+        if (context is None):
+            context = EvaluationContext(results)
+
+        return context.get_categories(self._relation)
+
     def metric_name(self):
         return self._metric_name
 
@@ -48,42 +60,96 @@ class Evaluation(abc.ABC):
             'options': self._options,
         }
 
+class EvaluationContext(object):
+    """
+    Aligned truth/prediction values for a set of results, computed once per relation and shared by all evaluations.
+    Different relations may be evaluated on different threads, but a single relation should only be used from one thread at a time.
+    """
+
+    def __init__(self, results, truth_threshold = srli.util.DEFAULT_TRUTH_THRESHOLD):
+        self._results = results
+        self._truth_threshold = truth_threshold
+
+        # {(relation, discretize): (expected, predicted), ...}
+        self._values = {}
+        # {relation: (expected, predicted, entities), ...}
+        self._categories = {}
+
+    def get_values(self, relation, discretize = False):
+        key = (relation, discretize)
+        if (key in self._values):
+            return self._values[key]
+
+        if (not discretize):
+            self._values[key] = srli.util.get_eval_values(relation, self._results[relation], discretize = False)
+        else:
+            expected, predicted = self.get_values(relation, discretize = False)
+            self._values[key] = ((expected >= self._truth_threshold).astype(int), (predicted >= self._truth_threshold).astype(int))
+
+        return self._values[key]
+
+    def get_categories(self, relation):
+        if (relation not in self._categories):
+            self._categories[relation] = srli.util.get_eval_categories(relation, self._results[relation])
+
+        return self._categories[relation]
+
 class AuPRC(Evaluation):
     def __init__(self, relation, **kwargs):
         super().__init__('AuPRC', relation, **kwargs)
 
-    def evaluate(self, results):
-        expected, predicted = srli.util.get_eval_values(self._relation, results[self._relation], discretize = False)
+    def evaluate(self, results, context = None):
+        import sklearn.metrics
+
+        expected, predicted = self._get_values(results, context, discretize = False)
         return sklearn.metrics.average_precision_score(expected, predicted)
 
 class AuROC(Evaluation):
     def __init__(self, relation, **kwargs):
         super().__init__('AuROC', relation, **kwargs)
 
-    def evaluate(self, results):
-        expected, predicted = srli.util.get_eval_values(self._relation, results[self._relation], discretize = False)
+    def evaluate(self, results, context = None):
+        import sklearn.metrics
+
+        expected, predicted = self._get_values(results, context, discretize = False)
         return sklearn.metrics.roc_auc_score(expected, predicted)
 
 class CategoricalAccuracy(Evaluation):
     def __init__(self, relation, **kwargs):
         super().__init__('Categorical Accuracy', relation, **kwargs)
 
-    def evaluate(self, results):
-        expected, predicted, _ = srli.util.get_eval_categories(self._relation, results[self._relation])
+    def evaluate(self, results, context = None):
+        import sklearn.metrics
+
+        expected, predicted, _ = self._get_categories(results, context)
         return sklearn.metrics.accuracy_score(expected, predicted)
 
 class RMSE(Evaluation):
     def __init__(self, relation, **kwargs):
         super().__init__('RMSE', relation, **kwargs)
 
-    def evaluate(self, results):
-        expected, predicted = srli.util.get_eval_values(self._relation, results[self._relation], discretize = False)
+    def evaluate(self, results, context = None):
+        import sklearn.metrics
+
+        expected, predicted = self._get_values(results, context, discretize = False)
         return sklearn.metrics.mean_squared_error(expected, predicted, squared = False)
 
 class F1(Evaluation):
     def __init__(self, relation, **kwargs):
         super().__init__('F1', relation, **kwargs)
 
-    def evaluate(self, results):
-        expected, predicted = srli.util.get_eval_values(self._relation, results[self._relation], discretize = True)
+    def evaluate(self, results, context = None):
+        import sklearn.metrics
+
+        expected, predicted = self._get_values(results, context, discretize = True)
         return sklearn.metrics.f1_score(expected, predicted)
+
+# The PSL evaluator that computes each evaluation (used both to run PSL and to read PSL configs).
+# {evaluation class: PSL evaluator name, ...}
+PSL_EVALUATORS = {
+    CategoricalAccuracy: 'CategoricalEvaluator',
+    F1: 'DiscreteEvaluator',
+    RMSE: 'ContinuousEvaluator',
+    AuROC: 'AUCEvaluator',
+    AuPRC: 'AUCEvaluator',
+}
@@ -0,0 +1,172 @@
+"""
+Instrumentation for tracking the cost of each phase of a run (loading data, grounding, solving, etc)
+and any engine-specific counters (ground rules, atoms, flips, iterations, etc).
+Records are written as JSON lines so that runs can be compared over time.
+"""
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+class Instrumentation(object):
+    """
+    Each finished phase is written out as a single JSON object (one per line):
+        {"type": "phase", "phase": name, "path": "outer/inner", "wall_time": seconds, "cpu_time": seconds,
+            "peak_rss_kb": kb, "peak_rss_children_kb": kb, "tracemalloc_peak": bytes (only if |trace_memory|), ...}
+    Counters are accumulated and written out as a single record on close():
+        {"type": "counters", "counters": {name: value, ...}, ...}
+    Any |labels| are added to every record.
+
+    Peak RSS is the high-water mark of the process (and finished children) at the end of the phase
+    (left out on platforms without the resource module, e.g. Windows).
+    Tracing memory with tracemalloc gives a true per-phase peak (of Python allocations), but will slow down the run.
+
+    If a |profiler| (srli.profiling.Profiler) is set, then it is run for any of its selected phases.
+    """
+
+    def __init__(self, path = None, trace_memory = False, profiler = None, **labels):
+        self._path = path
+        self._trace_memory = trace_memory
+        self._profiler = profiler
+        self._labels = labels
+
+        self._file = None
+        self._started_tracing = False
+
+        # {name: value, ...}
+        self._counters = {}
+
+        # [{'name': name, 'peak': bytes}, ...]
+        self._active_phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if (self._trace_memory):
+            if (not tracemalloc.is_tracing()):
+                tracemalloc.start()
+                self._started_tracing = True
+
+            # The peak is about to be reset, so save it for the enclosing phase.
+            if (len(self._active_phases) > 0):
+                self._active_phases[-1]['peak'] = max(self._active_phases[-1]['peak'], tracemalloc.get_traced_memory()[1])
+
+            # Before Python 3.9, the peak cannot be reset (so it is the peak since tracing started).
+            if (hasattr(tracemalloc, 'reset_peak')):
+                tracemalloc.reset_peak()
+
+        active_phase = {'name': name, 'peak': 0}
+        self._active_phases.append(active_phase)
+        path = '/'.join([active_phase['name'] for active_phase in self._active_phases])
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+
+        try:
+            if (self._profiler is None):
+                yield
+            else:
+                with self._profiler.profile(name):
+                    yield
+        finally:
+            record = {
+                'type': 'phase',
+                'phase': name,
+                'path': path,
+                'wall_time': time.perf_counter() - start_wall,
+                'cpu_time': time.process_time() - start_cpu,
+            }
+
+            peak_rss = get_peak_rss()
+            if (peak_rss is not None):
+                record['peak_rss_kb'], record['peak_rss_children_kb'] = peak_rss
+
+            self._active_phases.pop()
+
+            if (self._trace_memory):
+                peak = max(active_phase['peak'], tracemalloc.get_traced_memory()[1])
+                record['tracemalloc_peak'] = peak
+
+                if (len(self._active_phases) > 0):
+                    self._active_phases[-1]['peak'] = max(self._active_phases[-1]['peak'], peak)
+
+            self._write(record)
+
+    def set_profiler(self, profiler):
+        self._profiler = profiler
+
+    def count(self, name, value = 1):
+        """
+        Add to a counter.
+        """
+
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """
+        Set a counter to a specific value (e.g. the size of a ground program).
+        """
+
+        self._counters[name] = value
+
+    def close(self):
+        if (len(self._counters) > 0):
+            self._write({'type': 'counters', 'counters': self._counters})
+            self._counters = {}
+
+        if (self._file is not None):
+            self._file.close()
+            self._file = None
+
+        if (self._started_tracing):
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _write(self, record):
+        if (self._path is None):
+            return
+
+        if (self._file is None):
+            self._file = open(self._path, 'a')
+
+        record['timestamp'] = time.time()
+        record.update(self._labels)
+
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+class NullInstrumentation(Instrumentation):
+    """
+    Instrumentation that does not record anything (the default for engines).
+    A profiler can still be attached.
+    """
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if (self._profiler is None):
+            yield
+        else:
+            with self._profiler.profile(name):
+                yield
+
+    def count(self, name, value = 1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def close(self):
+        pass
+
+def get_peak_rss():
+    """
+    Get the high-water mark of the resident set size of this process and its finished children.
+    Returns: (self kb, children kb), or None where the resource module is not available (e.g. Windows).
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
@@ -2,8 +2,6 @@ import sys
 
 import lark
 
-import srli.pipeline
-
 GRAMMAR = '''
     %import common.CNAME
     %import common.ESCAPED_STRING
@@ -85,6 +83,9 @@ GRAMMAR = '''
     _DQUOTE : "\\""
 '''
 
+# Built on first use.
+_parser = None
+
 class DNF(object):
     def __init__(self, components):
         self.atoms = []
@@ -285,11 +286,21 @@ class CleanTree(lark.Transformer):
 
         return Constant(str(elements[0]))
 
-def parse(rule):
-    parser = lark.Lark(GRAMMAR, start = 'rule', parser = 'lalr')
+def _get_parser():
+    """
+    Building the parser is much more expensive than parsing a rule, so only build it once.
+    """
 
+    global _parser
+
+    if (_parser is None):
+        _parser = lark.Lark(GRAMMAR, start = 'rule', parser = 'lalr')
+
+    return _parser
+
+def parse(rule):
     try:
-        ast = parser.parse(rule)
+        ast = _get_parser().parse(rule)
     except Exception as ex:
         print("Failed to parse rule: '%s'." % (rule))
         raise ex
@@ -299,6 +310,8 @@ def parse(rule):
     return cleanAST
 
 def main(path):
+    import srli.pipeline
+
     pipeline = srli.pipeline.Pipeline.from_psl_config(path)
 
     for rule in pipeline._rules:
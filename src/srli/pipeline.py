@@ -1,12 +1,16 @@
 import argparse
+import concurrent.futures
 import json
 import os
 import re
 import time
 
-import sklearn.metrics
-
-import srli.engine.psl.engine
+import srli.cache
+import srli.engine
+import srli.evaluation
+import srli.instrumentation
+import srli.profiling
+import srli.progress
 import srli.relation
 import srli.rule
 import srli.util
@@ -26,18 +30,36 @@ class Pipeline(object):
         self._learn_data = learn_data
         self._infer_data = infer_data
 
-    def run(self, engine_type, skip_learning = False, skip_inference = False, additional_options = {}):
+    def run(self, engine_type, skip_learning = False, skip_inference = False, additional_options = {}, instrumentation = None, progress = None,
+            seed = None, cache = None):
+        """
+        If a |cache| (srli.cache.ResultCache) is given, then inference results are looked up (and stored) by a fingerprint of
+        the model (after any learning), the inference data, the engine, the seed, and the options.
+        Learning is always run.
+        """
+
         options = dict(self._options)
         options.update(additional_options)
 
-        engine = engine_type(self._relations, self._rules,
-                options = options, evaluations = self._evaluations)
+        if (instrumentation is None):
+            instrumentation = srli.instrumentation.NullInstrumentation()
+        self._instrumentation = instrumentation
+
+        self._cache = cache
+        self._cache_config = (engine_type.__name__, seed, options)
+
+        engine = engine_type(self._relations, self._rules, seed = seed,
+                options = options, evaluations = self._evaluations, instrumentation = instrumentation, progress = progress)
 
-        if ((not skip_learning) and (len(self._learn_data) > 0) and (self._learn_data != self._infer_data)):
-            self._learn(engine)
+        try:
+            if ((not skip_learning) and (len(self._learn_data) > 0) and (self._learn_data != self._infer_data)):
+                self._learn(engine)
 
-        if ((not skip_inference) and (len(self._infer_data) > 0)):
-            self._infer(engine)
+            if ((not skip_inference) and (len(self._infer_data) > 0)):
+                self._infer(engine)
+        finally:
+            engine.close()
+            instrumentation.close()
 
     def __repr__(self):
         return json.dumps({
@@ -52,49 +74,86 @@ class Pipeline(object):
     def _learn(self, engine):
         print("%d -- Loading learning data." % (int(time.time())))
 
-        for relation in self._relations:
-            relation.clear_data()
-
-        for (relation, data) in self._learn_data.items():
-            for (data_type, data_sources) in data.items():
-                for path in data_sources['paths']:
-                    relation.add_data_file(path, data_type = data_type)
-
-                relation.add_data(data = data_sources['points'], data_type = data_type)
+        with self._instrumentation.phase('load_learn_data'):
+            self._load_data(self._learn_data)
 
         print("%d -- Starting learning engine." % (int(time.time())))
 
-        engine.learn()
+        with self._instrumentation.phase('learn'):
+            engine.learn()
 
     def _infer(self, engine):
         print("%d -- Loading inference data." % (int(time.time())))
 
+        with self._instrumentation.phase('load_infer_data'):
+            self._load_data(self._infer_data)
+
+        results = None
+        if (self._cache is not None):
+            engine_name, seed, options = self._cache_config
+
+            with self._instrumentation.phase('cache_lookup'):
+                key = self._cache.fingerprint(engine_name, self._relations, self._rules, seed = seed, options = options)
+                if (key is not None):
+                    results = self._cache.get(key, self._relations)
+
+            if (key is None):
+                print("%d -- WARNING: Not using the result cache, since no seed was given (results would not be reproducible)." % (int(time.time())))
+            elif (results is not None):
+                print("%d -- Using cached inference results (%s)." % (int(time.time()), key))
+
+        if (results is None):
+            print("%d -- Starting inference engine." % (int(time.time())))
+
+            with self._instrumentation.phase('solve'):
+                results = engine.solve()
+
+            if ((self._cache is not None) and (key is not None)):
+                self._cache.put(key, results)
+
+        with self._instrumentation.phase('evaluate'):
+            self._eval(results)
+
+    def _load_data(self, all_data):
         for relation in self._relations:
             relation.clear_data()
 
-        for (relation, data) in self._infer_data.items():
+        for (relation, data) in all_data.items():
             for (data_type, data_sources) in data.items():
                 for path in data_sources['paths']:
                     relation.add_data_file(path, data_type = data_type)
 
                 relation.add_data(data = data_sources['points'], data_type = data_type)
 
-        print("%d -- Starting inference engine." % (int(time.time())))
+    def _eval(self, results):
+        print("%d -- Starting evaluation." % (int(time.time())))
 
-        results = engine.solve()
+        # Truth and predictions are aligned once per relation (and shared between all the evaluations for that relation),
+        # and different relations are evaluated in parallel.
+        context = srli.evaluation.EvaluationContext(results)
 
-        self._eval(results)
+        # {relation: [evaluation, ...], ...}
+        relation_evaluations = {}
+        for evaluation in self._evaluations:
+            if (evaluation.relation() not in relation_evaluations):
+                relation_evaluations[evaluation.relation()] = []
+            relation_evaluations[evaluation.relation()].append(evaluation)
 
-    def _eval(self, results):
-        print("%d -- Starting evaluation." % (int(time.time())))
+        # {evaluation: value, ...}
+        values = {}
 
-        stats = []
+        if (len(relation_evaluations) > 0):
+            num_workers = min(len(relation_evaluations), os.cpu_count() or 1)
+            with concurrent.futures.ThreadPoolExecutor(max_workers = num_workers) as pool:
+                for relation_values in pool.map(lambda evaluations: Pipeline._eval_relation(evaluations, results, context), relation_evaluations.values()):
+                    values.update(relation_values)
 
         for evaluation in self._evaluations:
-            stats.append((evaluation.metric_name(), evaluation.relation(), evaluation.evaluate(results)))
+            print('Evaluation Result -- Metric: %s, Relation: %s, Value: %f' % (evaluation.metric_name(), evaluation.relation().name(), values[evaluation]))
 
-        for (metric, relation, value) in stats:
-            print('Evaluation Result -- Metric: %s, Relation: %s, Value: %f' % (metric, relation.name(), value))
+    @staticmethod
+    def _eval_relation(evaluations, results, context):
+        return {evaluation : evaluation.evaluate(results, context = context) for evaluation in evaluations}
 
     # TODO(eriq): This assumes the config is syntactically/semantically correct, only minimal error checking is done.
     @staticmethod
@@ -320,7 +379,7 @@ class Pipeline(object):
 
     @staticmethod
     def _parse_evaluations(eval_configs, relation):
-        eval_map = {value : key for (key, value) in srli.engine.psl.engine.PSL.EVAL_MAP.items()}
+        eval_map = {value : key for (key, value) in srli.evaluation.PSL_EVALUATORS.items()}
 
         evaluations = []
 
@@ -362,8 +421,26 @@ def main(arguments):
     if (arguments.print_pipeline):
         print(pipeline)
 
+    profiler = None
+    if (arguments.profile_phases is not None):
+        profiler = srli.profiling.Profiler(arguments.profile_phases, method = arguments.profiler, out_dir = arguments.profile_dir)
+
+    instrumentation = None
+    if ((arguments.instrumentation_path is not None) or (profiler is not None)):
+        instrumentation = srli.instrumentation.Instrumentation(arguments.instrumentation_path, trace_memory = arguments.trace_memory,
+                profiler = profiler, engine = arguments.engine, config = arguments.config_path)
+
+    progress = None
+    if (arguments.progress_interval is not None):
+        progress = srli.progress.PrintProgressSink(interval = arguments.progress_interval)
+
+    cache = None
+    if (arguments.cache):
+        cache = srli.cache.ResultCache(cache_dir = arguments.cache_dir, max_size_mb = arguments.cache_max_size)
+
     pipeline.run(engine_type, additional_options = options,
-            skip_learning = arguments.skip_learning, skip_inference = arguments.skip_inference)
+            skip_learning = arguments.skip_learning, skip_inference = arguments.skip_inference,
+            instrumentation = instrumentation, progress = progress, seed = arguments.seed, cache = cache)
 
 def _load_args():
     parser = argparse.ArgumentParser(description = 'Run a SRLi pipeline from a PSL-style config file.')
@@ -382,10 +459,51 @@ def _load_args():
         metavar=('key', 'value'),
         help = 'additional options to pass to the engine')
 
+    parser.add_argument('--instrumentation', dest = 'instrumentation_path',
+        action = 'store', type = str, default = None,
+        help = 'append timing/memory records for each phase (and engine counters) as JSON lines to this path (default: %(default)s)')
+
     parser.add_argument('--print-pipeline', dest = 'print_pipeline',
         action = 'store_true', default = False,
         help = 'print the SRLi pipeline before doing work (default: %(default)s)')
 
+    parser.add_argument('--trace-memory', dest = 'trace_memory',
+        action = 'store_true', default = False,
+        help = 'also record per-phase peak Python allocations with tracemalloc (slows down the run) (default: %(default)s)')
+
+    parser.add_argument('--profile-phase', dest = 'profile_phases',
+        action = 'append', type = str, default = None,
+        help = 'profile only this phase (e.g. learn, solve, ground, prep, reason), writing one profile per run of the phase (may be repeated) (default: %(default)s)')
+
+    parser.add_argument('--profile-dir', dest = 'profile_dir',
+        action = 'store', type = str, default = '.',
+        help = 'the directory to write profiles into (default: %(default)s)')
+
+    parser.add_argument('--profiler', dest = 'profiler',
+        action = 'store', type = str, default = srli.profiling.METHOD_CPROFILE,
+        choices = srli.profiling.METHODS,
+        help = 'how to collect profiles (default: %(default)s)')
+
+    parser.add_argument('--progress-interval', dest = 'progress_interval',
+        action = 'store', type = int, default = None,
+        help = 'print engine progress (loss, motion, etc) every this many steps of their inner loops (default: %(default)s)')
+
+    parser.add_argument('--seed', dest = 'seed',
+        action = 'store', type = int, default = None,
+        help = 'the random seed for the engine (default: a random seed)')
+
+    parser.add_argument('--cache', dest = 'cache',
+        action = 'store_true', default = False,
+        help = 'reuse inference results from previous runs of the same model, data, engine, seed, and options (requires --seed) (default: %(default)s)')
+
+    parser.add_argument('--cache-dir', dest = 'cache_dir',
+        action = 'store', type = str, default = srli.cache.DEFAULT_CACHE_DIR,
+        help = 'where to keep cached results (default: %(default)s)')
+
+    parser.add_argument('--cache-max-size', dest = 'cache_max_size',
+        action = 'store', type = float, default = srli.cache.DEFAULT_MAX_SIZE_MB,
+        help = 'the max size (in MB) of the result cache before the least recently used results are evicted (default: %(default)s)')
+
     parser.add_argument('--skip-learning', dest = 'skip_learning',
         action = 'store_true', default = False,
         help = 'skip the learning phase (default: %(default)s)')
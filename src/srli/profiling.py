@@ -0,0 +1,132 @@
+"""
+Profiling for only selected phases of a run (e.g. just 'reason' in NativeMLN or just 'prep' in DWS).
+Profilers are attached to an srli.instrumentation.Instrumentation, and are started/stopped by its phases.
+"""
+
+import collections
+import contextlib
+import cProfile
+import os
+import sys
+import threading
+
+METHOD_CPROFILE = 'cprofile'
+METHOD_SAMPLING = 'sampling'
+METHODS = [METHOD_CPROFILE, METHOD_SAMPLING]
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+class Profiler(object):
+    """
+    Profile each phase named in |phases|, and write one profile file per run of a phase into |out_dir|:
+        <phase>.<count>.prof (cProfile, readable with pstats/snakeviz),
+        <phase>.<count>.txt (sampling, as collapsed stacks "outer;...;inner count" for flame graph tools).
+
+    cProfile is deterministic and sees every call (but slows down tight loops).
+    Sampling only looks at the stack of the thread running the phase every |sample_interval| seconds,
+    so it adds little overhead but is only statistically accurate.
+
+    Only one phase is profiled at a time:
+    a selected phase that runs inside another selected phase is included in the outer profile instead of getting its own file.
+    """
+
+    def __init__(self, phases, method = METHOD_CPROFILE, out_dir = '.', sample_interval = DEFAULT_SAMPLE_INTERVAL):
+        if (method not in METHODS):
+            raise ValueError("Unknown profiling method ('%s'), expected one of: [%s]." % (method, ', '.join(METHODS)))
+
+        if (sample_interval <= 0.0):
+            raise ValueError("Sample interval must be positive, found: %f." % (sample_interval))
+
+        self._phases = set(phases)
+        self._method = method
+        self._out_dir = out_dir
+        self._sample_interval = sample_interval
+
+        self._active = False
+
+        # {phase: count, ...}
+        self._counts = {}
+
+        # [path, ...]
+        self.paths = []
+
+    @contextlib.contextmanager
+    def profile(self, name):
+        if ((name not in self._phases) or self._active):
+            yield
+            return
+
+        os.makedirs(self._out_dir, exist_ok = True)
+
+        count = self._counts.get(name, 0)
+        self._counts[name] = count + 1
+
+        if (self._method == METHOD_CPROFILE):
+            path = os.path.join(self._out_dir, "%s.%d.prof" % (name, count))
+            profile = self._profile_cprofile
+        else:
+            path = os.path.join(self._out_dir, "%s.%d.txt" % (name, count))
+            profile = self._profile_sampling
+
+        self._active = True
+
+        try:
+            with profile(path):
+                yield
+        finally:
+            self._active = False
+            self.paths.append(path)
+
+    @contextlib.contextmanager
+    def _profile_cprofile(self, path):
+        profile = cProfile.Profile()
+        profile.enable()
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+
+    @contextlib.contextmanager
+    def _profile_sampling(self, path):
+        sampler = Profiler._Sampler(threading.get_ident(), self._sample_interval)
+        sampler.start()
+
+        try:
+            yield
+        finally:
+            sampler.stop()
+
+            with open(path, 'w') as file:
+                for (stack, count) in sorted(sampler.stacks.items(), key = lambda item: item[1], reverse = True):
+                    file.write("%s %d\n" % (stack, count))
+
+    class _Sampler(threading.Thread):
+        def __init__(self, thread_id, interval):
+            super().__init__(daemon = True)
+
+            self._thread_id = thread_id
+            self._interval = interval
+            self._done = threading.Event()
+
+            # {'outer;...;inner': count, ...}
+            self.stacks = collections.Counter()
+
+        def run(self):
+            while (not self._done.wait(self._interval)):
+                frame = sys._current_frames().get(self._thread_id)
+                if (frame is None):
+                    continue
+
+                stack = []
+                while (frame is not None):
+                    code = frame.f_code
+                    stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+
+                self.stacks[';'.join(reversed(stack))] += 1
+
+        def stop(self):
+            self._done.set()
+            self.join()
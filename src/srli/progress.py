@@ -0,0 +1,73 @@
+"""
+Sinks for the structured progress events that engines report from their inner loops (loss, motion, flips/sec, etc).
+Engines only report to a sink when one is set, so without a sink the inner loops do not pay for any reporting.
+"""
+
+import abc
+import json
+import time
+
+DEFAULT_INTERVAL = 1
+
+class ProgressSink(abc.ABC):
+    """
+    Engines report an event every |interval| steps (flips, iterations, etc) of a loop,
+    as well as at the end of each loop (e.g. an attempt).
+    Every event has:
+        engine: the name of the engine class,
+        event: the kind of event (e.g. 'flip', 'iteration', 'attempt'),
+        elapsed: seconds since the start of the current solve,
+    along with any engine-specific values (loss, best_loss, motion, movement, flips_per_sec, ...).
+    """
+
+    def __init__(self, interval = DEFAULT_INTERVAL):
+        if (interval < 1):
+            raise ValueError("Progress interval must be at least 1, found: %d." % (interval))
+
+        self.interval = interval
+
+    @abc.abstractmethod
+    def report(self, event):
+        """
+        Take in a single event ({key: value, ...}).
+        """
+
+        pass
+
+class PrintProgressSink(ProgressSink):
+    def report(self, event):
+        values = ["%s: %s" % (key, value) for (key, value) in event.items() if (key not in ('engine', 'event'))]
+        print("%s %s -- %s" % (event['engine'], event['event'], ', '.join(values)))
+
+class ListProgressSink(ProgressSink):
+    """
+    Keep all the events in memory (in |events|).
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.events = []
+
+    def report(self, event):
+        self.events.append(event)
+
+class JSONLinesProgressSink(ProgressSink):
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self._path = path
+        self._file = None
+
+    def report(self, event):
+        if (self._file is None):
+            self._file = open(self._path, 'a')
+
+        event = dict(event)
+        event['timestamp'] = time.time()
+
+        self._file.write(json.dumps(event) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if (self._file is not None):
+            self._file.close()
+            self._file = None
@@ -1,16 +1,28 @@
 import csv
 import enum
+import hashlib
+import json
 import math
 import string
 
 MAX_ARITY = len(string.ascii_uppercase)
 
+# Data hashes are a sum of (128 bit) row hashes (so they do not depend on the order rows were added in).
+# They key cached results, so a collision would silently serve stale results.
+DATA_HASH_BYTES = 16
+DATA_HASH_MODULUS = 2 ** (DATA_HASH_BYTES * 8)
+
 class Relation(object):
     class DataType(enum.Enum):
         OBSERVED = 'observed'
         UNOBSERVED = 'unobserved'
         TRUTH = 'truth'
 
+    class Operation(enum.Enum):
+        INSERT = 'insert'
+        DELETE = 'delete'
+        UPDATE = 'update'
+
     class SumConstraint(object):
         class SumConstraintComparison(enum.Enum):
             LT = '<'
@@ -75,6 +87,9 @@ class Relation(object):
         if ((self._variable_types is not None) and (self._arity != len(self._variable_types))):
             raise ValueError("Relation's (%s) arity (%d) must be consistent with length of variables types (%d)." % (self._name, self._arity, len(self._variable_types)))
 
+        # Bumped on every change to the data (never reset).
+        self._version = 0
+
         self.clear_data()
 
     def arity(self):
@@ -137,8 +152,37 @@ class Relation(object):
     def clear_data(self):
         # {dataType: data, ...}
         self._data = {}
+
+        # {dataType: sum of row hashes, ...}
+        self._data_hashes = {}
+
         for data_type in Relation.DataType:
             self._data[data_type] = []
+            self._data_hashes[data_type] = 0
+
+        self._reset_changes()
+
+    def data_fingerprint(self, data_type):
+        """
+        A fingerprint of the rows of a data type (independent of the order the rows were added in).
+        This is kept up-to-date as data is added, so it is O(1).
+        """
+
+        data_type = Relation.DataType(data_type)
+        return _format_data_fingerprint(self._data_hashes[data_type], len(self._data[data_type]))
+
+    def fingerprint(self):
+        """
+        A fingerprint of the full relation: the schema (arity, types, prior, and sum constraint) and the data of every type.
+        """
+
+        hasher = hashlib.blake2b(digest_size = 16)
+        hasher.update(json.dumps(self.to_dict(), sort_keys = True, default = str).encode())
+
+        for data_type in Relation.DataType:
+            hasher.update(("\0%s\0%s" % (data_type.value, self.data_fingerprint(data_type))).encode())
+
+        return hasher.hexdigest()
 
     # TODO(eriq): So much with data loading in general.
     # TODO(eriq): Check incoming data for consistency (arity, truth values, etc).
@@ -159,7 +203,9 @@ class Relation(object):
             raise NotImplementedError("Loading both local and file data at the same time not implemented.")
 
         if (data is not None and type(data) == list):
+            self._reset_changes()
             self._data[data_type] += data
+            self._data_hashes[data_type] = (self._data_hashes[data_type] + sum(map(_hash_row, data))) % DATA_HASH_MODULUS
             return len(data)
         elif (path is not None):
             return self.add_data_file(path, data_type)
@@ -172,14 +218,161 @@ class Relation(object):
         if ('quoting' not in csv_args):
             csv_args['quoting'] = csv.QUOTE_NONE
 
+        self._reset_changes()
+
         count = 0
+        data_hash = 0
+
+        rows = self._data[data_type]
+        hash_row = _hash_row
+
         with open(path, 'r') as file:
             for row in csv.reader(file, delimiter = delimiter, **csv_args):
-                self._data[data_type].append(row)
+                rows.append(row)
+                data_hash += hash_row(row)
                 count += 1
 
+        self._data_hashes[data_type] = (self._data_hashes[data_type] + data_hash) % DATA_HASH_MODULUS
+
         return count
 
+    # Deltas.
+    # Changes made with insert_data(), delete_data(), and update_data() are tracked (see changes_since()).
+    # Any other change to the data (add_data(), add_data_file(), clear_data()) resets tracking.
+    # Rows are matched on their arguments (the first |arity| values).
+
+    def version(self):
+        return self._version
+
+    def changes_since(self, version):
+        """
+        Get all the tracked changes made after |version|, or None if the data was changed in an untracked way since then
+        (in which case, anything built from the data at |version| needs to be fully rebuilt).
+        Returns: [(version, Relation.Operation, Relation.DataType, old row (None for inserts), new row (None for deletes)), ...]
+        """
+
+        if (version < self._tracked_version):
+            return None
+
+        # Versions are consecutive within the tracked changes.
+        return self._changes[(version - self._tracked_version):]
+
+    def clear_changes(self):
+        """
+        Drop the change log (without changing any data).
+        Anything built from an older version will need to be fully rebuilt.
+        """
+
+        self._tracked_version = self._version
+        self._changes = []
+
+    def insert_data(self, data, data_type = DataType.OBSERVED):
+        data_type = Relation.DataType(data_type)
+        rows = self._data[data_type]
+        key_index = self._get_key_index(data_type)
+
+        for row in data:
+            key = self._row_key(row)
+            if (key in key_index):
+                raise ValueError("%s -- Cannot insert a row that already exists (%s): %s." % (str(self), data_type.value, row))
+
+            key_index[key] = len(rows)
+            rows.append(row)
+            self._data_hashes[data_type] = (self._data_hashes[data_type] + _hash_row(row)) % DATA_HASH_MODULUS
+
+            self._log_change(Relation.Operation.INSERT, data_type, None, row)
+
+        return len(data)
+
+    def delete_data(self, data, data_type = DataType.OBSERVED):
+        """
+        Delete rows by their arguments (any values in |data| are ignored).
+        The last row is moved into the deleted row's place, so the order of the remaining rows may change.
+        """
+
+        data_type = Relation.DataType(data_type)
+        rows = self._data[data_type]
+        key_index = self._get_key_index(data_type)
+
+        for row in data:
+            key = self._row_key(row)
+            if (key not in key_index):
+                raise ValueError("%s -- Cannot delete a row that does not exist (%s): %s." % (str(self), data_type.value, row))
+
+            index = key_index.pop(key)
+            old_row = rows[index]
+
+            last_row = rows.pop()
+            if (index < len(rows)):
+                rows[index] = last_row
+                key_index[self._row_key(last_row)] = index
+
+            self._data_hashes[data_type] = (self._data_hashes[data_type] - _hash_row(old_row)) % DATA_HASH_MODULUS
+
+            self._log_change(Relation.Operation.DELETE, data_type, old_row, None)
+
+        return len(data)
+
+    def update_data(self, data, data_type = DataType.OBSERVED):
+        """
+        Replace existing rows (matched on their arguments) with new rows (usually with new values).
+        """
+
+        data_type = Relation.DataType(data_type)
+        rows = self._data[data_type]
+        key_index = self._get_key_index(data_type)
+
+        for row in data:
+            key = self._row_key(row)
+            if (key not in key_index):
+                raise ValueError("%s -- Cannot update a row that does not exist (%s): %s." % (str(self), data_type.value, row))
+
+            index = key_index[key]
+            old_row = rows[index]
+            rows[index] = row
+
+            self._data_hashes[data_type] = (self._data_hashes[data_type] - _hash_row(old_row) + _hash_row(row)) % DATA_HASH_MODULUS
+
+            self._log_change(Relation.Operation.UPDATE, data_type, old_row, row)
+
+        return len(data)
+
+    def _row_key(self, row):
+        return tuple(map(str, row[0:self._arity]))
+
+    def _get_key_index(self, data_type):
+        """
+        Get (building if necessary) the index of the rows of a data type.
+        Returns: {(arg, ...): row index, ...}
+        """
+
+        if (data_type not in self._key_indexes):
+            key_index = {}
+
+            for (index, row) in enumerate(self._data[data_type]):
+                key = self._row_key(row)
+                if (key in key_index):
+                    raise ValueError("%s -- Cannot track changes to data with duplicate rows (%s): %s." % (str(self), data_type.value, row))
+
+                key_index[key] = index
+
+            self._key_indexes[data_type] = key_index
+
+        return self._key_indexes[data_type]
+
+    def _log_change(self, operation, data_type, old_row, new_row):
+        self._version += 1
+        self._changes.append((self._version, operation, data_type, old_row, new_row))
+
+    def _reset_changes(self):
+        self._version += 1
+        self._tracked_version = self._version
+        self._changes = []
+
+        # Built on first use.
+        # {dataType: {(arg, ...): row index, ...}, ...}
+        self._key_indexes = {}
+
     def __repr__(self):
         return "%s/%d" % (self._name, self._arity)
 
@@ -199,3 +392,21 @@ class Relation(object):
             rtn['variable_type'] = self._variable_types
 
         return rtn
+
+def compute_data_fingerprint(rows):
+    """
+    Compute a data fingerprint from scratch (the same as Relation.data_fingerprint() for the same rows).
+    """
+
+    return _format_data_fingerprint(sum(map(_hash_row, rows)) % DATA_HASH_MODULUS, len(rows))
+
+def _hash_row(row):
+    # Values are compared as strings (like the rest of SRLi does when matching atoms).
+    # The repr quotes (and escapes) each value, so values can not run together (e.g. ['a\tb'] and ['a', 'b']).
+    return _hash_text(repr(list(map(str, row))))
+
+def _hash_text(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size = DATA_HASH_BYTES).digest(), 'little')
+
+def _format_data_fingerprint(data_hash, count):
+    return "%0*x-%d" % (DATA_HASH_BYTES * 2, data_hash, count)
@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 class Rule(object):
     def __init__(self, text, weight = None, options = {}, **kwargs):
         self._text = text
@@ -28,6 +31,13 @@ class Rule(object):
 
         return "%s: %s" % (weight, self._text)
 
+    def fingerprint(self):
+        """
+        A fingerprint of the text, weight, and options of this rule.
+        """
+
+        return hashlib.blake2b(json.dumps(self.to_dict(), sort_keys = True, default = str).encode(), digest_size = 16).hexdigest()
+
     def to_dict(self):
         return {
             'text': self._text,
@@ -1,56 +1,60 @@
+import hashlib
 import json
 
+import numpy
+
 DEFAULT_TRUTH_THRESHOLD = 0.5
 
 
 def get_eval_values(relation, results, discretize = False, truth_threshold = DEFAULT_TRUTH_THRESHOLD):
     """
     Take in the results from inference (for a single predicate),
-    and format the data for each relation into two lists of floats representing the predicted and truth value for each data point.
-    These lists should be able to be directly passed into general sklean evaluation/scoring metrics.
+    and format the data for each relation into two arrays of floats representing the predicted and truth value for each data point.
+    These arrays should be able to be directly passed into general sklean evaluation/scoring metrics.
+    Values are aligned on the atom arguments (compared as strings), in the order of the truth data.
     Return: (expected, predicted)
     """
 
-    # Order results/truth to match.
-    expected = list(sorted([list(map(str, row)) for row in relation.get_truth_data()]))
-    if (len(expected) == 0):
-        return [], []
+    truth = relation.get_truth_data()
+    if (len(truth) == 0):
+        return numpy.zeros(0), numpy.zeros(0)
 
-    predicted = list(sorted([list(map(str, row)) for row in results]))
+    if (len(truth) > len(results)):
+        raise ValueError("Expecting (%d) more values than actually predicted (%d)." % (len(truth), len(results)))
 
-    if (len(expected) > len(predicted)):
-        raise ValueError("Expecting (%d) more values than actually predicted (%d)." % (len(expected), len(predicted)))
+    # A single hash join from truth into the predictions.
+    # {(argument, ...): prediction index, ...}
+    predicted_indexes = {tuple(map(str, row[0:-1])) : index for (index, row) in enumerate(results)}
 
-    # If the sizes don't match, then that means there may be latent or missing variables.
-    output_warning = False
-    if (len(expected) != len(predicted)):
-        new_expected = []
-        new_predicted = []
+    truth_positions = numpy.empty(len(truth), dtype = numpy.int64)
+    predicted_positions = numpy.empty(len(truth), dtype = numpy.int64)
+    count = 0
 
-        expected_map = {tuple(row[0:-1]) : float(row[-1]) for row in expected}
-        predicted_map = {tuple(row[0:-1]) : float(row[-1]) for row in predicted}
+    # If there are truth atoms that are not in the predictions, then there may be latent or missing variables.
+    missing_key = None
 
-        for key in expected_map:
-            if (key not in predicted_map):
-                if (not output_warning):
-                    print("WARNING: Atom(s) for the %s relation were found in truth (len: %d) that were not in the predictions (len: %d). Example: %s(%s)." % (relation.name(), len(expected), len(predicted), relation.name(), ', '.join(map(str, key))))
-                    output_warning = True
+    for (truth_index, row) in enumerate(truth):
+        key = tuple(map(str, row[0:-1]))
 
-                continue
+        predicted_index = predicted_indexes.get(key)
+        if (predicted_index is None):
+            if (missing_key is None):
+                missing_key = key
+            continue
+
+        truth_positions[count] = truth_index
+        predicted_positions[count] = predicted_index
+        count += 1
 
-            new_expected.append(expected_map[key])
-            new_predicted.append(predicted_map[key])
+    if (missing_key is not None):
+        print("WARNING: Atom(s) for the %s relation were found in truth (len: %d) that were not in the predictions (len: %d). Example: %s(%s)." % (relation.name(), len(truth), len(results), relation.name(), ', '.join(map(str, missing_key))))
 
-        expected = new_expected
-        predicted = new_predicted
-    else:
-        # Once sorted, just get the values.
-        expected = [float(row[-1]) for row in expected]
-        predicted = [float(row[-1]) for row in predicted]
+    expected = numpy.fromiter((float(row[-1]) for row in truth), dtype = float, count = len(truth))[truth_positions[0:count]]
+    predicted = numpy.fromiter((float(row[-1]) for row in results), dtype = float, count = len(results))[predicted_positions[0:count]]
 
     if (discretize):
-        expected = [int(value >= truth_threshold) for value in expected]
-        predicted = [int(value >= truth_threshold) for value in predicted]
+        expected = (expected >= truth_threshold).astype(int)
+        predicted = (predicted >= truth_threshold).astype(int)
 
     return expected, predicted
 
@@ -59,35 +63,118 @@ def get_eval_categories(relation, results, label_indexes = [-1]):
     Like get_eval_values(), but will get labels instead of truth values.
     Labels are identified using label_indexes (negative indexes are allowed).
     Any label that is not an index is used to identify the entity represented by the data point.
+    The best label for an entity is the one with the highest value, ties go to the row that appears first.
     Returns: (expected label, predicted label, entity)
     """
 
     label_indexes = [index if (index >= 0) else (relation.arity() + index ) for index in label_indexes]
     entity_indexes = list(sorted(set(range(relation.arity())) - set(label_indexes)))
 
-    # {(entity): [(best label), best value], ...}
-    expected_values = {}
-    predicted_values = {}
+    truth = relation.get_truth_data()
+
+    # Every (stringified) argument is interned (shared between truth and results),
+    # so that all the grouping can be done on integer arrays.
+    # Rows [0, len(truth)) are truth, and the rest are results.
+    # {value: id, ...}
+    value_ids = {}
+
+    columns = {}
+    for index in set(entity_indexes) | set(label_indexes):
+        columns[index] = numpy.concatenate((_intern_column(truth, index, value_ids), _intern_column(results, index, value_ids)))
+
+    values = numpy.concatenate((
+        numpy.fromiter((float(row[-1]) for row in truth), dtype = float, count = len(truth)),
+        numpy.fromiter((float(row[-1]) for row in results), dtype = float, count = len(results)),
+    ))
+
+    entity_keys = _combine_columns([columns[index] for index in entity_indexes], len(truth) + len(results))
+
+    truth_entities, truth_rows = _group_best_rows(entity_keys[0:len(truth)], values[0:len(truth)])
+    predicted_entities, predicted_rows = _group_best_rows(entity_keys[len(truth):], values[len(truth):])
+    predicted_rows += len(truth)
+
+    if (len(truth_entities) != len(predicted_entities)):
+        print("Warning: found different sizes for truth (%d) and predictions (%d)." % (len(truth_entities), len(predicted_entities)))
 
-    for (source, dest) in [(relation.get_truth_data(), expected_values), (results, predicted_values)]:
-        for row in source:
-            value = float(row[-1])
-            entity = tuple([str(row[index]) for index in entity_indexes])
-            label = tuple([str(row[index]) for index in label_indexes])
+    _, truth_positions, predicted_positions = numpy.intersect1d(truth_entities, predicted_entities, assume_unique = True, return_indices = True)
 
-            if ((entity not in dest) or (value > dest[entity][1])):
-                dest[entity] = [label, value]
+    value_keys = list(value_ids.keys())
 
-    if (len(expected_values) != len(predicted_values)):
-        print("Warning: found different sizes for truth (%d) and predictions (%d)." % (len(expected_values), len(predicted_values)))
+    def get_key(row, indexes):
+        return tuple([value_keys[columns[index][row]] for index in indexes])
 
-    entities = list(sorted(set(expected_values.keys()) & set(predicted_values.keys())))
+    # [(entity, expected label, predicted label), ...]
+    rows = [(get_key(truth_row, entity_indexes), get_key(truth_row, label_indexes), get_key(predicted_row, label_indexes))
+            for (truth_row, predicted_row) in zip(truth_rows[truth_positions].tolist(), predicted_rows[predicted_positions].tolist())]
+    rows.sort()
 
-    expected = [expected_values[entity][0] for entity in entities]
-    predicted = [predicted_values[entity][0] for entity in entities]
+    expected = [expected_label for (_, expected_label, _) in rows]
+    predicted = [predicted_label for (_, _, predicted_label) in rows]
+    entities = [entity for (entity, _, _) in rows]
 
     return expected, predicted, entities
 
+def _intern_column(rows, index, value_ids):
+    """
+    Get the id for the (stringified) value at |index| in each row, adding new values to |value_ids|.
+    """
+
+    return numpy.fromiter((value_ids.setdefault(str(row[index]), len(value_ids)) for row in rows), dtype = numpy.int64, count = len(rows))
+
+def _combine_columns(columns, size):
+    """
+    Combine columns of non-negative ids into a single integer key per row (equal keys iff all columns are equal).
+    """
+
+    keys = numpy.zeros(size, dtype = numpy.int64)
+
+    for column in columns:
+        if (size == 0):
+            break
+
+        width = int(column.max()) + 1
+
+        # Re-number the keys (keeping the same grouping) if the next step could overflow.
+        if ((int(keys.max()) + 1) * width >= 2 ** 62):
+            keys = numpy.unique(keys, return_inverse = True)[1].reshape(-1)
+
+        keys = keys * width + column
+
+    return keys
+
+def _group_best_rows(keys, values):
+    """
+    For each distinct key, find the row with the highest value (the earliest row wins ties).
+    Returns: ([distinct key, ...] (sorted), [best row for each key, ...])
+    """
+
+    if (len(keys) == 0):
+        return numpy.zeros(0, dtype = numpy.int64), numpy.zeros(0, dtype = numpy.int64)
+
+    # Sort by key, then by descending value, then by position. The first row of each key is the best.
+    order = numpy.lexsort((numpy.arange(len(keys)), -values, keys))
+    sorted_keys = keys[order]
+
+    starts = numpy.flatnonzero(numpy.concatenate(([True], sorted_keys[1:] != sorted_keys[0:-1])))
+
+    return sorted_keys[starts], order[starts]
+
+def model_fingerprint(relations, rules):
+    """
+    A fingerprint of a full model: every rule (text, weight, and options) and every relation (schema and data).
+    This only uses the already-maintained relation data hashes, so it does not look at any data.
+    """
+
+    hasher = hashlib.blake2b(digest_size = 16)
+
+    for rule in rules:
+        hasher.update(("rule\0%s\0" % (rule.fingerprint())).encode())
+
+    for relation in relations:
+        hasher.update(("relation\0%s\0" % (relation.fingerprint())).encode())
+
+    return hasher.hexdigest()
+
 def load_json_with_comments(path):
     contents = []
     with open(path, 'r') as file:
@@ -1,7 +1,10 @@
 import os
+import random
 import unittest
 
 import srli.engine
+import srli.engine.mln.native
+import srli.relation
 
 class BaseTest(unittest.TestCase):
     """
@@ -14,3 +17,40 @@ class BaseTest(unittest.TestCase):
 
     def assertClose(self, a, b):
         self.assertTrue(abs(a - b) <= self.EPSILON)
+
+    def build_social_relations(self, size = 15, seed = 4):
+        """
+        A small random social network (of any size) for tests that need to change or resolve a model:
+        observed Friends links, and Smokes observed for every third person (the rest are targets).
+        Returns: (friends, smokes)
+        """
+
+        rng = random.Random(seed)
+
+        friends = srli.relation.Relation('Friends', arity = 2)
+        smokes = srli.relation.Relation('Smokes', arity = 1)
+
+        friends.add_observed_data([[str(a), str(b), '1.0'] for a in range(size) for b in range(size) if ((a != b) and (rng.random() < 0.3))])
+        smokes.add_observed_data([[str(person), str(float(rng.randint(0, 1)))] for person in range(0, size, 3)])
+        smokes.add_unobserved_data([[str(person)] for person in range(size) if (person % 3 != 0)])
+
+        return (friends, smokes)
+
+    def mln_objective(self, relations, rules, results):
+        """
+        A common objective for comparing results (from any engine):
+        the total weight of unsatisfied MLN ground rules (and priors) when all the results are rounded to 0/1.
+        """
+
+        engine = srli.engine.mln.native.NativeMLN(relations, rules, normalize_weights = False)
+        ground_rules, atoms = engine._process_ground_program(engine._ground(), include_priors_as_groundings = True)
+
+        # {(predicate, (arg, ...)): value, ...}
+        values = {}
+        for (relation, rows) in results.items():
+            for row in rows:
+                values[(relation.name().upper(), tuple(map(str, row[0:-1])))] = int(float(row[-1]) >= 0.5)
+
+        atom_values = {atom_index : values.get((atom['predicate'], tuple(atom['arguments'])), 0) for (atom_index, atom) in atoms.items()}
+
+        return sum([ground_rule.loss(atom_values) for ground_rule in ground_rules])
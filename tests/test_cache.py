@@ -0,0 +1,97 @@
+import os
+import stat
+import tempfile
+import unittest.mock
+
+import srli.cache
+import srli.relation
+import srli.rule
+import tests.base
+
+class CacheTest(tests.base.BaseTest):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._cache = srli.cache.ResultCache(cache_dir = self._temp_dir.name)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _model(self):
+        relation = srli.relation.Relation('Smokes', arity = 1, negative_prior_weight = 0.1)
+        relation.add_observed_data([['Alice', 1.0]])
+        relation.add_unobserved_data([['Bob']])
+
+        rules = [srli.rule.Rule('Smokes(A) -> Smokes(B)', weight = 1.0)]
+
+        return relation, rules
+
+    def test_round_trip(self):
+        relation, rules = self._model()
+        key = self._cache.fingerprint('NativeMLN', [relation], rules, seed = 4)
+
+        self.assertIsNone(self._cache.get(key, [relation]))
+
+        self._cache.put(key, {relation: [['Bob', 0.75]]})
+        results = self._cache.get(key, [relation])
+
+        self.assertEqual(results, {relation: [['Bob', 0.75]]})
+        self.assertEqual((self._cache.hits, self._cache.misses), (1, 1))
+
+    def test_fingerprint_changes(self):
+        relation, rules = self._model()
+        base_key = self._cache.fingerprint('NativeMLN', [relation], rules, seed = 4)
+
+        self.assertEqual(base_key, self._cache.fingerprint('NativeMLN', [relation], rules, seed = 4))
+        self.assertNotEqual(base_key, self._cache.fingerprint('PSL', [relation], rules, seed = 4))
+        self.assertNotEqual(base_key, self._cache.fingerprint('NativeMLN', [relation], rules, seed = 5))
+        self.assertNotEqual(base_key, self._cache.fingerprint('NativeMLN', [relation], rules, seed = 4, options = {'max_flips': 10}))
+
+        rules[0].set_weight(0.5)
+        self.assertNotEqual(base_key, self._cache.fingerprint('NativeMLN', [relation], rules, seed = 4))
+        rules[0].set_weight(1.0)
+
+        relation.set_negative_prior_weight(0.2)
+        self.assertNotEqual(base_key, self._cache.fingerprint('NativeMLN', [relation], rules, seed = 4))
+        relation.set_negative_prior_weight(0.1)
+
+        relation.add_observed_data([['Carol', 0.0]])
+        self.assertNotEqual(base_key, self._cache.fingerprint('NativeMLN', [relation], rules, seed = 4))
+
+    def test_no_seed(self):
+        relation, rules = self._model()
+
+        # Results without a seed are not reproducible.
+        self.assertIsNone(self._cache.fingerprint('NativeMLN', [relation], rules))
+
+    def test_private_dir(self):
+        relation, _ = self._model()
+
+        cache_dir = os.path.join(self._temp_dir.name, 'results')
+        cache = srli.cache.ResultCache(cache_dir = cache_dir)
+        cache.put('a', {relation: [['Bob', 0.75]]})
+
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(cache_dir).st_mode))
+        self.assertTrue(srli.cache.DEFAULT_CACHE_DIR.startswith(srli.cache.USER_CACHE_DIR))
+
+        # A directory made by someone else is never read from or written to.
+        with unittest.mock.patch.object(os, 'getuid', return_value = os.getuid() + 1):
+            self.assertRaises(RuntimeError, cache.get, 'a', [relation])
+            self.assertRaises(RuntimeError, cache.put, 'b', {relation: [['Bob', 0.75]]})
+
+    def test_eviction(self):
+        relation, _ = self._model()
+        results = {relation: [[str(i), 0.5] for i in range(1000)]}
+
+        self._cache.put('a', results)
+        entry_size = os.path.getsize(os.path.join(self._temp_dir.name, 'a' + srli.cache.ENTRY_SUFFIX))
+
+        # Room for two entries.
+        cache = srli.cache.ResultCache(cache_dir = self._temp_dir.name, max_size_mb = (2.5 * entry_size) / (1024 * 1024))
+
+        cache.put('b', results)
+        os.utime(os.path.join(self._temp_dir.name, 'a' + srli.cache.ENTRY_SUFFIX), (0, 0))
+        cache.put('c', results)
+
+        self.assertIsNone(cache.get('a', [relation]))
+        self.assertIsNotNone(cache.get('b', [relation]))
+        self.assertIsNotNone(cache.get('c', [relation]))
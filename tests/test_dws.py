@@ -0,0 +1,30 @@
+import srli.engine.logic.dws
+import srli.relation
+import srli.rule
+import tests.base
+
+class DiscreteWeightedSolverTest(tests.base.BaseTest):
+    """
+    Search in DiscreteWeightedSolver should only ever move unobserved atoms.
+    """
+
+    def test_cold_start_keeps_evidence(self):
+        size = 20
+
+        smokes = srli.relation.Relation('Smokes', arity = 1)
+        cancer = srli.relation.Relation('Cancer', arity = 1)
+
+        smokes.add_observed_data([[str(person), '1.0'] for person in range(size)])
+        cancer.add_unobserved_data([[str(person)] for person in range(size)])
+
+        rules = [
+            srli.rule.Rule('Smokes(A) -> Cancer(A)', weight = 1.0),
+            srli.rule.Rule('!Cancer(A)', weight = 0.1),
+        ]
+
+        # Everyone smokes, so only randomized (overwritten) evidence could leave anyone without cancer.
+        results = srli.engine.logic.dws.DiscreteWeightedSolver((smokes, cancer), rules, seed = 4).solve()
+
+        self.assertEqual(size, len(results[cancer]))
+        for row in results[cancer]:
+            self.assertEqual(1.0, float(row[-1]))
@@ -0,0 +1,146 @@
+import os
+import random
+
+import srli.engine.grounding
+import srli.engine.logic.dws
+import srli.engine.mln.native
+import srli.engine.psl.engine
+import srli.relation
+import srli.rule
+import tests.base
+
+class GroundingTest(tests.base.BaseTest):
+    """
+    Incremental grounding should always give the same ground program as a full reground (by PSL).
+    """
+
+    def _build(self):
+        data_dir = os.path.join(tests.base.BaseTest.DATA_DIR, 'simpleacquaintances', 'data')
+
+        lived = srli.relation.Relation('Lived', arity = 2)
+        likes = srli.relation.Relation('Likes', arity = 2)
+        knows = srli.relation.Relation('Knows', arity = 2)
+
+        lived.add_observed_data(path = os.path.join(data_dir, 'lived_obs.txt'))
+        likes.add_observed_data(path = os.path.join(data_dir, 'likes_obs.txt'))
+        knows.add_observed_data(path = os.path.join(data_dir, 'knows_obs.txt'))
+        knows.add_unobserved_data(path = os.path.join(data_dir, 'knows_targets.txt'))
+
+        rules = [
+            srli.rule.Rule('Lived(P1, L) & Lived(P2, L) & (P1 != P2) -> Knows(P1, P2)', weight = 0.20),
+            srli.rule.Rule('Lived(P1, L1) & Lived(P2, L2) & (P1 != P2) & (L1 != L2) -> !Knows(P1, P2)', weight = 0.05),
+            srli.rule.Rule('Likes(P1, L) & Likes(P2, L) & (P1 != P2) -> Knows(P1, P2)', weight = 0.10),
+            srli.rule.Rule('Knows(P1, P2) & Knows(P2, P3) & (P1 != P3) -> Knows(P1, P3)', weight = 0.05),
+            srli.rule.Rule('Knows(P1, P2) = Knows(P2, P1)'),
+        ]
+
+        return (lived, likes, knows), rules
+
+    def _apply_deltas(self, rng, lived, likes, knows, deleted_lived = [], insert_first = False):
+        """
+        Change the data in ways that keep the model valid (every needed target still exists).
+        If |insert_first|, then atoms that move between observed and unobserved are inserted as their new type
+        before their old row is deleted.
+        Returns the deleted lived rows (to be added back next time).
+        """
+
+        for row in rng.sample(list(knows.get_observed_data()), 5):
+            knows.update_data([[row[0], row[1], str(float(rng.randint(0, 1)))]])
+
+        # Observations that become targets.
+        moved = rng.sample(list(knows.get_observed_data()), 3)
+        if (insert_first):
+            knows.insert_data([row[0:2] for row in moved], data_type = 'unobserved')
+            knows.delete_data(moved)
+        else:
+            knows.delete_data(moved)
+            knows.insert_data([row[0:2] for row in moved], data_type = 'unobserved')
+
+        # A target that becomes observed.
+        row = rng.choice(list(knows.get_unobserved_data()))
+        if (insert_first):
+            knows.insert_data([[row[0], row[1], '1.0']])
+            knows.delete_data([row], data_type = 'unobserved')
+        else:
+            knows.delete_data([row], data_type = 'unobserved')
+            knows.insert_data([[row[0], row[1], '1.0']])
+
+        likes.update_data([[row[0], row[1], '0.0'] for row in rng.sample(list(likes.get_observed_data()), 3)])
+
+        lived.insert_data(deleted_lived)
+        deleted_lived = rng.sample(list(lived.get_observed_data()), 2)
+        lived.delete_data(deleted_lived)
+
+        return deleted_lived
+
+    def _canonical(self, atoms, ground_rules):
+        atoms = {int(atom_id) : atom for (atom_id, atom) in atoms.items()}
+
+        def key(atom_id):
+            return (atoms[atom_id]['predicate'], tuple(atoms[atom_id]['arguments']))
+
+        canonical_rules = sorted([(ground_rule['ruleIndex'], ground_rule['operator'], float(ground_rule['constant']), float(ground_rule['weight']),
+                tuple(sorted([(key(atom_id), float(coefficient)) for (atom_id, coefficient) in zip(ground_rule['atoms'], ground_rule['coefficients'])])))
+                for ground_rule in ground_rules])
+
+        canonical_atoms = sorted([(key(atom_id), bool(atom['observed']), float(atom['value']) if atom['observed'] else None) for (atom_id, atom) in atoms.items()])
+
+        return canonical_rules, canonical_atoms
+
+    def _test_matches_full_ground(self, all_atoms, insert_first = False):
+        relations, rules = self._build()
+        lived, likes, knows = relations
+
+        def ground():
+            engine = srli.engine.psl.engine.PSL(relations, rules)
+            return engine.ground(ignore_priors = True, ignore_sum_constraint = True, get_all_atoms = all_atoms)
+
+        program = srli.engine.grounding.GroundProgram(relations, rules, ground(), all_atoms = all_atoms)
+
+        rng = random.Random(4)
+        deleted_lived = []
+
+        for step in range(3):
+            deleted_lived = self._apply_deltas(rng, lived, likes, knows, deleted_lived, insert_first = insert_first)
+
+            update = program.update()
+            self.assertIsNotNone(update)
+
+            removed, added = update
+            self.assertTrue(len(removed) > 0)
+            self.assertTrue(len(added) > 0)
+
+            expected = ground()
+            self.assertEqual(self._canonical(expected['atoms'], expected['groundRules']),
+                    self._canonical(program.atoms, list(program.ground_rules.values())))
+
+        # Untracked changes need a full reground.
+        knows.add_observed_data([['100', '101', '1.0']])
+        self.assertIsNone(program.update())
+
+    def test_matches_full_ground(self):
+        self._test_matches_full_ground(False)
+
+    def test_matches_full_ground_all_atoms(self):
+        self._test_matches_full_ground(True)
+
+    def test_matches_full_ground_insert_first(self):
+        self._test_matches_full_ground(False, insert_first = True)
+        self._test_matches_full_ground(True, insert_first = True)
+
+    def test_incremental_engines(self):
+        for engine_type in [srli.engine.mln.native.NativeMLN, srli.engine.logic.dws.DiscreteWeightedSolver]:
+            relations, rules = self._build()
+            lived, likes, knows = relations
+
+            engine = engine_type(relations, rules, seed = 4, incremental = True)
+            engine.solve()
+
+            ground_program = engine._ground_program
+            self._apply_deltas(random.Random(4), lived, likes, knows)
+
+            results = engine.solve()
+
+            # Updated, not regrounded.
+            self.assertIs(ground_program, engine._ground_program)
+            self.assertEqual(len(knows.get_unobserved_data()), len(results[knows]))
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+
+import tests.base
+
+# Heavy dependencies that should only be loaded by the engines/metrics that use them.
+HEAVY_MODULES = ['docker', 'jpype', 'lark', 'problog', 'pslpython', 'pysat', 'sklearn']
+
+# Generous, this is only meant to catch a heavy import sneaking back in.
+MAX_IMPORT_TIME_SECS = 1.0
+
+# Run in a fresh interpreter so nothing is already imported.
+SCRIPT = '''
+import json
+import sys
+import time
+
+start_time = time.perf_counter()
+
+import srli.engine
+import srli.evaluation
+import srli.pipeline
+
+srli.engine.load(srli.engine.Engine.MLN_Native)
+
+import_time = time.perf_counter() - start_time
+
+print(json.dumps({
+    'import_time': import_time,
+    'modules': sorted({name.split('.')[0] for name in sys.modules}),
+}))
+'''
+
+class ImportTest(tests.base.BaseTest):
+    def test_lazy_imports(self):
+        env = dict(os.environ)
+        src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+        env['PYTHONPATH'] = os.pathsep.join([src_dir] + [path for path in [env.get('PYTHONPATH')] if path])
+
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT], env = env, universal_newlines = True)
+        result = json.loads(output.strip().splitlines()[-1])
+
+        print("Import time: %0.3fs." % (result['import_time']))
+
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, result['modules'], "Module (%s) was imported at startup." % (module))
+
+        self.assertTrue(result['import_time'] <= MAX_IMPORT_TIME_SECS,
+                "Importing SRLi took too long. Expected at most %fs, found %f." % (MAX_IMPORT_TIME_SECS, result['import_time']))
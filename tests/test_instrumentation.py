@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import types
+import unittest.mock
+
+import srli.instrumentation
+import tests.base
+
+class InstrumentationTest(tests.base.BaseTest):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._temp_dir.name, 'instrumentation.jsonl')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _records(self):
+        with open(self._path, 'r') as file:
+            return [json.loads(line) for line in file]
+
+    def test_phases(self):
+        instrumentation = srli.instrumentation.Instrumentation(self._path, engine = 'NativeMLN')
+
+        with instrumentation.phase('outer'):
+            with instrumentation.phase('inner'):
+                time.sleep(0.05)
+
+            with instrumentation.phase('inner'):
+                pass
+
+        instrumentation.close()
+
+        records = self._records()
+
+        # Phases are written as they finish.
+        self.assertEqual(['outer/inner', 'outer/inner', 'outer'], [record['path'] for record in records])
+        self.assertEqual(['inner', 'inner', 'outer'], [record['phase'] for record in records])
+
+        for record in records:
+            self.assertEqual('phase', record['type'])
+            self.assertEqual('NativeMLN', record['engine'])
+            self.assertIn('timestamp', record)
+            self.assertIn('cpu_time', record)
+            self.assertNotIn('tracemalloc_peak', record)
+
+            if (srli.instrumentation.get_peak_rss() is not None):
+                self.assertTrue(record['peak_rss_kb'] > 0)
+                self.assertIn('peak_rss_children_kb', record)
+
+        self.assertTrue(records[0]['wall_time'] >= 0.05)
+        self.assertTrue(records[2]['wall_time'] >= records[0]['wall_time'] + records[1]['wall_time'])
+
+    def test_counters(self):
+        instrumentation = srli.instrumentation.Instrumentation(self._path)
+
+        instrumentation.count('flips')
+        instrumentation.count('flips', 10)
+        instrumentation.set('atoms', 5)
+        instrumentation.set('atoms', 7)
+        instrumentation.close()
+
+        # Counters are reset on close, so nothing new is written.
+        instrumentation.close()
+
+        instrumentation.count('flips')
+        instrumentation.close()
+
+        records = self._records()
+
+        self.assertEqual(2, len(records))
+        self.assertEqual('counters', records[0]['type'])
+        self.assertEqual({'flips': 11, 'atoms': 7}, records[0]['counters'])
+        self.assertEqual({'flips': 1}, records[1]['counters'])
+
+    def test_no_path(self):
+        instrumentation = srli.instrumentation.Instrumentation()
+
+        with instrumentation.phase('outer'):
+            instrumentation.count('flips')
+
+        instrumentation.close()
+
+        self.assertFalse(os.path.exists(self._path))
+
+    def test_trace_memory(self):
+        self.assertFalse(tracemalloc.is_tracing())
+
+        instrumentation = srli.instrumentation.Instrumentation(self._path, trace_memory = True)
+
+        with instrumentation.phase('outer'):
+            with instrumentation.phase('big'):
+                data = [0] * 1000000
+                del data
+
+            with instrumentation.phase('small'):
+                data = [0] * 10
+                del data
+
+        instrumentation.close()
+
+        # Tracing is stopped by whoever started it.
+        self.assertFalse(tracemalloc.is_tracing())
+
+        peaks = {record['phase'] : record['tracemalloc_peak'] for record in self._records()}
+
+        # Each phase gets its own peak, and outer phases include their inner phases.
+        self.assertTrue(peaks['big'] >= 1000000 * 8)
+        self.assertTrue(peaks['small'] < 1000000)
+        self.assertTrue(peaks['outer'] >= peaks['big'])
+
+    def test_trace_memory_without_reset_peak(self):
+        # Before Python 3.9, tracemalloc has no reset_peak().
+        old_tracemalloc = types.SimpleNamespace(**{name : getattr(tracemalloc, name) for name in ['is_tracing', 'start', 'stop', 'get_traced_memory']})
+
+        with unittest.mock.patch.object(srli.instrumentation, 'tracemalloc', old_tracemalloc):
+            instrumentation = srli.instrumentation.Instrumentation(self._path, trace_memory = True)
+
+            with instrumentation.phase('outer'):
+                with instrumentation.phase('inner'):
+                    pass
+
+            instrumentation.close()
+
+        self.assertFalse(tracemalloc.is_tracing())
+
+        records = self._records()
+        self.assertEqual(['inner', 'outer'], [record['phase'] for record in records])
+        for record in records:
+            self.assertIn('tracemalloc_peak', record)
@@ -0,0 +1,178 @@
+import multiprocessing
+import random
+import time
+
+import srli.engine.problog.base
+import srli.engine.problog.engine
+import srli.engine.problog.noncollective
+import srli.relation
+import srli.rule
+import tests.base
+
+# ProbLog writes every ground rule with a probability of 1.0, so only the (fractional) evidence makes marginals interesting.
+def _build_fractional(size = 8, seed = 4):
+    rng = random.Random(seed)
+
+    friends = srli.relation.Relation('Friends', arity = 2)
+    smokes = srli.relation.Relation('Smokes', arity = 1)
+
+    friends.add_observed_data([[str(a), str(b), '%.2f' % (rng.random())] for a in range(size) for b in range(size) if ((a != b) and (rng.random() < 0.4))])
+    smokes.add_observed_data([[str(person), '%.2f' % (rng.random())] for person in range(0, size, 3)])
+    smokes.add_unobserved_data([[str(person)] for person in range(size) if (person % 3 != 0)])
+
+    rules = [srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 1.0)]
+
+    return (friends, smokes), rules
+
+class NonCollectiveProbLogTest(tests.base.BaseTest):
+    """
+    The update modes and schedules of NonCollectiveProbLog should all reach the same fixpoint.
+    """
+
+    TOLERANCE = 1e-3
+
+    def _solve(self, relations, rules, max_iterations = 100, **kwargs):
+        engine = srli.engine.problog.noncollective.NonCollectiveProbLog(relations, rules, seed = 4,
+                max_iterations = max_iterations, stop_movement = 1e-6, **kwargs)
+        results = engine.solve()
+
+        # {(arg, ...): value, ...}
+        return engine, {tuple(row[0:-1]) : float(row[-1]) for row in results[relations[1]]}
+
+    def _assertMarginalsClose(self, expected, actual, tolerance):
+        self.assertEqual(set(expected.keys()), set(actual.keys()))
+        for key in expected:
+            self.assertTrue(abs(expected[key] - actual[key]) <= tolerance, "%s: %f vs %f" % (key, expected[key], actual[key]))
+
+    def test_update_modes(self):
+        relations, rules = _build_fractional()
+
+        _, gauss_seidel = self._solve(relations, rules)
+        _, jacobi = self._solve(relations, rules, update_mode = srli.engine.problog.noncollective.NonCollectiveProbLog.UPDATE_JACOBI, num_workers = 2)
+
+        # Make sure the fixpoint is not trivial.
+        self.assertTrue(any([(0.0 < value < 1.0) for value in gauss_seidel.values()]))
+        self._assertMarginalsClose(gauss_seidel, jacobi, NonCollectiveProbLogTest.TOLERANCE)
+
+    def test_schedules(self):
+        relations, rules = _build_fractional()
+
+        _, sweep = self._solve(relations, rules)
+        _, residual = self._solve(relations, rules, schedule = srli.engine.problog.noncollective.NonCollectiveProbLog.SCHEDULE_RESIDUAL,
+                residual_threshold = 1e-6)
+
+        self._assertMarginalsClose(sweep, residual, NonCollectiveProbLogTest.TOLERANCE)
+
+    def test_cache(self):
+        # Disjoint pairs of friends (with the same evidence), so every neighbourhood is isomorphic.
+        size = 6
+
+        friends = srli.relation.Relation('Friends', arity = 2)
+        smokes = srli.relation.Relation('Smokes', arity = 1)
+
+        friends.add_observed_data([[str(i), str(i + size), '0.6'] for i in range(size)])
+        smokes.add_observed_data([[str(i), '0.7'] for i in range(size)])
+        smokes.add_unobserved_data([[str(i + size)] for i in range(size)])
+
+        rules = [srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 1.0)]
+
+        _, expected = self._solve((friends, smokes), rules, max_iterations = 1)
+        engine, actual = self._solve((friends, smokes), rules, max_iterations = 1, cache_size = 10)
+
+        self.assertEqual(1, engine._cache.misses)
+        self.assertEqual(size - 1, engine._cache.hits)
+
+        self._assertMarginalsClose(expected, actual, self.EPSILON)
+        for value in actual.values():
+            self.assertClose(0.42, value)
+
+class ProbLogTest(tests.base.BaseTest):
+    """
+    Splitting into components, budgets, and backends for the (collective) ProbLog engine.
+    """
+
+    NUM_GROUPS = 3
+
+    def _build(self):
+        """
+        Independent groups of three friends: only the first smoker in each group is observed,
+        so every group is its own component (of two unobserved atoms).
+        """
+
+        friends = srli.relation.Relation('Friends', arity = 2)
+        smokes = srli.relation.Relation('Smokes', arity = 1)
+
+        for group in range(ProbLogTest.NUM_GROUPS):
+            first, second, third = [str(group * 3 + i) for i in range(3)]
+
+            friends.add_observed_data([[first, second, '0.6'], [second, third, '0.8']])
+            smokes.add_observed_data([[first, '0.7']])
+            smokes.add_unobserved_data([[second], [third]])
+
+        rules = [srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 1.0)]
+
+        return (friends, smokes), rules
+
+    def _solve(self, **kwargs):
+        relations, rules = self._build()
+        smokes = relations[1]
+
+        engine = srli.engine.problog.engine.ProbLog(relations, rules, seed = 4, **kwargs)
+        results = engine.solve()
+
+        # {person: value, ...}
+        values = {row[0] : float(row[-1]) for row in results[smokes]}
+        backends = list(engine.backends()[smokes])
+
+        return engine, values, backends
+
+    def _assertExact(self, values):
+        self.assertEqual(ProbLogTest.NUM_GROUPS * 2, len(values))
+
+        for group in range(ProbLogTest.NUM_GROUPS):
+            self.assertClose(0.7 * 0.6, values[str(group * 3 + 1)])
+            self.assertClose(0.7 * 0.6 * 0.8, values[str(group * 3 + 2)])
+
+    def test_split_components(self):
+        relations, rules = self._build()
+        engine = srli.engine.problog.engine.ProbLog(relations, rules)
+        atoms, ground_rules, atom_uses, sum_constraints = engine._prep()
+        self.assertEqual(ProbLogTest.NUM_GROUPS, len(engine._find_components(atoms, ground_rules, sum_constraints)))
+
+        _, split_values, _ = self._solve(split_components = True)
+        _, monolithic_values, _ = self._solve(split_components = False)
+
+        self._assertExact(split_values)
+        self._assertExact(monolithic_values)
+
+    def test_time_limit_fallback(self):
+        _, values, backends = self._solve(time_limit = 1e-4, fallback_backend = srli.engine.problog.base.BACKEND_KBEST)
+
+        self.assertEqual([srli.engine.problog.base.BACKEND_KBEST] * len(backends), backends)
+        for value in values.values():
+            self.assertTrue(0.0 < value < 1.0)
+
+    def test_memory_limit_fallback(self):
+        _, values, backends = self._solve(memory_limit = 1, fallback_backend = srli.engine.problog.base.BACKEND_SAMPLE)
+
+        self.assertEqual([srli.engine.problog.base.BACKEND_SAMPLE] * len(backends), backends)
+        self.assertEqual(ProbLogTest.NUM_GROUPS * 2, len(values))
+
+    def test_backends(self):
+        for name in srli.engine.problog.base.BACKENDS:
+            _, values, backends = self._solve(backend = name)
+
+            self.assertEqual([name] * len(backends), backends)
+            self.assertEqual(ProbLogTest.NUM_GROUPS * 2, len(values))
+
+        self.assertRaises(ValueError, srli.engine.problog.engine.ProbLog, *self._build(), backend = 'unknown')
+
+    def test_kill_without_process_group(self):
+        # A child that has not made its own process group yet (the time limit ran out first) must still be killed.
+        process = multiprocessing.Process(target = time.sleep, args = (60, ))
+        process.start()
+
+        srli.engine.problog.base._kill_process_group(process)
+        process.join(10)
+
+        self.assertFalse(process.is_alive())
@@ -0,0 +1,95 @@
+import os
+import pstats
+import tempfile
+import time
+
+import srli.engine.logic.dws
+import srli.engine.mln.native
+import srli.instrumentation
+import srli.profiling
+import srli.rule
+import tests.base
+
+def _spin(seconds):
+    end_time = time.perf_counter() + seconds
+    while (time.perf_counter() < end_time):
+        pass
+
+class ProfilerTest(tests.base.BaseTest):
+    """
+    Profilers should only profile their selected phases, and write one file per run of a phase.
+    """
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._out_dir = os.path.join(self._temp_dir.name, 'profiles')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _build(self):
+        rules = [srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 0.5)]
+        return self.build_social_relations(size = 8), rules
+
+    def _functions(self, path):
+        return {function for (_, _, function) in pstats.Stats(path).stats.keys()}
+
+    def test_selected_phase(self):
+        relations, rules = self._build()
+
+        profiler = srli.profiling.Profiler(['reason'], out_dir = self._out_dir)
+        engine = srli.engine.mln.native.NativeMLN(relations, rules, seed = 4, profiler = profiler)
+
+        engine.solve(max_flips = 10)
+        engine.solve(max_flips = 10)
+
+        expected = [os.path.join(self._out_dir, name) for name in ['reason.0.prof', 'reason.1.prof']]
+        self.assertEqual(expected, profiler.paths)
+        self.assertEqual(sorted(['reason.0.prof', 'reason.1.prof']), sorted(os.listdir(self._out_dir)))
+
+        # Only reasoning is profiled, not grounding.
+        for path in expected:
+            functions = self._functions(path)
+            self.assertIn('_inference_attempt', functions)
+            self.assertNotIn('_ground', functions)
+
+    def test_nested_phase(self):
+        relations, rules = self._build()
+
+        # Grounding runs inside prep, so it is part of the prep profile.
+        profiler = srli.profiling.Profiler(['prep', 'ground'], out_dir = self._out_dir)
+        engine = srli.engine.logic.dws.DiscreteWeightedSolver(relations, rules, seed = 4, max_iterations = 5, profiler = profiler)
+        engine.solve()
+
+        self.assertEqual(['prep.0.prof'], os.listdir(self._out_dir))
+
+        functions = self._functions(profiler.paths[0])
+        self.assertIn('_ground', functions)
+        self.assertNotIn('_attempt', functions)
+
+    def test_sampling(self):
+        profiler = srli.profiling.Profiler(['outer'], method = srli.profiling.METHOD_SAMPLING, out_dir = self._out_dir, sample_interval = 0.001)
+        instrumentation = srli.instrumentation.Instrumentation(profiler = profiler)
+
+        with instrumentation.phase('outer'):
+            _spin(0.1)
+
+        with instrumentation.phase('other'):
+            pass
+
+        self.assertEqual([os.path.join(self._out_dir, 'outer.0.txt')], profiler.paths)
+        self.assertEqual(['outer.0.txt'], os.listdir(self._out_dir))
+
+        with open(profiler.paths[0], 'r') as file:
+            lines = [line.strip() for line in file]
+
+        self.assertTrue(len(lines) > 0)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(int(count) > 0)
+
+        self.assertTrue(any(['_spin' in line.rsplit(';', 1)[-1] for line in lines]))
+
+    def test_options(self):
+        self.assertRaises(ValueError, srli.profiling.Profiler, ['reason'], method = 'unknown')
+        self.assertRaises(ValueError, srli.profiling.Profiler, ['reason'], method = srli.profiling.METHOD_SAMPLING, sample_interval = 0.0)
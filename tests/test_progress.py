@@ -0,0 +1,163 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import srli.engine.logic.dws
+import srli.engine.mln.native
+import srli.engine.problog.noncollective
+import srli.progress
+import srli.relation
+import srli.rule
+import tests.base
+
+class ProgressTest(tests.base.BaseTest):
+    """
+    Engines should report to a progress sink every |interval| steps of their inner loops (and at the end of each loop),
+    with the fields documented on each engine.
+    """
+
+    INTERVAL = 3
+
+    COMMON_FIELDS = {'engine', 'event', 'elapsed'}
+
+    def _build_mln(self):
+        # The last two rules conflict, so there is never full satisfaction (and search never stops early).
+        rules = [
+            srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 0.5),
+            srli.rule.Rule('Friends(A, B) -> Smokes(B)', weight = 0.1),
+            srli.rule.Rule('Friends(A, B) -> !Smokes(B)', weight = 0.1),
+        ]
+
+        return self.build_social_relations(size = 8), rules
+
+    def _assertEvents(self, events, engine, event, fields):
+        self.assertTrue(len(events) > 0)
+
+        for values in events:
+            self.assertEqual(engine, values['engine'])
+            self.assertEqual(event, values['event'])
+            self.assertEqual(ProgressTest.COMMON_FIELDS | fields, set(values.keys()))
+            self.assertTrue(values['elapsed'] >= 0.0)
+
+    def _assertSteps(self, events, key, last_step):
+        self.assertEqual(list(range(ProgressTest.INTERVAL, last_step + 1, ProgressTest.INTERVAL)), [values[key] for values in events])
+
+    def test_native_mln(self):
+        relations, rules = self._build_mln()
+        max_flips = 20
+        max_tries = 2
+
+        sink = srli.progress.ListProgressSink(interval = ProgressTest.INTERVAL)
+        engine = srli.engine.mln.native.NativeMLN(relations, rules, seed = 4, progress = sink)
+        engine.solve(max_flips = max_flips, max_tries = max_tries)
+
+        flips = [values for values in sink.events if (values['event'] == 'flip')]
+        attempts = [values for values in sink.events if (values['event'] == 'attempt')]
+        fields = {'attempt', 'flip', 'loss', 'best_loss', 'flips_per_sec'}
+
+        self._assertEvents(flips, 'NativeMLN', 'flip', fields)
+        self._assertEvents(attempts, 'NativeMLN', 'attempt', fields)
+
+        self.assertEqual(list(range(1, max_tries + 1)), [values['attempt'] for values in attempts])
+
+        for attempt in attempts:
+            self.assertEqual(max_flips, attempt['flip'])
+            self._assertSteps([values for values in flips if (values['attempt'] == attempt['attempt'])], 'flip', max_flips)
+
+        for values in flips + attempts:
+            self.assertTrue(values['best_loss'] <= values['loss'])
+
+    def test_dws(self):
+        relations, rules = self._build_mln()
+        max_iterations = 10
+        max_retries = 2
+
+        # Never stop an attempt early.
+        sink = srli.progress.ListProgressSink(interval = ProgressTest.INTERVAL)
+        engine = srli.engine.logic.dws.DiscreteWeightedSolver(relations, rules, seed = 4, progress = sink,
+                max_iterations = max_iterations, max_retries = max_retries, stop_loss_delta = -1.0)
+        engine.solve()
+
+        iterations = [values for values in sink.events if (values['event'] == 'iteration')]
+        attempts = [values for values in sink.events if (values['event'] == 'attempt')]
+
+        self._assertEvents(iterations, 'DiscreteWeightedSolver', 'iteration', {'attempt', 'iteration', 'loss', 'loss_delta', 'motion', 'best_loss'})
+        self._assertEvents(attempts, 'DiscreteWeightedSolver', 'attempt', {'attempt', 'iteration', 'loss', 'best_loss'})
+
+        self.assertEqual(list(range(1, max_retries + 1)), [values['attempt'] for values in attempts])
+
+        for attempt in attempts:
+            self.assertEqual(max_iterations, attempt['iteration'])
+            self._assertSteps([values for values in iterations if (values['attempt'] == attempt['attempt'])], 'iteration', max_iterations)
+
+    def test_noncollective_problog(self):
+        friends = srli.relation.Relation('Friends', arity = 2)
+        smokes = srli.relation.Relation('Smokes', arity = 1)
+
+        friends.add_observed_data([['0', '1', '0.6'], ['1', '2', '0.8'], ['2', '0', '0.5']])
+        smokes.add_observed_data([['0', '0.7']])
+        smokes.add_unobserved_data([['1'], ['2']])
+
+        rules = [srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 1.0)]
+        max_iterations = 7
+
+        # Never stop early on movement.
+        sink = srli.progress.ListProgressSink(interval = ProgressTest.INTERVAL)
+        engine = srli.engine.problog.noncollective.NonCollectiveProbLog((friends, smokes), rules, seed = 4, progress = sink,
+                max_iterations = max_iterations, stop_movement = -1.0)
+        engine.solve()
+
+        self._assertEvents(sink.events, 'NonCollectiveProbLog', 'iteration', {'iteration', 'movement', 'updates', 'evaluations'})
+        self._assertSteps(sink.events, 'iteration', max_iterations)
+
+        # Evaluations are counted across the whole solve.
+        evaluations = [values['evaluations'] for values in sink.events]
+        self.assertEqual(sorted(evaluations), evaluations)
+        self.assertTrue(evaluations[0] > 0)
+
+    def test_no_sink(self):
+        relations, rules = self._build_mln()
+
+        engine = srli.engine.mln.native.NativeMLN(relations, rules, seed = 4)
+        self.assertIsNone(engine._progress)
+        engine.solve(max_flips = 10)
+
+    def test_interval(self):
+        self.assertRaises(ValueError, srli.progress.ListProgressSink, interval = 0)
+        self.assertEqual(srli.progress.DEFAULT_INTERVAL, srli.progress.ListProgressSink().interval)
+
+    def test_json_lines_sink(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'progress.jsonl')
+
+            sink = srli.progress.JSONLinesProgressSink(path)
+            self.assertFalse(os.path.exists(path))
+
+            event = {'engine': 'NativeMLN', 'event': 'flip', 'elapsed': 0.5, 'flip': 3}
+            sink.report(event)
+            sink.close()
+
+            # Closed sinks reopen (and append) on the next event.
+            sink.report(event)
+            sink.close()
+
+            with open(path, 'r') as file:
+                records = [json.loads(line) for line in file]
+
+        self.assertEqual(2, len(records))
+        for record in records:
+            self.assertIn('timestamp', record)
+            del record['timestamp']
+            self.assertEqual(event, record)
+
+        # The reported event is not modified.
+        self.assertNotIn('timestamp', event)
+
+    def test_print_sink(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            srli.progress.PrintProgressSink().report({'engine': 'NativeMLN', 'event': 'flip', 'elapsed': 0.5, 'flip': 3})
+
+        self.assertEqual("NativeMLN flip -- elapsed: 0.5, flip: 3\n", output.getvalue())
@@ -0,0 +1,74 @@
+import srli.engine.mln.pysat
+import srli.rule
+import tests.base
+
+class PySATSessionTest(tests.base.BaseTest):
+    """
+    A persistent MaxSAT session should always reach the same optimum as a fresh solver.
+    """
+
+    def _build(self):
+        rules = [
+            srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 0.5),
+            srli.rule.Rule('Friends(A, B) & !Smokes(A) -> !Smokes(B)', weight = 0.7),
+        ]
+
+        return self.build_social_relations(), rules
+
+    def _objective(self, engine, results):
+        return self.mln_objective(engine._relations, engine._rules, results)
+
+    def test_session(self):
+        relations, rules = self._build()
+        friends, smokes = relations
+
+        engine = srli.engine.mln.pysat.PySATMLN(relations, rules, persistent = True, incremental = True)
+        engine.solve()
+
+        # New evidence only adds clauses, so the session is kept.
+        session = engine._session
+        existing = set([tuple(row[0:2]) for row in friends.get_observed_data()])
+        new_rows = [[str(a), str(b), '1.0'] for a in range(5) for b in range(5) if ((a != b) and ((str(a), str(b)) not in existing))]
+        friends.insert_data(new_rows[0:3])
+        results = engine.solve()
+        self.assertIs(session, engine._session)
+
+        expected = srli.engine.mln.pysat.PySATMLN(relations, rules).solve()
+        self.assertEqual(len(smokes.get_unobserved_data()), len(results[smokes]))
+        self.assertAlmostEqual(self._objective(engine, expected), self._objective(engine, results))
+
+        # Changed evidence needs a new session.
+        row = friends.get_observed_data()[0]
+        friends.update_data([[row[0], row[1], '0.0']])
+        results = engine.solve()
+        self.assertIsNot(session, engine._session)
+
+        expected = srli.engine.mln.pysat.PySATMLN(relations, rules).solve()
+        self.assertAlmostEqual(self._objective(engine, expected), self._objective(engine, results))
+
+        engine.close()
+
+    def test_session_soft_units(self):
+        relations, rules = self._build()
+        friends, smokes = relations
+
+        # The prior puts a soft unit clause on every target, so evidence adds soft unit clauses on the same atoms.
+        smokes.set_negative_prior_weight(0.3)
+
+        engine = srli.engine.mln.pysat.PySATMLN(relations, rules, persistent = True, incremental = True)
+        engine.solve()
+        session = engine._session
+
+        # Links from the observed people (0, 3, ...) to targets fold into soft unit clauses on the targets.
+        existing = set([tuple(row[0:2]) for row in friends.get_observed_data()])
+        new_rows = [[str(a), str(b), '1.0'] for a in range(0, 15, 3) for b in range(15) if ((b % 3 != 0) and ((str(a), str(b)) not in existing))]
+
+        for i in range(0, 12, 3):
+            friends.insert_data(new_rows[i:(i + 3)])
+            results = engine.solve()
+            self.assertIs(session, engine._session)
+
+            expected = srli.engine.mln.pysat.PySATMLN(relations, rules).solve()
+            self.assertAlmostEqual(self._objective(engine, expected), self._objective(engine, results))
+
+        engine.close()
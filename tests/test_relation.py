@@ -0,0 +1,128 @@
+import os
+import random
+import tempfile
+
+import srli.relation
+import srli.rule
+import srli.util
+import tests.base
+
+class RelationTest(tests.base.BaseTest):
+    def _rows(self, count, seed = 4):
+        rng = random.Random(seed)
+        return [[str(rng.randint(0, 50)), str(rng.randint(0, 50)), "%0.2f" % (rng.random())] for i in range(count)]
+
+    def test_data_fingerprint_matches_recomputation(self):
+        rows = self._rows(500)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'data.txt')
+            with open(path, 'w') as file:
+                for row in rows[250:]:
+                    file.write("\t".join(row) + "\n")
+
+            relation = srli.relation.Relation('Link', arity = 2)
+            relation.add_observed_data(rows[0:100])
+            relation.add_observed_data(rows[100:250])
+            relation.add_data_file(path)
+
+        observed = srli.relation.Relation.DataType.OBSERVED
+        self.assertEqual(relation.data_fingerprint(observed), srli.relation.compute_data_fingerprint(relation.get_observed_data()))
+        self.assertEqual(relation.data_fingerprint(observed), srli.relation.compute_data_fingerprint(rows))
+
+        # Unaffected data types.
+        for data_type in [srli.relation.Relation.DataType.UNOBSERVED, srli.relation.Relation.DataType.TRUTH]:
+            self.assertEqual(relation.data_fingerprint(data_type), srli.relation.compute_data_fingerprint([]))
+
+        relation.clear_data()
+        self.assertEqual(relation.data_fingerprint(observed), srli.relation.compute_data_fingerprint([]))
+
+    def test_data_fingerprint_order(self):
+        rows = self._rows(200)
+
+        shuffled_rows = list(rows)
+        random.Random(5).shuffle(shuffled_rows)
+
+        relation = srli.relation.Relation('Link', arity = 2)
+        relation.add_observed_data(rows)
+
+        other = srli.relation.Relation('Link', arity = 2)
+        other.add_observed_data(shuffled_rows)
+
+        self.assertEqual(relation.fingerprint(), other.fingerprint())
+
+        # Duplicates count.
+        other.add_observed_data(rows[0:1])
+        self.assertNotEqual(relation.fingerprint(), other.fingerprint())
+
+        # Same data, different type.
+        other = srli.relation.Relation('Link', arity = 2)
+        other.add_truth_data(rows)
+        self.assertNotEqual(relation.fingerprint(), other.fingerprint())
+
+    def test_data_fingerprint_delimiters(self):
+        fingerprints = set()
+
+        for rows in [[['a\tb', '1']], [['a', 'b\t1']], [['a', "b', '1"]], [['a', 'b', '1']]]:
+            relation = srli.relation.Relation('Link', arity = len(rows[0]) - 1)
+            relation.add_observed_data(rows)
+            fingerprints.add(relation.data_fingerprint(srli.relation.Relation.DataType.OBSERVED))
+
+        self.assertEqual(4, len(fingerprints))
+
+    def test_model_fingerprint(self):
+        relation = srli.relation.Relation('Link', arity = 2)
+        relation.add_observed_data(self._rows(10))
+
+        rules = [srli.rule.Rule('Link(A, B) -> Link(B, A)', weight = 1.0)]
+        base = srli.util.model_fingerprint([relation], rules)
+
+        rules[0].set_weight(2.0)
+        self.assertNotEqual(base, srli.util.model_fingerprint([relation], rules))
+        rules[0].set_weight(1.0)
+        self.assertEqual(base, srli.util.model_fingerprint([relation], rules))
+
+        relation.set_negative_prior_weight(0.1)
+        self.assertNotEqual(base, srli.util.model_fingerprint([relation], rules))
+        relation.set_negative_prior_weight(None)
+
+        relation.add_unobserved_data([['1', '2']])
+        self.assertNotEqual(base, srli.util.model_fingerprint([relation], rules))
+
+    def test_deltas(self):
+        rows = [[str(i), str(i + 1), '1.0'] for i in range(10)]
+
+        relation = srli.relation.Relation('Link', arity = 2)
+        relation.add_observed_data(rows)
+
+        version = relation.version()
+        self.assertEqual([], relation.changes_since(version))
+
+        relation.insert_data([['10', '11', '0.5']])
+        relation.delete_data([['0', '1']])
+        relation.update_data([['5', '6', '0.0']])
+        relation.insert_data([['1', '2']], data_type = 'unobserved')
+
+        changes = relation.changes_since(version)
+        self.assertEqual([srli.relation.Relation.Operation.INSERT, srli.relation.Relation.Operation.DELETE,
+                srli.relation.Relation.Operation.UPDATE, srli.relation.Relation.Operation.INSERT], [change[1] for change in changes])
+        self.assertEqual(['0', '1', '1.0'], changes[1][3])
+        self.assertEqual((['5', '6', '1.0'], ['5', '6', '0.0']), changes[2][3:])
+        self.assertEqual(changes[2:], relation.changes_since(changes[1][0]))
+
+        expected = [row for row in rows if (row[0] not in ['0', '5'])] + [['5', '6', '0.0'], ['10', '11', '0.5']]
+        self.assertEqual(sorted(expected), sorted(relation.get_observed_data()))
+
+        observed = srli.relation.Relation.DataType.OBSERVED
+        self.assertEqual(relation.data_fingerprint(observed), srli.relation.compute_data_fingerprint(expected))
+
+        with self.assertRaises(ValueError):
+            relation.insert_data([['2', '3', '1.0']])
+
+        with self.assertRaises(ValueError):
+            relation.delete_data([['0', '1']])
+
+        # Untracked changes mean anything older needs a full rebuild.
+        relation.add_observed_data([['20', '21', '1.0']])
+        self.assertIsNone(relation.changes_since(version))
+        self.assertEqual([], relation.changes_since(relation.version()))
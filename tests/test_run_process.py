@@ -0,0 +1,44 @@
+import asyncio
+import math
+import multiprocessing
+import time
+
+import srli.engine.base
+import tests.base
+
+class RunProcessAsyncTest(tests.base.BaseTest):
+    def test_result(self):
+        self.assertEqual(3, asyncio.run(srli.engine.base.run_process_async(abs, -3)))
+
+    def test_error(self):
+        self.assertRaises(RuntimeError, asyncio.run, srli.engine.base.run_process_async(math.sqrt, -1))
+
+    def test_cancel(self):
+        existing = set(multiprocessing.active_children())
+
+        async def run():
+            task = asyncio.create_task(srli.engine.base.run_process_async(time.sleep, 60))
+
+            # Wait for the process to start.
+            children = []
+            for i in range(200):
+                children = [child for child in multiprocessing.active_children() if (child not in existing)]
+                if (len(children) > 0):
+                    break
+
+                await asyncio.sleep(0.05)
+
+            task.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            return children
+
+        start_time = time.perf_counter()
+        children = asyncio.run(run())
+
+        self.assertEqual(1, len(children))
+        self.assertFalse(children[0].is_alive())
+        self.assertIsNotNone(children[0].exitcode)
+        self.assertTrue(time.perf_counter() - start_time < 30)
@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+
+import srli.engine.logic.dws
+import srli.engine.mln.pysat
+import srli.instrumentation
+import srli.rule
+import tests.base
+
+class SolveWeightsTest(tests.base.BaseTest):
+    """
+    Solving for several weight vectors should only ground once,
+    and (for an exact engine) give the same answers as solving each weight vector from scratch.
+    """
+
+    WEIGHT_VECTORS = [
+        [0.5, 0.5, None],
+        [0.9, 0.1, None],
+        [0.1, 0.9, None],
+    ]
+
+    def _rules(self, weights):
+        return [
+            srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = weights[0]),
+            srli.rule.Rule('Friends(A, B) & !Smokes(A) -> !Smokes(B)', weight = weights[1]),
+            srli.rule.Rule('Smokes(A) & Smokes(B) & (A != B) -> Friends(A, B)', weight = weights[2]),
+        ]
+
+    def test_solve_weights(self):
+        relations = self.build_social_relations()
+        smokes = relations[1]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'instrumentation.jsonl')
+            instrumentation = srli.instrumentation.Instrumentation(path = path)
+
+            rules = self._rules(SolveWeightsTest.WEIGHT_VECTORS[0])
+            engine = srli.engine.mln.pysat.PySATMLN(relations, rules, instrumentation = instrumentation)
+            all_results = engine.solve_weights(SolveWeightsTest.WEIGHT_VECTORS)
+            instrumentation.close()
+
+            with open(path, 'r') as file:
+                records = [json.loads(line) for line in file]
+
+        self.assertEqual(1, len([record for record in records if (record.get('phase') == 'ground')]))
+        self.assertEqual(SolveWeightsTest.WEIGHT_VECTORS[0], [rule.weight() for rule in rules])
+        self.assertEqual(len(SolveWeightsTest.WEIGHT_VECTORS), len(all_results))
+
+        for (weights, results) in zip(SolveWeightsTest.WEIGHT_VECTORS, all_results):
+            expected = srli.engine.mln.pysat.PySATMLN(relations, self._rules(weights), normalize_weights = False).solve()
+
+            self.assertEqual(len(smokes.get_unobserved_data()), len(results[smokes]))
+            self.assertAlmostEqual(self.mln_objective(relations, self._rules(weights), expected), self.mln_objective(relations, self._rules(weights), results))
+
+    def test_solve_weights_dws(self):
+        relations = self.build_social_relations()
+        smokes = relations[1]
+
+        rules = self._rules(SolveWeightsTest.WEIGHT_VECTORS[0])
+        engine = srli.engine.logic.dws.DiscreteWeightedSolver(relations, rules, seed = 4)
+        all_results = engine.solve_weights(SolveWeightsTest.WEIGHT_VECTORS, warm_start = True)
+
+        self.assertEqual(len(SolveWeightsTest.WEIGHT_VECTORS), len(all_results))
+        for results in all_results:
+            self.assertEqual(len(smokes.get_unobserved_data()), len(results[smokes]))
+
+        # Only the weights changed, so no atoms are in the neighborhood of changes (for warm starts).
+        atoms, ground_rules, atom_uses, sum_constraints = engine._prep()
+        engine._set_rule_weights(SolveWeightsTest.WEIGHT_VECTORS[1])
+        engine._reweight((atoms, ground_rules, atom_uses, sum_constraints))
+        self.assertEqual(set(), engine._diff_ground_rules(engine._ground_rule_keys(atoms, ground_rules)))
+
+    def test_bad_weights(self):
+        engine = srli.engine.mln.pysat.PySATMLN(self.build_social_relations(), self._rules(SolveWeightsTest.WEIGHT_VECTORS[0]))
+
+        # Wrong size.
+        self.assertRaises(ValueError, engine.solve_weights, [[0.5, 0.5]])
+
+        # Hard rules must stay hard.
+        self.assertRaises(ValueError, engine.solve_weights, [[0.5, 0.5, 0.5]])
+        self.assertRaises(ValueError, engine.solve_weights, [[0.5, None, None]])
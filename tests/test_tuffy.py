@@ -0,0 +1,426 @@
+import asyncio
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest.mock
+
+import srli.engine.tuffy.docker
+import srli.relation
+import srli.rule
+import tests.base
+
+class TuffyFilesTest(tests.base.BaseTest):
+    """
+    Writing the Tuffy input files (does not need Docker).
+    """
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._cache_dir = os.path.join(self._temp_dir.name, 'cache')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _engine(self, size, **kwargs):
+        smokes = srli.relation.Relation('Smokes', arity = 1, variable_types = ['Person'])
+        smokes.add_observed_data([[str(person), '1.0'] for person in range(0, size, 2)])
+        smokes.add_unobserved_data([[str(person)] for person in range(1, size, 2)])
+
+        rules = [srli.rule.Rule('Smokes(A) -> Smokes(B)', weight = 1.0)]
+
+        return srli.engine.tuffy.docker.Tuffy([smokes], rules, cache_dir = self._cache_dir, **kwargs)
+
+    def _cached_files(self):
+        return list(sorted(os.listdir(self._cache_dir)))
+
+    def test_cached_files(self):
+        engine = self._engine(10)
+
+        temp_dir, _ = engine._write_files()
+        shutil.rmtree(temp_dir)
+
+        self.assertEqual(2, len(self._cached_files()))
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(self._cache_dir).st_mode))
+
+        # The same data reuses the same files.
+        temp_dir, _ = engine._write_files()
+        with open(os.path.join(temp_dir, srli.engine.tuffy.docker.EVIDENCE_FILENAME), 'r') as file:
+            self.assertEqual(5, len(file.readlines()))
+        shutil.rmtree(temp_dir)
+
+        self.assertEqual(2, len(self._cached_files()))
+
+    def test_eviction(self):
+        engine = self._engine(1000)
+
+        temp_dir, _ = engine._write_files()
+        shutil.rmtree(temp_dir)
+
+        first_files = self._cached_files()
+        size = sum([os.path.getsize(os.path.join(self._cache_dir, filename)) for filename in first_files])
+
+        # Room for about one set of files.
+        engine = self._engine(1000, cache_max_size_mb = (1.5 * size) / (1024 * 1024))
+        engine._relations[0].add_observed_data([['2000', '1.0']])
+
+        temp_dir, _ = engine._write_files()
+        shutil.rmtree(temp_dir)
+
+        # The new evidence file replaced the old one (the query file did not change).
+        files = self._cached_files()
+        self.assertEqual(2, len(files))
+        self.assertEqual(1, len(set(files) & set(first_files)))
+
+class _FakeImages(object):
+    """
+    Just enough of docker.models.images.ImageCollection for _get_image().
+    """
+
+    def __init__(self):
+        self.built = []
+
+    def get(self, tag):
+        import docker.errors
+
+        if (tag not in self.built):
+            raise docker.errors.ImageNotFound(tag)
+
+    def build(self, path, tag, **kwargs):
+        # Slow enough that concurrent callers pile up behind the lock.
+        time.sleep(0.1)
+        self.built.append(tag)
+
+class TuffyImageTest(tests.base.BaseTest):
+    """
+    Content hashed image reuse (does not need Docker).
+    """
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._lib_dir = os.path.join(self._temp_dir.name, 'lib')
+        shutil.copytree(srli.engine.tuffy.docker.LIB_DIR, self._lib_dir, ignore = shutil.ignore_patterns('__pycache__'))
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_fingerprint(self):
+        with unittest.mock.patch.object(srli.engine.tuffy.docker, 'LIB_DIR', self._lib_dir):
+            fingerprint = srli.engine.tuffy.docker._fingerprint_lib_dir()
+            self.assertEqual(fingerprint, srli.engine.tuffy.docker._fingerprint_lib_dir())
+
+            with open(os.path.join(self._lib_dir, 'tuffy.conf'), 'a') as file:
+                file.write("\n")
+
+            self.assertNotEqual(fingerprint, srli.engine.tuffy.docker._fingerprint_lib_dir())
+
+    def test_single_build(self):
+        client = unittest.mock.Mock()
+        client.images = _FakeImages()
+
+        tags = []
+
+        def get_image():
+            tags.append(srli.engine.tuffy.docker._get_image())
+
+        with unittest.mock.patch.object(srli.engine.tuffy.docker, 'LIB_DIR', self._lib_dir), \
+                unittest.mock.patch.object(srli.engine.tuffy.docker, '_image_tag', None), \
+                unittest.mock.patch.object(srli.engine.tuffy.docker, '_get_client', return_value = client):
+            threads = [threading.Thread(target = get_image) for i in range(8)]
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+            expected_tag = "%s:%s" % (srli.engine.tuffy.docker.DOCKER_TAG, srli.engine.tuffy.docker._fingerprint_lib_dir())
+
+        self.assertEqual([expected_tag], client.images.built)
+        self.assertEqual([expected_tag] * len(threads), tags)
+
+class _FakeContainer(object):
+    def __init__(self, name, io_dir, ready):
+        self.name = name
+        self.io_dir = io_dir
+        self.status = 'running'
+        self.stopped = threading.Event()
+
+        self._ready = ready
+
+    def logs(self, stream = True):
+        if (self._ready):
+            yield (srli.engine.tuffy.docker.WORKER_READY_MESSAGE + "\n").encode()
+
+        # The log stream ends with the container.
+        self.stopped.wait()
+
+    def stop(self):
+        self.status = 'exited'
+        self.stopped.set()
+
+class _FakeDocker(object):
+    """
+    Just enough of the Docker client for Tuffy workers.
+    Each exec writes an empty output file, after waiting for |exec_gate| (if set) or for the container to stop.
+    """
+
+    def __init__(self, ready = True, exit_code = 0):
+        self.ready = ready
+        self.exit_code = exit_code
+        self.exec_gate = None
+
+        # [container, ...]
+        self.started = []
+        # [run dir name, ...]
+        self.execs = []
+
+        # {exec_id: (container, run dir), ...}
+        self._execs = {}
+
+        self.api = self
+        self.containers = self
+
+    # client.containers
+
+    def run(self, image, command = None, volumes = None, name = None, **kwargs):
+        container = _FakeContainer(name, list(volumes.keys())[0], self.ready)
+        self.started.append(container)
+        return container
+
+    def get(self, name):
+        import docker.errors
+
+        # Containers are run with remove = True.
+        for container in self.started:
+            if ((container.name == name) and (container.status == 'running')):
+                return container
+
+        raise docker.errors.NotFound(name)
+
+    # client.api
+
+    def exec_create(self, container_id, command):
+        exec_id = len(self._execs)
+        self._execs[exec_id] = (self.get(container_id), os.path.basename(command[2]))
+        return exec_id
+
+    def exec_start(self, exec_id, stream = True):
+        container, run_dir = self._execs[exec_id]
+        self.execs.append(run_dir)
+
+        if (self.exec_gate is not None):
+            while ((not self.exec_gate.wait(0.01)) and (not container.stopped.is_set())):
+                pass
+
+        if (container.status == 'running'):
+            open(os.path.join(container.io_dir, run_dir, srli.engine.tuffy.docker.OUTPUT_FILENAME), 'w').close()
+
+        yield b"Tuffy run.\n"
+
+    def exec_inspect(self, exec_id):
+        container, run_dir = self._execs[exec_id]
+        return {'ExitCode': self.exit_code if (container.status == 'running') else 137}
+
+class TuffyWorkerTest(tests.base.BaseTest):
+    """
+    Persistent Tuffy workers, with a fake Docker client.
+    """
+
+    def setUp(self):
+        self._docker = _FakeDocker()
+
+        # Cleanups run last in first out, so workers are closed (see _worker()) while Docker is still patched.
+        for name, value in [('_get_client', self._docker), ('_get_image', 'srli.tuffy:test')]:
+            patch = unittest.mock.patch.object(srli.engine.tuffy.docker, name, return_value = value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _engine(self, persistent = True):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+
+        smokes = srli.relation.Relation('Smokes', arity = 1, variable_types = ['Person'])
+        smokes.add_observed_data([['0', '1.0']])
+        smokes.add_unobserved_data([['1']])
+
+        rules = [srli.rule.Rule('Smokes(A) -> Smokes(B)', weight = 1.0)]
+
+        engine = srli.engine.tuffy.docker.Tuffy([smokes], rules, persistent = persistent, cache_dir = cache_dir.name)
+        self.addCleanup(engine.close)
+
+        return engine
+
+    async def _wait_for_async(self, condition, timeout = 10):
+        end_time = time.time() + timeout
+        while ((not condition()) and (time.time() < end_time)):
+            await asyncio.sleep(0.01)
+
+        self.assertTrue(condition())
+
+    def _worker(self, idle_timeout = None, start_timeout = 10):
+        worker = srli.engine.tuffy.docker._Worker(idle_timeout, start_timeout, True)
+        self.addCleanup(worker.close)
+        return worker
+
+    def _wait_for(self, condition, timeout = 10):
+        end_time = time.time() + timeout
+        while ((not condition()) and (time.time() < end_time)):
+            time.sleep(0.01)
+
+        self.assertTrue(condition())
+
+    def test_io_dir(self):
+        worker = self._worker()
+
+        # Nothing is made until there is a run.
+        self.assertIsNone(worker._io_dir)
+        self.assertIn(worker, srli.engine.tuffy.docker._workers)
+
+        run_dir = worker.make_run_dir()
+        self.assertEqual(worker._io_dir, os.path.dirname(run_dir))
+
+        io_dir = worker._io_dir
+        worker.close()
+
+        self.assertFalse(os.path.exists(io_dir))
+        self.assertNotIn(worker, srli.engine.tuffy.docker._workers)
+        self.assertRaises(RuntimeError, worker.make_run_dir)
+
+    def test_reuse(self):
+        worker = self._worker()
+
+        for i in range(3):
+            worker.run(worker.make_run_dir(), [])
+
+        self.assertEqual(1, len(self._docker.started))
+        self.assertEqual(3, len(self._docker.execs))
+
+    def test_idle_timeout(self):
+        worker = self._worker(idle_timeout = 0.05)
+
+        worker.run(worker.make_run_dir(), [])
+        container = self._docker.started[0]
+
+        self._wait_for(lambda: (container.status != 'running'))
+        self._wait_for(lambda: (worker._container_id is None))
+
+        # The next run gets a new container.
+        worker.run(worker.make_run_dir(), [])
+        self.assertEqual(2, len(self._docker.started))
+
+    def test_start_timeout(self):
+        self._docker.ready = False
+        worker = self._worker(start_timeout = 0.1)
+
+        with self.assertRaisesRegex(RuntimeError, 'did not become ready'):
+            worker.run(worker.make_run_dir(), [])
+
+        self.assertEqual('exited', self._docker.started[0].status)
+        self.assertIsNone(worker._container_id)
+        self.assertEqual(0, len(self._docker.execs))
+
+    def test_nonzero_exit(self):
+        self._docker.exit_code = 1
+        worker = self._worker(idle_timeout = 60)
+
+        with self.assertRaisesRegex(RuntimeError, 'exited with code 1'):
+            worker.run(worker.make_run_dir(), [])
+
+        # The worker itself is fine.
+        self.assertEqual('running', self._docker.started[0].status)
+        self.assertIsNotNone(worker._idle_timer)
+
+        self._docker.exit_code = 0
+        worker.run(worker.make_run_dir(), [])
+        self.assertEqual(1, len(self._docker.started))
+
+    def test_restart(self):
+        worker = self._worker()
+
+        # Stopped (outside of the worker) between runs.
+        worker.run(worker.make_run_dir(), [])
+        self._docker.started[-1].stop()
+
+        worker.run(worker.make_run_dir(), [])
+        self.assertEqual(2, len(self._docker.started))
+
+        # Stopped during a run.
+        self._docker.exec_gate = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                worker.run(worker.make_run_dir(), [])
+            except RuntimeError as ex:
+                errors.append(ex)
+
+        thread = threading.Thread(target = run)
+        thread.start()
+
+        self._wait_for(lambda: (len(self._docker.execs) == 3))
+        self._docker.started[-1].stop()
+        thread.join()
+
+        self.assertEqual(1, len(errors))
+        self.assertIsNone(worker._container_id)
+
+        self._docker.exec_gate = None
+        worker.run(worker.make_run_dir(), [])
+        self.assertEqual(3, len(self._docker.started))
+
+    def test_cancel_waiting(self):
+        # Cancelling a call that is waiting for the worker should not affect the call that is running.
+        engine = self._engine()
+        self._docker.exec_gate = threading.Event()
+
+        async def run():
+            running = asyncio.create_task(engine.solve_async())
+            await self._wait_for_async(lambda: (len(self._docker.execs) == 1))
+
+            waiting = asyncio.create_task(engine.solve_async())
+            await self._wait_for_async(lambda: (len(os.listdir(engine._worker._io_dir)) == 2))
+
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+
+            self.assertFalse(running.done())
+            self.assertEqual('running', self._docker.started[0].status)
+
+            self._docker.exec_gate.set()
+            return await running
+
+        results = asyncio.run(run())
+
+        self.assertEqual(1, len(list(results.values())[0]))
+        self.assertEqual(1, len(self._docker.started))
+        self.assertEqual(1, len(self._docker.execs))
+
+        # The worker is still usable.
+        engine.solve()
+        self.assertEqual(1, len(self._docker.started))
+        self.assertEqual(2, len(self._docker.execs))
+
+    def test_cancel_running(self):
+        for persistent in [True, False]:
+            self._docker = _FakeDocker()
+            self._docker.exec_gate = threading.Event()
+
+            engine = self._engine(persistent = persistent)
+
+            async def run():
+                task = asyncio.create_task(engine.learn_async())
+                await self._wait_for_async(lambda: (len(self._docker.started) == 1))
+                if (persistent):
+                    await self._wait_for_async(lambda: (len(self._docker.execs) == 1))
+
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            with unittest.mock.patch.object(srli.engine.tuffy.docker, '_get_client', return_value = self._docker):
+                asyncio.run(run())
+
+            self.assertEqual('exited', self._docker.started[0].status)
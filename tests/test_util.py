@@ -0,0 +1,115 @@
+import random
+
+import srli.relation
+import srli.util
+import tests.base
+
+class EvalTest(tests.base.BaseTest):
+    """
+    The (vectorized) evaluation helpers should match simple dict-based loops on random data.
+    """
+
+    TRIALS = 50
+
+    def _random_data(self, rng, arity, num_values):
+        """
+        Random truth and results with: missing truth atoms, duplicate keys, string and int arguments, and tied values.
+        Returns: (relation, results)
+        """
+
+        rows = [[rng.randint(0, num_values - 1) for i in range(arity)] for j in range(rng.randint(0, 60))]
+
+        # Some arguments are ints in the truth and strings in the results (or the other way around).
+        def args(row):
+            return [(str(arg) if (rng.random() < 0.5) else arg) for arg in row]
+
+        # Values come from a small set, so there are plenty of ties.
+        def value():
+            return rng.choice([0.0, 0.25, 0.5, 1.0])
+
+        relation = srli.relation.Relation('Labels', arity = arity)
+        relation.add_truth_data([args(row) + [value()] for row in rows if (rng.random() < 0.8)])
+
+        # Some truth atoms are missing from the results.
+        results = [args(row) + [value()] for row in rows if (rng.random() < 0.9)]
+        rng.shuffle(results)
+
+        return relation, results
+
+    def _reference_values(self, relation, results):
+        # {(argument, ...): value, ...}
+        predicted_values = {}
+        for row in results:
+            predicted_values[tuple(map(str, row[0:-1]))] = float(row[-1])
+
+        expected = []
+        predicted = []
+
+        for row in relation.get_truth_data():
+            key = tuple(map(str, row[0:-1]))
+            if (key not in predicted_values):
+                continue
+
+            expected.append(float(row[-1]))
+            predicted.append(predicted_values[key])
+
+        return expected, predicted
+
+    def _reference_categories(self, relation, results, label_indexes):
+        label_indexes = [index if (index >= 0) else (relation.arity() + index ) for index in label_indexes]
+        entity_indexes = list(sorted(set(range(relation.arity())) - set(label_indexes)))
+
+        # {(entity): [(best label), best value], ...}
+        expected_values = {}
+        predicted_values = {}
+
+        for (source, dest) in [(relation.get_truth_data(), expected_values), (results, predicted_values)]:
+            for row in source:
+                value = float(row[-1])
+                entity = tuple([str(row[index]) for index in entity_indexes])
+                label = tuple([str(row[index]) for index in label_indexes])
+
+                if ((entity not in dest) or (value > dest[entity][1])):
+                    dest[entity] = [label, value]
+
+        entities = list(sorted(set(expected_values.keys()) & set(predicted_values.keys())))
+
+        expected = [expected_values[entity][0] for entity in entities]
+        predicted = [predicted_values[entity][0] for entity in entities]
+
+        return expected, predicted, entities
+
+    def test_eval_values(self):
+        rng = random.Random(4)
+
+        for trial in range(EvalTest.TRIALS):
+            relation, results = self._random_data(rng, rng.randint(1, 3), rng.randint(1, 6))
+
+            # More truth than predictions is an error.
+            if (len(relation.get_truth_data()) > len(results)):
+                continue
+
+            for discretize in [False, True]:
+                expected, predicted = srli.util.get_eval_values(relation, results, discretize = discretize)
+                reference_expected, reference_predicted = self._reference_values(relation, results)
+
+                if (discretize):
+                    reference_expected = [int(value >= srli.util.DEFAULT_TRUTH_THRESHOLD) for value in reference_expected]
+                    reference_predicted = [int(value >= srli.util.DEFAULT_TRUTH_THRESHOLD) for value in reference_predicted]
+
+                self.assertEqual(reference_expected, list(expected))
+                self.assertEqual(reference_predicted, list(predicted))
+
+    def test_eval_categories(self):
+        rng = random.Random(4)
+
+        for trial in range(EvalTest.TRIALS):
+            arity = rng.randint(2, 4)
+            relation, results = self._random_data(rng, arity, rng.randint(1, 4))
+
+            for label_indexes in [[-1], [0], [0, -1]]:
+                if (len(label_indexes) >= arity):
+                    continue
+
+                expected = srli.util.get_eval_categories(relation, results, label_indexes = label_indexes)
+                self.assertEqual(self._reference_categories(relation, results, label_indexes), expected)
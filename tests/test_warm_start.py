@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+
+import srli.engine.logic.dws
+import srli.engine.mln.native
+import srli.instrumentation
+import srli.rule
+import tests.base
+
+class WarmStartTest(tests.base.BaseTest):
+    """
+    A warm started solve should never end up worse (on the common MLN objective) than the values it started from.
+    """
+
+    ENGINE_TYPES = [srli.engine.mln.native.NativeMLN, srli.engine.logic.dws.DiscreteWeightedSolver]
+
+    def _build(self):
+        rules = [
+            srli.rule.Rule('Friends(A, B) & Smokes(A) -> Smokes(B)', weight = 0.5),
+            srli.rule.Rule('Friends(A, B) & !Smokes(A) -> !Smokes(B)', weight = 0.5),
+        ]
+
+        return self.build_social_relations(), rules
+
+    def _objective(self, engine, results):
+        return self.mln_objective(engine._relations, engine._rules, results)
+
+    def test_warm_start_previous(self):
+        for engine_type in WarmStartTest.ENGINE_TYPES:
+            relations, rules = self._build()
+            friends, smokes = relations
+
+            engine = engine_type(relations, rules, seed = 4)
+            results = engine.solve()
+
+            # Without any changes, nothing needs to move.
+            warm_results = engine.solve(warm_start = True)
+            self.assertTrue(self._objective(engine, warm_results) <= self._objective(engine, results) + self.EPSILON)
+
+            # A small change in the evidence.
+            row = friends.get_observed_data()[0]
+            friends.update_data([[row[0], row[1], '0.0']])
+
+            # The old values on the new evidence.
+            previous_objective = self._objective(engine, warm_results)
+            warm_results = engine.solve(warm_start = True)
+
+            self.assertEqual(len(smokes.get_unobserved_data()), len(warm_results[smokes]))
+            self.assertTrue(self._objective(engine, warm_results) <= previous_objective + self.EPSILON)
+
+    def test_warm_start_restarts(self):
+        # The search effort for each engine: flips for NativeMLN and sweeps (iterations) for DiscreteWeightedSolver.
+        effort_counters = {
+            srli.engine.mln.native.NativeMLN: 'flips',
+            srli.engine.logic.dws.DiscreteWeightedSolver: 'iterations',
+        }
+
+        for engine_type in WarmStartTest.ENGINE_TYPES:
+            relations, rules = self._build()
+            friends, smokes = relations
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                path = os.path.join(temp_dir, 'instrumentation.jsonl')
+                instrumentation = srli.instrumentation.Instrumentation(path = path)
+
+                engine = engine_type(relations, rules, seed = 4, instrumentation = instrumentation)
+
+                # Nothing to start from yet, so this is a cold start.
+                engine.solve(warm_start = True)
+                instrumentation.close()
+
+                row = friends.get_observed_data()[0]
+                friends.update_data([[row[0], row[1], '0.0']])
+
+                engine.solve(warm_start = True)
+                instrumentation.close()
+
+                with open(path, 'r') as file:
+                    cold_counters, warm_counters = [record['counters'] for record in map(json.loads, file) if (record['type'] == 'counters')]
+
+            # Restarts only perturb the atoms around the changed evidence.
+            self.assertNotIn('warm_start_neighborhood', cold_counters)
+            self.assertTrue(0 < warm_counters['warm_start_neighborhood'] < len(smokes.get_unobserved_data()) / 2)
+
+            counter = effort_counters[engine_type]
+            self.assertTrue(warm_counters[counter] < cold_counters[counter], "%s: %d vs %d" % (counter, warm_counters[counter], cold_counters[counter]))
+
+    def test_cold_start_keys(self):
+        for engine_type in WarmStartTest.ENGINE_TYPES:
+            relations, rules = self._build()
+
+            # Solves that are never warm started do not keep ground rule keys.
+            engine = engine_type(relations, rules, seed = 4)
+            engine.solve()
+            engine.solve()
+            self.assertIsNone(engine._previous_ground_rule_keys)
+
+            engine.solve(warm_start = True)
+            self.assertIsNotNone(engine._previous_ground_rule_keys)
+
+    def test_warm_start_results(self):
+        relations, rules = self._build()
+        smokes = relations[1]
+
+        # Start with everyone smoking.
+        start_results = {smokes : [list(row) + [1.0] for row in smokes.get_unobserved_data()]}
+
+        for engine_type in WarmStartTest.ENGINE_TYPES:
+            engine = engine_type(relations, rules, seed = 4)
+            results = engine.solve(warm_start = start_results)
+
+            self.assertEqual(len(smokes.get_unobserved_data()), len(results[smokes]))
+            self.assertTrue(self._objective(engine, results) <= self._objective(engine, start_results) + self.EPSILON)